@@ -4,14 +4,48 @@ for teaching about counters in ladder logic programming in PLCs. It builds upon
 Amazon's Color Expert sample Python skill.
 """
 
+import os
 import random
 import difflib
 import decimal
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
+import dynamodb_access
+from user_store import get_user_store, new_user_item, activity_day, USER_TABLE_NAME
+from leveling import next_question_level
+from mastery import PRIOR_MASTERY, get_mastery, update_mastery, to_stored, get_weakest, \
+    update_weakest, weakest_attributes
+from scheduler import next_review, next_attribute, postpone
+from question_sampler import RecentQuestions, RECENT_QUESTIONS_KEY, question_id, \
+    sample_index, carry_over
+from content_catalog import get_content, CONTENT_TABLE_NAMES
+from phrases import get_phrases
+import locales
+from session_state import QUESTION_FIELDS, SessionStateError
+import session_state
+from idempotency import get_deduplicator, REQUEST_LOG_TABLE_NAME
+from deadline import start_request, finish_request, defer, run_deferred
+import structured_log
 
 # --------------- Helpers that build all of the responses ----------------------
 
+# A short break in the speech.
+PAUSE = '"<break time="0.75s"/>"'
+
+def say(key, **fields):
+    """ Returns a phrase of the request's locale with its fields filled in. """
+
+    return get_phrases()[key].format(pause=PAUSE, **fields)
+
+def title(key):
+    """ Returns a card title in the request's locale. """
+
+    return get_phrases()['card_titles'][key]
+
+def praise(key='positive_feedback'):
+    """ Returns a random word of praise, said brightly. """
+
+    return '"<prosody rate="90%" pitch="high">"' + random.choice(get_phrases()[key]) + \
+        "</prosody>"
+
 def build_speechlet_response(title, speech_output, card_output, reprompt_text, should_end_session):
     """ Helper that builds the speechlet response. """
 
@@ -48,215 +82,56 @@ def build_response(session_attributes, speechlet_response):
 def add_user(user_id):
     """ Adds a new user to the user database. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.put_item(
-        Item={
-            'UserID': user_id,
-            'CounterCorrect': {
-                'bit that is set when the counter limit is reached': decimal.Decimal(0),
-                'can be used to': decimal.Decimal(0),
-                'counts': decimal.Decimal(0),
-                'DN bit is set': decimal.Decimal(0),
-                'DN bit remains set until': decimal.Decimal(0),
-                'enable bit is not set if': decimal.Decimal(0),
-                'enable bit is set when': decimal.Decimal(0),
-                'enable bit remains set until': decimal.Decimal(0),
-                'if the rung goes False': decimal.Decimal(0),
-                'overflow bit is set when': decimal.Decimal(0),
-                'overflow bit remains set until': decimal.Decimal(0),
-                'stands for': decimal.Decimal(0),
-                'to reset AC': decimal.Decimal(0),
-                'underflow bit is set when': decimal.Decimal(0),
-                'underflow bit remains set until': decimal.Decimal(0),
-                'when AC is equal to or greater than PR': decimal.Decimal(0),
-                'when the rung goes from True to False and AC is greater than PR': decimal.Decimal(0),
-                'when the rung goes True': decimal.Decimal(0)
-            },
-            'CounterIncorrect': {
-                'bit that is set when the counter limit is reached': decimal.Decimal(0),
-                'can be used to': decimal.Decimal(0),
-                'counts': decimal.Decimal(0),
-                'DN bit is set': decimal.Decimal(0),
-                'DN bit remains set until': decimal.Decimal(0),
-                'enable bit is not set if': decimal.Decimal(0),
-                'enable bit is set when': decimal.Decimal(0),
-                'enable bit remains set until': decimal.Decimal(0),
-                'if the rung goes False': decimal.Decimal(0),
-                'overflow bit is set when': decimal.Decimal(0),
-                'overflow bit remains set until': decimal.Decimal(0),
-                'stands for': decimal.Decimal(0),
-                'to reset AC': decimal.Decimal(0),
-                'underflow bit is set when': decimal.Decimal(0),
-                'underflow bit remains set until': decimal.Decimal(0),
-                'when AC is equal to or greater than PR': decimal.Decimal(0),
-                'when the rung goes from True to False and AC is greater than PR': decimal.Decimal(0),
-                'when the rung goes True': decimal.Decimal(0)
-            },
-            'PreviousTotalCorrect': decimal.Decimal(0),
-            'PreviousTotalIncorrect': decimal.Decimal(0),
-            'QuestionLevel': decimal.Decimal(1),
-            'TutoringStatus': {
-                'OrderLevel': decimal.Decimal(1),
-                'StatementLevel': decimal.Decimal(1)
-            }
-        }
-    )
+    get_user_store().create_user(user_id)
 
 def reset_user(user_id):
     """ Resets a user to new user state. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    user_db = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-
-    # Resets CounterCorrect column
-    for i in user_db['Items']:
-        counter_correct = (i['CounterCorrect'])
-    for key in counter_correct:
-        response = user_data_dynamodb.update_item(
-            Key={
-                'UserID': user_id,
-            },
-            UpdateExpression="set #ctrcor.#atr = :atrreset",
-            ExpressionAttributeValues={
-                ':atrreset': decimal.Decimal(0)
-            },
-            ExpressionAttributeNames={
-                '#ctrcor': "CounterCorrect",
-                '#atr': key,
-            },
-            ReturnValues="UPDATED_NEW"
-        )
+    get_user_store().reset_user(user_id)
 
-    # Resets CounterIncorrect column
-    for i in user_db['Items']:
-        counter_incorrect = (i['CounterIncorrect'])
-    for key in counter_incorrect:
-        response = user_data_dynamodb.update_item(
-            Key={
-                'UserID': user_id,
-            },
-            UpdateExpression="set #ctrincor.#atr = :atrreset",
-            ExpressionAttributeValues={
-                ':atrreset': decimal.Decimal(0)
-            },
-            ExpressionAttributeNames={
-                '#ctrincor': "CounterIncorrect",
-                '#atr': key,
-            },
-            ReturnValues="UPDATED_NEW"
-        )
+def user_exists(user_id):
+    return get_user_store().user_exists(user_id)
 
-    # Resets PreviousTotalCorrect, PreviousTotalIncorrect, and QuestionLevel columns
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set PreviousTotalCorrect = :val1, PreviousTotalIncorrect = :val1,"\
-            + "QuestionLevel = :val2",
-        ExpressionAttributeValues={
-            ':val1': decimal.Decimal(0),
-            ':val2': decimal.Decimal(1)
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+def mark_active(user_id):
+    """ Stamps today as the day the user was last active, once the response
+    is ready. Answers stamp it as part of their own write; launches, tutoring
+    and reviews write nothing else that would, and inactive users are
+    deleted by when they were last active. """
 
-    # Resets TutoringStatus column
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set TutoringStatus.OrderLevel = :val,"\
-            + "TutoringStatus.StatementLevel = :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    defer(get_user_store().update, user_id, {('LastActive',): activity_day()})
 
-def user_exists(user_id):
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    user_id_query = user_data_dynamodb.query(
-        KeyConditionExpression=Key('UserID').eq(user_id)
+def update_user_level(user_id, user=None):
+    """ Keeps track of and updates the user's question difficulty level as they
+    keep answering questions. The user's item is read unless it is passed in. """
+
+    user_store = get_user_store()
+    if user is None:
+        user = user_store.get_user(user_id)
+
+    # Get the current totals. These values differ from the previous total
+    # values because these values take into account the question the user
+    # answered just before reaching this stage and asking for a new question.
+    current_total_correct = sum(user['CounterCorrect'].values())
+    current_total_incorrect = sum(user['CounterIncorrect'].values())
+
+    new_level = next_question_level(
+        user['QuestionLevel'],
+        current_total_correct,
+        current_total_incorrect,
+        user['PreviousTotalCorrect'],
+        user['PreviousTotalIncorrect']
     )
-    if len(user_id_query['Items']) == 0:
-        return False
-    else:
-        return True
 
-def update_user_level(user_id):
-    """ Keeps track of and updates the user's question difficulty level as they
-    keep answering questions. """
-
-    # Store previous totals
-    previous_total_correct = get_previous_total_correct(user_id)
-    previous_total_incorrect = get_previous_total_incorrect(user_id)
-
-    # Conditionals to update level, <= 4 because 4 is the max difficulty level
-    if get_question_level(user_id) <= 4:
-        # Get the current totals. These values differ from the previous total
-        # values stored above because these values take into account the question the
-        # user answered just before reaching this stage and asking for a new question.
-        current_total_correct = get_total_correct(user_id)
-        current_total_incorrect = get_total_incorrect(user_id)
-
-        # Conditionals to deal with initial conditions that could happen when
-        # the user first starts answering questions.
-        if current_total_correct == 0 and current_total_incorrect == 0:
-            increment_question_level(user_id)
-            decrement_question_level(user_id)
-        elif current_total_correct != 0 and current_total_incorrect == 0:
-            if current_total_correct % 4 == 0:
-                increment_question_level(user_id)
-            else:
-                increment_question_level(user_id)
-                decrement_question_level(user_id)
-        elif current_total_correct == 0 and current_total_incorrect != 0:
-            if current_total_incorrect % 3 == 0:
-                if get_question_level(user_id) == 1:
-                    increment_question_level(user_id)
-                    decrement_question_level(user_id)
-                else:
-                    decrement_question_level(user_id)
-            else:
-                increment_question_level(user_id)
-                decrement_question_level(user_id)
+    # Store the new level and update the previous totals to current totals
+    # in a single write. The question is generated from new_level directly,
+    # so the write can wait until the response is ready.
+    defer(user_store.update, user_id, {
+        ('QuestionLevel',): new_level,
+        ('PreviousTotalCorrect',): current_total_correct,
+        ('PreviousTotalIncorrect',): current_total_incorrect
+    })
 
-        # The following conditionals deal with conditions that can happen after a user
-        # has questions both right and wrong.
-        else:
-            if (previous_total_correct == current_total_correct
-                    and current_total_incorrect % 3 != 0)\
-                or (previous_total_incorrect == current_total_incorrect
-                    and current_total_correct % 4 != 0):
-                increment_question_level(user_id)
-                decrement_question_level(user_id)
-            elif current_total_correct % 4 == 0 and current_total_incorrect % 3 == 0:
-                decrement_question_level(user_id)
-            elif current_total_correct % 4 == 0 and current_total_incorrect % 3 != 0:
-                increment_question_level(user_id)
-            elif current_total_correct % 4 != 0 and current_total_incorrect % 3 == 0:
-                decrement_question_level(user_id)
-            else:
-                increment_question_level(user_id)
-                decrement_question_level(user_id)
-
-    # Keeps user level limited to 4
-    if get_question_level(user_id) > 4:
-        while (get_question_level(user_id) > 4):
-            decrement_question_level(user_id)
-    if get_question_level(user_id) < 1:
-        while (get_question_level(user_id) < 1):
-            increment_question_level(user_id)     
-    # Update the previous totals to current totals
-    update_previous_total_correct(user_id)
-    update_previous_total_incorrect(user_id)
-
-    new_level = get_question_level(user_id)
-    return new_level
+    return decimal.Decimal(new_level)
 
 # --------------- Functions used for tutoring statement generations
 # ---------------
@@ -265,164 +140,64 @@ def increment_order_level(user_id):
     """ Increments the order level counter that allows statements within a
     certain statement level to be presented in order to the user. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set TutoringStatus.OrderLevel = TutoringStatus.OrderLevel + :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    get_user_store().increment(user_id, ('TutoringStatus', 'OrderLevel'))
 
 def reset_order_level(user_id):
     """ Resets the order level to 1. Generally reset at the beginning of
     a new statement level, since each statement level may have a different
     number of statements. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set TutoringStatus.OrderLevel = :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    get_user_store().update(user_id, values={('TutoringStatus', 'OrderLevel'): 1})
 
 def get_order_level(user_id):
     """ Returns the current order level. Used to keep track of where the
     program is in presenting all the statements within a statement level. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    tutoring_status_query = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in tutoring_status_query['Items']:
-        order_level = (i['TutoringStatus']['OrderLevel'])
-    return order_level
+    return get_user_store().get_user(user_id)['TutoringStatus']['OrderLevel']
 
 def get_max_order_levels(statement_level):
     """ Returns the max limit of the order levels. Used to make sure the program
     doesn't try to exceed bounds of # of statements there are within a statement
     level. """
 
-    filter_expression = Attr("StatementLevel").eq(statement_level)
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    tutor_table_dynamodb = dynamodb.Table('TutorTable')
-    tutor_table = tutor_table_dynamodb.scan(
-        FilterExpression=filter_expression,
-    )
-    order_levels_counter = 0
-    for item in tutor_table['Items']:
-        order_levels_counter += 1
-    return order_levels_counter
+    return get_content().catalog().max_order_levels(statement_level)
 
 def increment_statement_level(user_id):
     """ Increments the statement level counter that is used by the program
     to track where it is (statement level) in the tutoring process. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set TutoringStatus.StatementLevel = TutoringStatus.StatementLevel + :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    get_user_store().increment(user_id, ('TutoringStatus', 'StatementLevel'))
 
 def reset_statement_level(user_id):
     """ Resets the statement level counter to 1. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set TutoringStatus.StatementLevel = :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    get_user_store().update(user_id, values={('TutoringStatus', 'StatementLevel'): 1})
 
 def get_statement_level(user_id):
     """ Returns the current statement level. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    tutoring_status_query = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in tutoring_status_query['Items']:
-        statement_level = (i['TutoringStatus']['StatementLevel'])
-    return statement_level
+    return get_user_store().get_user(user_id)['TutoringStatus']['StatementLevel']
+
+def get_tutoring_status(user_id):
+    """ Returns the current statement level and order level with a single
+    read of the user's data. """
+
+    tutoring_status = get_user_store().get_user(user_id)['TutoringStatus']
+    return tutoring_status['StatementLevel'], tutoring_status['OrderLevel']
 
 def get_max_statement_level():
     """ Calculates and returns the max statement level from the
     tutoring database. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    tutor_table_dynamodb = dynamodb.Table('TutorTable')
-    projection_expression = "StatementLevel"
-    tutor_table = tutor_table_dynamodb.scan(
-        ProjectionExpression=projection_expression,
-    )
-    max_statement_level = 0
-    for item in tutor_table['Items']:
-        if item['StatementLevel'] > max_statement_level:
-            max_statement_level = item['StatementLevel']
-
-    return max_statement_level
+    return get_content().catalog().max_statement_level()
 
 def get_tutoring_statement(statement_level=1, order_level=1, attribute=None):
     """ Returns a tutoring statement based on an input statement level and
     order level, or input attribute. """
     if attribute is None:
-        # Allow for filtering of questions for a requested level
-        filter_expression = Attr("StatementLevel").eq(statement_level)\
-            & Attr("OrderLevel").eq(order_level)
-
-        # List to store question details to be returned to caller function
-        statement_details = []
-
-        # Set up access to necessary databases from DynamoDB
-        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-        tutor_table_dynamodb = dynamodb.Table('TutorTable')
-        tutor_table = tutor_table_dynamodb.scan(
-            FilterExpression=filter_expression,
-        )
-
-        # Obtain question template components from database
-        for item in tutor_table['Items']:
-            statement_details = item['TutoringStatements']
-
-        return statement_details
+        return get_content().catalog().tutoring_statement(statement_level, order_level)
     else:
-        # List to store question details to be returned to caller function
-        statement_details = []
-
-        # Set up access to necessary databases from DynamoDB
-        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-        tutor_table_dynamodb = dynamodb.Table('TutorTable')
-        tutoring_statement_query = tutor_table_dynamodb.query(KeyConditionExpression=Key('Attribute')\
-            .eq(attribute))
-
-        # Obtain question template components from database
-        for item in tutoring_statement_query['Items']:
-            statement_details = item['TutoringStatements']
-
-        return statement_details
+        return get_content().catalog().attribute_tutoring_statement(attribute)
 
 # --------------- Functions used for question generation and testing operations
 # ---------------
@@ -430,417 +205,561 @@ def get_tutoring_statement(statement_level=1, order_level=1, attribute=None):
 def get_total_correct(user_id):
     """ Returns the total number of questions the user has answered correctly. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    counter_current_value = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in counter_current_value['Items']:
-        counter_result = (i['CounterCorrect'])
-    counter_result_sum = sum(counter_result.values())
-    return counter_result_sum
+    return sum(get_user_store().get_user(user_id)['CounterCorrect'].values())
 
 def get_total_incorrect(user_id):
     """ Returns the total number of questions the user has answered incorrectly. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    counter_current_value = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in counter_current_value['Items']:
-        counter_result = (i['CounterIncorrect'])
-    counter_result_sum = sum(counter_result.values())
-    return counter_result_sum
+    return sum(get_user_store().get_user(user_id)['CounterIncorrect'].values())
 
 def update_previous_total_correct(user_id):
     """ Updates the previous total correct tracker, which is used to deal with
     the scenario where a user is stuck on a certain correct total.
     Check update_user_level() function for a better understanding. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    counter_current_value = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in counter_current_value['Items']:
-        counter_result = (i['CounterCorrect'])
-    counter_result_sum = sum(counter_result.values())
-
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set PreviousTotalCorrect = :val",
-        ExpressionAttributeValues={
-            ':val': counter_result_sum
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    get_user_store().update(user_id, values={
+        ('PreviousTotalCorrect',): get_total_correct(user_id)
+    })
 
 def get_previous_total_correct(user_id):
     """ Returns the previous total correct value, sum of all of the individual
     attribute values. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    previous_total_query = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in previous_total_query['Items']:
-        previous_total_correct = (i['PreviousTotalCorrect'])
-    return previous_total_correct
+    return get_user_store().get_user(user_id)['PreviousTotalCorrect']
 
 def update_previous_total_incorrect(user_id):
     """ Updates the previous total incorrect tracker, which is used to deal with
     the scenario where a user is stuck on a incorrect total.
     Check update_user_level() function for a better understanding. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    counter_current_value = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in counter_current_value['Items']:
-        counter_result = (i['CounterIncorrect'])
-    counter_result_sum = sum(counter_result.values())
-
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set PreviousTotalIncorrect = :val",
-        ExpressionAttributeValues={
-            ':val': counter_result_sum
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    get_user_store().update(user_id, values={
+        ('PreviousTotalIncorrect',): get_total_incorrect(user_id)
+    })
 
 def get_previous_total_incorrect(user_id):
     """ Returns the previous total incorrect value, sum of all of the individual
     attribute values. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    previous_total_query = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in previous_total_query['Items']:
-        previous_total_incorrect = (i['PreviousTotalIncorrect'])
-    return previous_total_incorrect
+    return get_user_store().get_user(user_id)['PreviousTotalIncorrect']
+
+def apply_answer(user, attribute_type, correct, question_type=None):
+    """ Applies an answer to a user item in place, updating its counters, the
+    user's mastery of the attribute, their weakest attributes and when the
+    attribute is next due for review. Returns the values to set in storage
+    for everything but the counter, including the day the user was last
+    active. """
+
+    mastery = get_mastery(user)
+    mastery[attribute_type] = update_mastery(
+        mastery.get(attribute_type, PRIOR_MASTERY), correct, question_type)
+    if 'Mastery' in user:
+        values = {('Mastery', attribute_type): to_stored(mastery[attribute_type])}
+        user['Mastery'][attribute_type] = decimal.Decimal(to_stored(mastery[attribute_type]))
+    else:
+        # Users created before mastery was tracked get the whole map, seeded
+        # from their counters, the first time they answer.
+        values = {('Mastery',): {key: to_stored(value) for key, value in mastery.items()}}
+        user['Mastery'] = {key: decimal.Decimal(value) for key, value in values[('Mastery',)].items()}
+    weakest = get_weakest(user)
+    new_weakest = update_weakest(weakest, mastery, attribute_type)
+    if new_weakest != weakest or 'WeakestAttributes' not in user:
+        values[('WeakestAttributes',)] = new_weakest
+    user['WeakestAttributes'] = new_weakest
+
+    # Time is counted in questions answered, including this one.
+    clock = sum(user['CounterCorrect'].values()) + sum(user['CounterIncorrect'].values()) + 1
+    schedule = user.get('Schedule')
+    review = next_review((schedule or {}).get(attribute_type), correct, clock)
+    if schedule is not None:
+        values[('Schedule', attribute_type)] = review
+    else:
+        values[('Schedule',)] = {attribute_type: review}
+    user.setdefault('Schedule', {})[attribute_type] = decimal.Decimal(review)
+
+    values[('LastActive',)] = activity_day()
+    user['LastActive'] = decimal.Decimal(values[('LastActive',)])
+
+    counters = user['CounterCorrect' if correct else 'CounterIncorrect']
+    counters[attribute_type] = counters.get(attribute_type, 0) + 1
+    return values
 
-def increment_question_correct(user_id, attribute_type):
+def record_answer(user_id, attribute_type, correct, question_type=None):
+    """ Increments the correct or incorrect tracker for the attribute type of
+    the question the user answered, and updates the user's mastery of that
+    attribute, their weakest attributes and when the attribute is next due
+    for review, all in the same write. """
+
+    user_store = get_user_store()
+    user = user_store.get_user(user_id) or new_user_item(user_id)
+    values = apply_answer(user, attribute_type, correct, question_type)
+    counter = 'CounterCorrect' if correct else 'CounterIncorrect'
+    user_store.update(user_id, values=values, deltas={(counter, attribute_type): 1})
+
+def increment_question_correct(user_id, attribute_type, question_type=None):
     """ Increments the correct tracker for the specific attribute type
     question a user answered correctly. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set #ctrcor.#atrval = #ctrcor.#atrval + :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ExpressionAttributeNames={
-            '#ctrcor': "CounterCorrect",
-            '#atrval': attribute_type
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    record_answer(user_id, attribute_type, True, question_type)
 
-def increment_question_incorrect(user_id, attribute_type):
+def increment_question_incorrect(user_id, attribute_type, question_type=None):
     """ Increments the incorrect tracker for the specific attribute type
     question a user answered incorrectly. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set #ctrincor.#atrval = #ctrincor.#atrval + :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ExpressionAttributeNames={
-            '#ctrincor': "CounterIncorrect",
-            '#atrval': attribute_type
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    record_answer(user_id, attribute_type, False, question_type)
 
 def increment_question_level(user_id):
     """ Increments the question level tracker. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set QuestionLevel = QuestionLevel + :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    get_user_store().increment(user_id, ('QuestionLevel',))
 
 def decrement_question_level(user_id):
     """ Decrements the question level tracker. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.update_item(
-        Key={
-            'UserID': user_id,
-        },
-        UpdateExpression="set QuestionLevel = QuestionLevel - :val",
-        ExpressionAttributeValues={
-            ':val': decimal.Decimal(1)
-        },
-        ReturnValues="UPDATED_NEW"
-    )
+    get_user_store().increment(user_id, ('QuestionLevel',), -1)
 
 def get_question_level(user_id):
     """ Returns the current question level. """
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    current_level_query = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-    for i in current_level_query['Items']:
-        current_level = (i['QuestionLevel'])
-    return current_level
 
-def generate_select_part(question_level):
-    """ Generates a random select part question. """
+    return get_user_store().get_user(user_id)['QuestionLevel']
+
+MULTIPLE_CHOICE_LETTERS = ["A", "B", "C"]
+
+def pick_question_attribute(question_templates, user=None):
+    """ Returns the index of the (attribute, template) pair to ask about.
+    Given the user's item, that is the attribute the user is due to review
+    next; otherwise it is picked at random. """
+
+    if user is None:
+        return random.randint(0, len(question_templates)-1)
+    attribute = next_attribute([attribute for attribute, _ in question_templates],
+                               user.get('Schedule', {}), get_mastery(user), random)
+    return random.choice([index for index, (template_attribute, _) in enumerate(question_templates)
+                          if template_attribute == attribute])
+
+def generate_select_part(question_level, user=None, recent=None, content=None):
+    """ Generates a random select part question. Given the user's item, the
+    question is about the attribute they are due to review next. Given the
+    questions asked recently in the session, those are not repeated while
+    there are others to ask, and the new question is added to them. The parts
+    to choose from are those the content holds facts about for the attribute.
+    The last detail is the question's key: its level, the index of its
+    template within the level, and its part and value.
+    """
 
-    # Allow for filtering of questions for a requested level
-    filter_expression = Attr("Level").eq(question_level)
+    catalog = content if content is not None else get_content().catalog()
 
     # List to store question details to be returned to caller function
     question_details = []
 
-    # Store components of question templates
-    question_attributes = []
-    question_templates = []
-
-    # Keeps track of the total number of attributes.
-    # Useful since filtering for level leads to different available
-    # attributes based on the level of question requested.
-    total_attribute_num = 0
-
-    # Set up access to necessary databases from DynamoDB
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    select_part_table_dynamodb = dynamodb.Table('QuestionTemplate_SelectPart')
-    answer_table = dynamodb.Table('FactTable')
-    select_part_table = select_part_table_dynamodb.scan(
-        FilterExpression=filter_expression,
-    )
-
-    # Obtain question template components from database
-    for item in select_part_table['Items']:
-        question_attributes.append(item['Attribute'])
-        question_templates.append(item['SelectPart'])
-        total_attribute_num += 1
-
-    # Store possible output variables for output question
-    all_available_parts = ["CTU", "CTD"]
-    all_output_question_values = []
-    all_output_question_parts = []
+    # Obtain question template components for the requested level
+    question_templates = catalog.select_part_templates(question_level)
 
     # Randomly generate question's attribute, then get its respective output
     # question template.
-    output_question_attribute_num = random.randint(0, total_attribute_num-1)
-    output_question_attribute = question_attributes[output_question_attribute_num]
-    output_question_template = question_templates[output_question_attribute_num]
+    output_question_attribute_num = pick_question_attribute(question_templates, user)
+    output_question_attribute, output_question_template = \
+        question_templates[output_question_attribute_num]
     question_details.append(output_question_attribute)
 
     # Once attribute is generated, generate all possible values to go with attribute
-    # based on possible parts.
-    for part in all_available_parts:
-        value = answer_table.query(KeyConditionExpression=Key('Part & Attribute')\
-            .eq(part + " " + output_question_attribute))
-        if len(value['Items']) != 0:
-            for i in value['Items']:
-                all_output_question_values.append(i['Value'])
-                all_output_question_parts.append(part)
+    # based on the parts that have it.
+    all_available_parts = catalog.fact_parts(output_question_attribute)
+    candidates = [(part, value) for part in all_available_parts
+                  for value in catalog.fact_values(part, output_question_attribute)]
 
     # Pick a part and the value that goes with it so that a question can be formed.
-    # For loop makes sure that if both CTD and CTU have the same value for the same
-    # attribute, then the final question answer is both, and not just one of CTD
-    # or CTU.
-    output_question_part_index = random.randint(0, len(all_output_question_parts)-1)
-    output_question_part = all_output_question_parts[output_question_part_index]
-    output_question_value = all_output_question_values[output_question_part_index]
-
-    match_found = False
-    for index in range(0, len(all_output_question_values)):
-        if all_output_question_parts[index] != output_question_part\
-        and all_output_question_values[index] == output_question_value:
-            match_found = True
-
-    if match_found:
-        output_question_answer = "Both"
+    if recent is None:
+        candidate_index = random.randint(0, len(candidates)-1)
+    else:
+        candidate_ids = [question_id("SelectPart", output_question_attribute, part, value)
+                         for part, value in candidates]
+        candidate_index = sample_index(candidate_ids, recent, random)
+        recent.add(candidate_ids[candidate_index])
+    output_question_part, output_question_value = candidates[candidate_index]
+
+    # If other parts share the value for the same attribute, the answer is
+    # that more than one part has it, and not just the part picked.
+    if len(catalog.parts_with_value(output_question_attribute, output_question_value)) > 1:
+        output_question_answer = shared_parts_answer(all_available_parts)
     else:
         output_question_answer = output_question_part
 
-    output_question = output_question_template.replace("<ATTRIBUTE>", output_question_attribute)\
-        .replace("<VALUE>", output_question_value)
+    output_question = output_question_template.render(value=output_question_value)
 
     question_details.append(output_question)
     question_details.append(output_question_answer)
+    question_details.append(all_available_parts)
+    question_details.append([int(question_level), output_question_attribute_num,
+                             output_question_part, output_question_value])
 
     return question_details
 
-def generate_true_false(question_level):
+def shared_parts_answer(parts):
+    """ Returns the answer to a select part question whose value holds for
+    more than one of parts. """
+
+    return say('both_parts') if len(parts) == 2 else say('several_parts')
+
+def select_part_options(parts):
+    """ Returns the text listing the replies to a select part question, such
+    as "CTD, CTU, or both". """
+
+    return say('select_part_options', parts=", ".join(parts),
+               shared=shared_parts_answer(parts).lower())
+
+def generate_true_false(question_level, user=None, recent=None, content=None):
     """ Generates a random true and false question, its answer, and returns
     the full details of the question to the caller function as a List.
+    Given the user's item, the question is about the attribute they are due
+    to review next. Given the questions asked recently in the session, those
+    are not repeated while there are others to ask, and the new question is
+    added to them. The last detail is the question's key: its level, the
+    index of its template within the level, its part and value, and the part
+    and value of the full answer.
     """
-    # Allow for filtering of questions for a requested level
-    filter_expression = Attr("QuestionLevel").eq(question_level)
+    catalog = content if content is not None else get_content().catalog()
 
     # List to store question details to be returned to caller function
     question_details = []
 
-    # Store components of question templates
-    question_attributes = []
-    question_templates = []
-
-    # Keeps track of the total number of attributes.
-    # Useful since filtering for level leads to different available
-    # attributes based on the level of question requested.
-    total_attribute_num = 0
-
-    # Set up access to necessary databases from DynamoDB
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    true_false_table_dynamodb = dynamodb.Table('QuestionTemplate_TrueFalse')
-    answer_table = dynamodb.Table('FactTable')
-    true_false_table = true_false_table_dynamodb.scan(
-        FilterExpression=filter_expression,
-    )
-
-    # Obtain question template components from database
-    for item in true_false_table['Items']:
-        question_attributes.append(item['Attribute'])
-        question_templates.append(item['TrueFalse'])
-        total_attribute_num += 1
-
-    # Store possible output variables for output question
-    all_available_parts = ["CTU", "CTD"]
-    all_output_question_values = []
+    # Obtain question template components for the requested level
+    question_templates = catalog.true_false_templates(question_level)
 
     # Randomly generate question's attribute
-    output_question_attribute_num = random.randint(0, total_attribute_num-1)
-    output_question_attribute = question_attributes[output_question_attribute_num]
+    output_question_attribute_num = pick_question_attribute(question_templates, user)
+    output_question_attribute, output_question_template = \
+        question_templates[output_question_attribute_num]
     question_details.append(output_question_attribute)
 
-    # Once attribute is generated, generate all possible values to go with attribute
-    # based on possible parts.
-    for part in all_available_parts:
-        value = answer_table.query(KeyConditionExpression=Key('Part & Attribute')\
-            .eq(part + " " + output_question_attribute))
-        if len(value['Items']) != 0:
-            for i in value['Items']:
-                all_output_question_values.append(i['Value'])
-
-    # Queries DynamoDB fact table to get all valid answers that match for a given attribute
-    attribute_valid_answers = []
-    for counter in range(len(all_available_parts)):
-        value = answer_table.query(KeyConditionExpression=Key('Part & Attribute')\
-            .eq(all_available_parts[counter] + " " + output_question_attribute))
-        for i in value['Items']:
-            attribute_valid_answers.append(question_templates[output_question_attribute_num] \
-                .replace("<PART>", all_available_parts[counter]).replace("<ATTRIBUTE>", \
-                output_question_attribute).replace("<VALUE>", i['Value']))
+    # Once attribute is generated, get all possible values to go with attribute
+    # across the parts that have it.
+    all_available_parts = catalog.fact_parts(output_question_attribute)
+    all_output_question_values = catalog.attribute_values(output_question_attribute)
 
     # Output question that gets relayed to the user, pick random part and val to match
     # with a chosen attribute to generate a random (but reasonable) question
-    output_question_part = random.choice(all_available_parts)
-    output_question_value = random.choice(all_output_question_values)
-
-    output_question = question_templates[output_question_attribute_num]\
-        .replace("<PART>", output_question_part).replace("<ATTRIBUTE>",\
-        output_question_attribute).replace("<VALUE>", output_question_value)
+    if recent is None:
+        output_question_part = random.choice(all_available_parts)
+        output_question_value = random.choice(all_output_question_values)
+    else:
+        candidates = [(part, value) for part in all_available_parts
+                      for value in all_output_question_values]
+        candidate_ids = [question_id("TrueFalse", output_question_attribute, part, value)
+                         for part, value in candidates]
+        candidate_index = sample_index(candidate_ids, recent, random)
+        output_question_part, output_question_value = candidates[candidate_index]
+        recent.add(candidate_ids[candidate_index])
+
+    output_question = output_question_template.render(output_question_part, output_question_value)
     question_details.append(output_question)
 
-    # If the answer to the generated question is false, we generate a True version to teach user
-    output_closest_answer = difflib.get_close_matches(output_question,\
-        attribute_valid_answers, n=1, cutoff=0.8)
-
-    # Query fact table for output question, if present then True, else False
-    output_question_query = answer_table.query(KeyConditionExpression=Key('Part & Attribute')\
-        .eq(output_question_part + " " + output_question_attribute) & Key('Value')\
-        .eq(output_question_value))
-
-    if len(output_question_query['Items']) == 0:
+    # Check the facts for the output question, if present then True, else False
+    if output_question_part not in catalog.parts_with_value(output_question_attribute,
+                                                            output_question_value):
+        # If the answer to the generated question is false, we generate a True
+        # version to teach user, out of every valid statement for the attribute.
+        valid_facts = [(part, value) for part in all_available_parts
+                       for value in catalog.fact_values(part, output_question_attribute)]
+        attribute_valid_answers = [output_question_template.render(part, value)
+                                   for part, value in valid_facts]
+        output_closest_answer = difflib.get_close_matches(output_question,\
+            attribute_valid_answers, n=1, cutoff=0.8)
         question_details.append("false")
         output_corrected_answer = output_closest_answer[0]
         question_details.append(output_corrected_answer)
+        full_answer_part, full_answer_value = \
+            valid_facts[attribute_valid_answers.index(output_corrected_answer)]
     else:
         question_details.append("true")
         output_true_answer = output_question
         question_details.append(output_true_answer)
+        full_answer_part, full_answer_value = output_question_part, output_question_value
+    question_details.append([int(question_level), output_question_attribute_num,
+                             output_question_part, output_question_value,
+                             full_answer_part, full_answer_value])
 
     return question_details
 
+def generate_multiple_choice(question_level, user=None, recent=None, content=None):
+    """ Generates a multiple choice question asking which value completes a
+    statement about a part and attribute. The wrong choices come from the
+    distractor index of the content held in memory, so no facts are queried.
+    The last detail is the question's key, as for generate_select_part.
+    Returns None if the content has no wrong values to offer. """
+
+    catalog = content if content is not None else get_content().catalog()
+
+    # Obtain question template components for the requested level. The true
+    # or false templates state a fact, which works as the statement to fill in.
+    question_templates = catalog.true_false_templates(question_level)
+    output_question_attribute_num = pick_question_attribute(question_templates, user)
+    output_question_attribute, output_question_template = \
+        question_templates[output_question_attribute_num]
+
+    # Pick the part and the value the question is about.
+    candidates = [(part, value) for part in catalog.fact_parts(output_question_attribute)
+                  for value in catalog.fact_values(part, output_question_attribute)]
+    if recent is None:
+        candidate_index = random.randint(0, len(candidates)-1)
+    else:
+        candidate_ids = [question_id("MultipleChoice", output_question_attribute, part, value)
+                         for part, value in candidates]
+        candidate_index = sample_index(candidate_ids, recent, random)
+        recent.add(candidate_ids[candidate_index])
+    output_question_part, output_question_value = candidates[candidate_index]
+
+    # The attribute's values for other parts make the most plausible wrong
+    # choices. Values of other attributes fill in when there are too few.
+    wrong_choices_needed = len(MULTIPLE_CHOICE_LETTERS) - 1
+    right_values = catalog.fact_values(output_question_part, output_question_attribute)
+    wrong_values = list(catalog.distractor_values(output_question_part, output_question_attribute))
+    random.shuffle(wrong_values)
+    all_values = catalog.all_fact_values()
+    for _ in range(4 * wrong_choices_needed):
+        if len(wrong_values) >= wrong_choices_needed or not all_values:
+            break
+        value = random.choice(all_values)
+        if value not in right_values and value not in wrong_values:
+            wrong_values.append(value)
+    if not wrong_values:
+        return None
+
+    choices = [output_question_value] + wrong_values[:wrong_choices_needed]
+    random.shuffle(choices)
+    output_question_answer = MULTIPLE_CHOICE_LETTERS[choices.index(output_question_value)]
+
+    output_question = output_question_template.render(output_question_part, "blank")
+    output_full_answer = output_question_template.render(output_question_part,
+                                                         output_question_value)
+
+    return [output_question_attribute, output_question, choices, output_question_answer,
+            output_full_answer, [int(question_level), output_question_attribute_num,
+                                 output_question_part, output_question_value]]
+
+def choices_speech(choices):
+    """ Returns the text that reads out the choices of a multiple choice question. """
+
+    spoken_choices = [say('choice', letter=letter, choice=choice)
+                      for letter, choice in zip(MULTIPLE_CHOICE_LETTERS, choices)]
+    return say('choices', choices=", ".join(spoken_choices[:-1]), last=spoken_choices[-1])
+
 def get_attribute_feedback(user_id):
     """ Returns the attributes the user has performed the worst on for feedback. """
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    user_data_dynamodb = dynamodb.Table('LLPTutor_UserData')
-    response = user_data_dynamodb.query(KeyConditionExpression=Key('UserID')\
-        .eq(user_id))
-
-    worst_attributes = {}
-
-    for i in response['Items']:
-        incorrect_results = (i['CounterIncorrect'])
-
-    # Find the highest value of attributes a user has gotten wrong
-    most_attributes_wrong = 0
-    for key in incorrect_results:
-        if incorrect_results[key] > most_attributes_wrong:
-            most_attributes_wrong = incorrect_results[key]
+    # The worst attributes are those with the lowest mastery, as long as the
+    # user's mistakes have brought it below where everyone starts. The user
+    # item keeps the few weakest ones up to date.
+    worst_attributes = weakest_attributes(get_weakest(get_user_store().get_user(user_id)))
 
     feedback_statements = {}
-    positive_feedback_responses = [
-        "Nice work!",
-        "Great job!",
-        "Good job!",
-        "Nice job!",
-        "Very good!",
-        "Great work!",
-        "Good work!",
-        "Awesome work!",
-        "Superb!",
-        "Excellent!",
-        "Fantastic!",
-        "Bullseye!",
-        "Right on the money!",
-        "Well done!",
-        "Keep it up!",
-        "Way to go!",
-        "Nicely done!",
-        "Good answer!",
-        "Nice one!",
-        "Outstanding!"
-    ]
-    if most_attributes_wrong == 0:
-        feedback_statements["None"] = random.choice(positive_feedback_responses) + " You made no mistakes."
+    if not worst_attributes:
+        phrases = get_phrases()
+        feedback_statements["None"] = random.choice(phrases['positive_feedback']) + " " + \
+            phrases['no_mistakes']
     else:
-        # Search attribute records and get which attributes match with
-        # the previously calculated highest mistake count.
-        for key in incorrect_results:
-            if incorrect_results[key] == most_attributes_wrong:
-                worst_attributes[key] = most_attributes_wrong
-
-        # Get feedback statement for each attribute
-        user_data_dynamodb = dynamodb.Table('TutorTable')
+        # Feedback statements are held in memory, so looking them up needs
+        # no further reads.
+        catalog = get_content().catalog()
         for key in worst_attributes:
-            response = user_data_dynamodb.query(KeyConditionExpression=Key('Attribute')\
-                .eq(key))
-            for i in response['Items']:
-                feedback_statement = i['FeedbackStatement']
-            feedback_statements[key] = feedback_statement
+            feedback_statements[key] = catalog.feedback_statement(key)
 
     return feedback_statements
 
+# --------------- Functions used for quiz rounds --------------- #
+
+QUIZ_ROUND_DEFAULT_QUESTIONS = 5
+QUIZ_ROUND_MAX_QUESTIONS = 10
+
+def question_parts(question_details):
+    """ Returns the parts a select part question offers to choose from. """
+
+    if "Parts" in question_details:
+        return question_details["Parts"]
+    return get_content().catalog().fact_parts(question_details["QuestionAttribute"])
+
+def select_part_reply(user_answer, parts):
+    """ Returns the answer a reply to a select part question gives, out of
+    parts and the shared parts answer, or None if it gives none of them. """
+
+    phrases = get_phrases()
+    user_answer = user_answer.replace("&", "and")
+    for part in parts:
+        if user_answer == part or user_answer in phrases['part_spoken_names'].get(part, []):
+            return part
+    if user_answer in phrases['shared_parts_replies']:
+        return shared_parts_answer(parts)
+    return None
+
+def grade_answer(question_details, user_answer):
+    """ Grades a reply to a question, given the question's details as they are
+    kept in the session attributes. Returns True if the reply is correct,
+    False if it is incorrect and None if it is not a valid reply to that type
+    of question. """
+
+    if question_details["QuestionType"] == "TrueFalse":
+        if user_answer != "true" and user_answer != "false":
+            return None
+        return user_answer == question_details["PartialAnswer"]
+
+    if question_details["QuestionType"] == "MultipleChoice":
+        # Either the letter or the value itself picks a choice.
+        reply = user_answer.strip().rstrip(".").lower()
+        prefix = get_phrases()['choice_reply_prefix']
+        if reply.startswith(prefix):
+            reply = reply[len(prefix):]
+        for letter, choice in zip(MULTIPLE_CHOICE_LETTERS, question_details["Choices"]):
+            if reply == letter.lower() or reply == choice.lower():
+                return letter == question_details["Answer"]
+        return None
+
+    reply = select_part_reply(user_answer, question_parts(question_details))
+    if reply is None:
+        return None
+    return reply == question_details["Answer"]
+
+def question_speech(question_details):
+    """ Returns the text that asks a question. """
+
+    if question_details["QuestionType"] == "TrueFalse":
+        return say('true_false_question', question=question_details["Question"])
+    if question_details["QuestionType"] == "MultipleChoice":
+        return say('multiple_choice_question', question=question_details["Question"],
+                   choices=choices_speech(question_details["Choices"]))
+    return say('select_part_question', question=question_details["Question"],
+               options=select_part_options(question_parts(question_details)))
+
+def spoken_answer(question_details):
+    """ Returns the answer to a question as it is said. """
+
+    if question_details["QuestionType"] == "TrueFalse":
+        return get_phrases()['true_false_answers'][question_details["PartialAnswer"]]
+    return question_details["Answer"]
+
+def generate_question(question_level, user=None, recent=None, content=None):
+    """ Generates a True/False, Select Part or Multiple Choice question, picked
+    at random, and returns its question details. """
+
+    question_type_num = random.randint(0, 2)
+    if question_type_num == 2:
+        question_full = generate_multiple_choice(question_level, user, recent, content)
+        if question_full is not None:
+            return {
+                "QuestionType": "MultipleChoice",
+                "QuestionAttribute": question_full[0],
+                "Question": question_full[1],
+                "Choices": question_full[2],
+                "Answer": question_full[3],
+                "FullAnswer": question_full[4],
+                "QuestionKey": question_full[5]
+            }
+        # The content has too few values to offer wrong choices.
+        question_type_num = 0
+
+    if question_type_num == 0:
+        question_full = generate_true_false(question_level, user, recent, content)
+        return {
+            "QuestionType": "TrueFalse",
+            "QuestionAttribute": question_full[0],
+            "Question": question_full[1],
+            "PartialAnswer": question_full[2],
+            "FullAnswer": question_full[3],
+            "QuestionKey": question_full[4]
+        }
+    question_full = generate_select_part(question_level, user, recent, content)
+    return {
+        "QuestionType": "SelectPart",
+        "QuestionAttribute": question_full[0],
+        "Question": question_full[1],
+        "Answer": question_full[2],
+        "Parts": question_full[3],
+        "QuestionKey": question_full[4]
+    }
+
+def generate_quiz_round(user, question_count, recent):
+    """ Generates a round of questions up front, all at the user's current
+    level, from the content held in memory. Returns the question details of
+    each question. """
+
+    level = next_question_level(
+        user['QuestionLevel'],
+        sum(user['CounterCorrect'].values()),
+        sum(user['CounterIncorrect'].values()),
+        user['PreviousTotalCorrect'],
+        user['PreviousTotalIncorrect']
+    )
+    catalog = get_content().catalog()
+
+    # Attributes already in the round are pushed back in a copy of the
+    # user's schedule, so the round covers as many attributes as it can.
+    clock = sum(user['CounterCorrect'].values()) + sum(user['CounterIncorrect'].values())
+    round_user = dict(user, Schedule=dict(user.get('Schedule', {})))
+
+    questions = []
+    for _ in range(question_count):
+        question_details = generate_question(level, round_user, recent, catalog)
+        questions.append(question_details)
+        attribute = question_details["QuestionAttribute"]
+        round_user['Schedule'][attribute] = postpone(
+            round_user['Schedule'].get(attribute), clock + question_count + 1)
+    return questions
+
+def commit_quiz_round(user_id, answers):
+    """ Applies the answers of a quiz round, given as (attribute, question
+    type, correct) tuples, to the user's data in a single write.
+
+    The question level and previous totals end up as they would have had the
+    questions been asked one at a time, with the level updated before each
+    question, even though the whole round was asked at its starting level. """
+
+    user_store = get_user_store()
+    user = user_store.get_user(user_id) or new_user_item(user_id)
+
+    level = user['QuestionLevel']
+    total_correct = sum(user['CounterCorrect'].values())
+    total_incorrect = sum(user['CounterIncorrect'].values())
+    previous_total_correct = user['PreviousTotalCorrect']
+    previous_total_incorrect = user['PreviousTotalIncorrect']
+
+    deltas = {}
+    for attribute, question_type, correct in answers:
+        level = next_question_level(level, total_correct, total_incorrect,
+                                    previous_total_correct, previous_total_incorrect)
+        previous_total_correct, previous_total_incorrect = total_correct, total_incorrect
+
+        apply_answer(user, attribute, correct, question_type)
+        counter = 'CounterCorrect' if correct else 'CounterIncorrect'
+        deltas[(counter, attribute)] = deltas.get((counter, attribute), 0) + 1
+        if correct:
+            total_correct += 1
+        else:
+            total_incorrect += 1
+
+    user_store.update(user_id, values={
+        ('QuestionLevel',): level,
+        ('PreviousTotalCorrect',): previous_total_correct,
+        ('PreviousTotalIncorrect',): previous_total_incorrect,
+        ('Mastery',): user['Mastery'],
+        ('WeakestAttributes',): user['WeakestAttributes'],
+        ('Schedule',): user['Schedule'],
+        ('LastActive',): activity_day()
+    }, deltas=deltas)
+
+def round_answers(quiz_round):
+    """ Returns the (attribute, question type, correct) tuples answered so far
+    in a quiz round. """
+
+    return [(question["QuestionAttribute"], question["QuestionType"], correct)
+            for question, correct in zip(quiz_round["Questions"], quiz_round["Results"])]
+
+def commit_interrupted_round(session):
+    """ Saves the answers of a quiz round the user left before finishing it. """
+
+    session_details = session.get('attributes') or {}
+    if session_details.get("CurrentStage") == "QuizRound" \
+        and session_details["QuizRound"]["Results"]:
+        defer(commit_quiz_round, session['user']['userId'],
+              round_answers(session_details["QuizRound"]))
+
 def card_text_format(speech_output):
     """ Formats speech output text into card format (basically removes
     the code-like SSML text)"""
@@ -865,40 +784,41 @@ def get_welcome_response(session):
     a user invokes the skill without an intent.
     """
 
-    card_title = "Welcome"
+    card_title = title('welcome')
     session_attributes = {
         "CurrentStage": "WelcomeResponse",
     }
     session_user = session.get('user', {})
     user_id = session_user['userId']
     if user_exists(user_id):
-        speech_output = (
-            "<speak>" + "Welcome back! " +
-            "Would you like me to quiz you, or tutor you? " + "</speak>"
-        )
-        card_output = card_text_format(speech_output)
+        mark_active(user_id)
+        speech_output, reprompt_text = welcome_prompt(returning=True)
     else:
         add_user(user_id)
-        speech_output = (
-            "<speak>" + "Welcome to the PLC Counter Instruction Tutor! " +
-            "Would you like me to quiz you, or tutor you?" + "</speak>"
-        )
-        card_output = card_text_format(speech_output)
+        speech_output, reprompt_text = welcome_prompt(returning=False)
+        session_attributes["NewUser"] = True
+    card_output = card_text_format(speech_output)
 
-    # If the user either does not reply to the welcome message or says something
-    # that is not understood, they will be prompted again with this text.
-    reprompt_text = "I didn't quite get that. I can either quiz you or tutor you. " \
-                    "Which would you like me to do?"
     should_end_session = False
     return build_response(session_attributes, build_speechlet_response(
         card_title, speech_output, card_output, reprompt_text, should_end_session))
 
+def welcome_prompt(returning):
+    """ Returns the speech output and reprompt text that welcome a new or a
+    returning user. """
+
+    speech_output = "<speak>" + say('welcome_back' if returning else 'welcome_new') + "</speak>"
+
+    # If the user either does not reply to the welcome message or says something
+    # that is not understood, they will be prompted again with this text.
+    reprompt_text = say('welcome_reprompt')
+    return speech_output, reprompt_text
+
 def handle_session_end_request(session):
     """ Ends the Alexa session when a user requests it. """
 
-    card_title = "Session Ended"
-    speech_output = "<speak>" + "Thanks for trying out the PLC Counter Instruction Tutor. " \
-                    "Have a nice day!" + "</speak>"
+    card_title = title('session_ended')
+    speech_output = "<speak>" + say('goodbye') + "</speak>"
     card_output = card_text_format(speech_output)
 
     # Setting this to true ends the session and exits the skill.
@@ -909,224 +829,151 @@ def handle_session_end_request(session):
 def handle_repeat_request(intent, session):
     """ Repeats the previous speech output. If there is a previous
     session to repeat from, it will be repeated. Otherwise a new
-    session will be started. """
+    session will be started. The session only keeps what the previous
+    response was about, so its speech is rendered again from that. """
 
-    if 'attributes' not in session or 'SpeechOutput' not in session['attributes']:
-        return get_welcome_response(session)
-    else:
-        previous_attributes = session.get('attributes', {})
+    previous_attributes = session.get('attributes') or {}
+    if 'SpeechOutput' in previous_attributes:
+        # Sessions from before session state was kept compact hold the
+        # speech itself.
         card_title = previous_attributes['CardTitle']
         speech_output = previous_attributes['SpeechOutput']
-        card_output = card_text_format(speech_output)
         reprompt_text = previous_attributes['RepromptText']
-        should_end_session = False
+    elif previous_attributes.get('CurrentStage') in REPEAT_PROMPTS:
+        card_title, speech_output, reprompt_text = \
+            REPEAT_PROMPTS[previous_attributes['CurrentStage']](previous_attributes)
+    else:
+        return get_welcome_response(session)
+    card_output = card_text_format(speech_output)
+    should_end_session = False
 
-        return build_response(previous_attributes, build_speechlet_response(
-            card_title, speech_output, card_output, reprompt_text, should_end_session))
+    return build_response(previous_attributes, build_speechlet_response(
+        card_title, speech_output, card_output, reprompt_text, should_end_session))
 
 def handle_help_request(intent, session):
     """ Handles a user's request for help. """
 
-    card_title = "Help"
+    card_title = title('help')
 
     # Depending on the current stage of the interaction, a different
-    # help response is provided to the user. 
-    # Note to me: Improve these help responses in the future
+    # help response is provided to the user. Asking for help again gives
+    # the help of the stage help was first asked in.
     session_details = session.get('attributes', {})
-    if session_details["CurrentStage"] == "WelcomeResponse":
-        speech_output = (
-            "<speak>" + "Welcome to PLC Counter Instruction Tutor. " +
-            "I can either quiz you or tutor you. I recommend that " +
-            "you start off with tutoring to go over the material, " +
-            "and then test yourself with some questions." + '"<break time="0.75s"/>"' + 
-            "Would you like me to tutor you or quiz you?" + "</speak>"
-        )
-        card_output = card_text_format(speech_output)
-    elif session_details["CurrentStage"] == "GenerateQuestion":
-        if session_details["QuestionType"] == "TrueFalse":
-            speech_output = (
-                "<speak>" + "For a true or false question, you need to reply " +
-                "with either true, or false. Would you like another question?" + "</speak>"
-            )
-            card_output = card_text_format(speech_output)
-        elif session_details["QuestionType"] == "SelectPart":
-            speech_output = (
-                "<speak>" + "For a select instruction question, you need to reply with " +
-                "one of the provided answer choices. Would you like another question?" + "</speak>"
-            )
-            card_output = card_text_format(speech_output)
-    elif session_details["CurrentStage"] == "CheckAnswer":
-        if session_details["QuestionType"] == "TrueFalse":
-            speech_output = (
-                "<speak>" + "For a true or false question, you need to reply " +
-                "with either true, or false. Would you like another question?" + "</speak>"
-            )
-            card_output = card_text_format(speech_output)
-        elif session_details["QuestionType"] == "SelectPart":
-            speech_output = (
-                "<speak>" + "For a select instruction question, you need to reply with " +
-                "one of the provided answer choices. Would you like another question?" + "</speak>"
-            )
-            card_output = card_text_format(speech_output)
-    elif session_details["CurrentStage"] == "GiveQuizFeedback":
-        speech_output = (
-            "<speak>" + "The feedback stage is to help you improve on your weakest " +
-            "areas. " + '"<break time="0.75s"/>"' + "Would you like me to tutor you, " +
-            "quiz you again, or would you like to end this study session?" + "</speak>"
-        )
-        card_output = card_text_format(speech_output)    
-    elif session_details["CurrentStage"] == "ReviewQuizFeedback":
-        speech_output = (
-            "<speak>" + "The feedback stage is to help you improve on your weakest " +
-            "areas. " + '"<break time="0.75s"/>"' + "Would you like me to tutor you, " +
-            "quiz you again, or would you like to end this study session?" + "</speak>"
-        )
-        card_output = card_text_format(speech_output)      
-    elif session_details["CurrentStage"] == "Tutoring":
-        speech_output = (
-            "<speak>" + "During the tutoring stage I go over the basics of counter " +
-            "instructions in PLC ladder logic programming. " + '"<break time="0.75s"/>"' + 
-            "Would you like to return to tutoring, for me to quiz you, or would " +
-            "you like to end this study session?" + "</speak>"
-        )
-        card_output = card_text_format(speech_output)  
-    elif session_details["CurrentStage"] == "OptionsMenu":
-        speech_output = (
-            "<speak>" + "I can either quiz you or tutor you about counter " +
-            "instructions in PLC ladder logic programming. " + '"<break time="0.75s"/>"' + 
-            "Would you like me to tutor you, quiz you, or would " +
-            "you like to end this study session?" + "</speak>"
-        )
-        card_output = card_text_format(speech_output)         
-    reprompt_text = "I didn't quite get that; what would you like to do?"
+    stage = session_details["CurrentStage"]
+    if stage == "HelpRequest":
+        stage = session_details.get("HelpStage", stage)
+    speech_output = help_speech(stage, session_details)
+    card_output = card_text_format(speech_output)
+    reprompt_text = say('help_reprompt')
     session_attributes = {
-        "CardTitle": card_title,
-        "SpeechOutput": speech_output,
-        "RepromptText": reprompt_text,
         "CurrentStage": "HelpRequest",
+        "HelpStage": stage
     }
+    if "QuestionType" in session_details:
+        session_attributes["QuestionType"] = session_details["QuestionType"]
+    carry_over(session_details, session_attributes)
+    if stage in ("QuizRound", "QuizRoundSummary"):
+        # Stay in the round so the next reply answers its current question.
+        session_attributes = dict(session_details)
     should_end_session = False
 
     return build_response(session_attributes, build_speechlet_response(
         card_title, speech_output, card_output, reprompt_text, should_end_session))
 
+def help_speech(stage, session_details):
+    """ Returns the help for a stage of the interaction. """
+
+    # Note to me: Improve these help responses in the future
+    if stage == "WelcomeResponse":
+        help_text = say('help_welcome')
+    elif stage in ("GenerateQuestion", "CheckAnswer"):
+        help_text = get_phrases()['help_questions'][session_details["QuestionType"]]
+    elif stage in ("GiveQuizFeedback", "ReviewQuizFeedback"):
+        help_text = say('help_feedback')
+    elif stage == "Tutoring":
+        help_text = say('help_tutoring')
+    elif stage == "OptionsMenu":
+        help_text = say('help_options_menu')
+    elif stage == "QuizRound":
+        current_question = session_details["QuizRound"]["Questions"][
+            len(session_details["QuizRound"]["Results"])]
+        help_text = say('help_quiz_round', question=question_speech(current_question))
+    elif stage == "QuizRoundSummary":
+        help_text = say('help_quiz_round_summary')
+    return "<speak>" + help_text + "</speak>"
+
 def get_question_from_session(intent, session):
     """ Randomly generates question and prepares the speech with
     question to reply to the user.
     """
     session_user = session.get('user', {})
     user_id = session_user['userId']
-    if user_exists(user_id):
-        pass
-    else:
+    user = get_user_store().get_user(user_id)
+    if user is None:
         add_user(user_id)
+        user = new_user_item(user_id)
 
     # Check user's status with correct/incorrect questions and update level
     # accordingly before generating a new question.
-    current_user_level = update_user_level(user_id)
-
-    # Generate either a True/False or Select Value type question and relay it
-    # back to the user.
-    question_type_num = random.randint(0, 1)
-
-    if question_type_num == 0:
-        question_full = generate_true_false(current_user_level)
+    current_user_level = update_user_level(user_id, user)
 
-        card_title = "True or False Question"
-        #speech_output = (
-        #    "<speak>" + '"<prosody rate="slow">"' + "True or False? "
-        #    + question_full[1] + "</prosody>" + "</speak>"
-        #)
-        speech_output = (
-            "<speak>" + "True or False? "
-            + question_full[1] + "</speak>"
-        )
-        card_output = card_text_format(speech_output)
-        reprompt_text = (
-            "I didn't get your answer. Please reply True or "
-            "False about this statement: " + question_full[1]
-        )
-        session_attributes = {
-            "CardTitle": card_title,
-            "SpeechOutput": speech_output,
-            "RepromptText": reprompt_text,
-            "CurrentStage": "GenerateQuestion",
-            "QuestionType": "TrueFalse",
-            "QuestionAttribute": question_full[0],
-            "Question": question_full[1],
-            "PartialAnswer": question_full[2],
-            "FullAnswer": question_full[3],
-        }
-        should_end_session = False
+    # Questions asked recently in this session are not asked again straight away.
+    recent = RecentQuestions.from_session(session.get('attributes'))
 
-    elif question_type_num == 1:
-        question_full = generate_select_part(current_user_level)
+    # Generate either a True/False, Select Value or Multiple Choice type
+    # question and relay it back to the user.
+    question_details = generate_question(current_user_level, user, recent)
 
-        card_title = "Select Part Question"
-        speech_output = (
-            "<speak>" + question_full[1]
-            + " Is this CTU, CTD, or both?"
-            + "</speak>"
-        )
-        card_output = card_text_format(speech_output)
-        reprompt_text = (
-            "I didn't get your answer. Please reply either CTD, "
-            "CTU, or both."
-        )
-        session_attributes = {
-            "CardTitle": card_title,
-            "SpeechOutput": speech_output,
-            "RepromptText": reprompt_text,
-            "CurrentStage": "GenerateQuestion",
-            "QuestionType": "SelectPart",
-            "QuestionAttribute": question_full[0],
-            "Question": question_full[1],
-            "Answer": question_full[2],
-        }
-        should_end_session = False
+    card_title, speech_output, reprompt_text = question_prompt(question_details)
+    card_output = card_text_format(speech_output)
+    session_attributes = dict(question_details)
+    session_attributes.update({
+        "CurrentStage": "GenerateQuestion",
+        RECENT_QUESTIONS_KEY: recent.to_session(),
+    })
+    should_end_session = False
 
     return build_response(session_attributes, build_speechlet_response(
         card_title, speech_output, card_output, reprompt_text, should_end_session))
 
+def question_prompt(question_details):
+    """ Returns the card title, speech output and reprompt text that ask a
+    question on its own. """
+
+    question_type = question_details["QuestionType"]
+    speech_output = "<speak>" + question_speech(question_details) + "</speak>"
+    if question_type == "TrueFalse":
+        reprompt_text = say('true_false_reprompt', question=question_details["Question"])
+    elif question_type == "SelectPart":
+        reprompt_text = say('select_part_reprompt',
+                            options=select_part_options(question_parts(question_details)))
+    else:
+        reprompt_text = say('multiple_choice_reprompt',
+                            choices=choices_speech(question_details["Choices"]))
+    return title(question_type), speech_output, reprompt_text
+
+def answer_prompt(question_details):
+    """ Returns the card title, speech output and reprompt text that go over
+    the answer to a question the user has answered. """
+
+    if question_details["QuestionType"] == "SelectPart":
+        speech_output = "<speak>" + say('answer', answer=spoken_answer(question_details))
+    else:
+        speech_output = "<speak>" + say('answer_explained', answer=spoken_answer(question_details),
+                                        explanation=question_details["FullAnswer"])
+    speech_output += PAUSE + " " + say('another_question') + " </speak>"
+    return title('answer'), speech_output, say('answer_reprompt')
+
 def check_answer_in_session(intent, session):
     """ Takes in user's answer to question, checks answer, and preps
     output speech to tell user if they are correct or not.
     """
 
-    card_title = "Answer Response"
+    card_title = title('answer')
     session_user = session.get('user', {})
     user_id = session_user['userId']
 
-    positive_feedback_responses = [
-        "Nice work!",
-        "Great job!",
-        "Good job!",
-        "Nice job!",
-        "Very good!",
-        "Great work!",
-        "Good work!",
-        "Awesome work!",
-        "Superb!",
-        "Excellent!",
-        "Fantastic!",
-        "Bullseye!",
-        "Right on the money!",
-        "Well done!",
-        "Keep it up!",
-        "Way to go!",
-        "Nicely done!",
-        "Good answer!",
-        "Nice one!",
-        "Outstanding!"
-    ]
-    more_question_responses = [
-        "Would you like another question?",
-        "Do you want another question?",
-        "Do you want to try another one?",
-        "Would you like to try another one?",
-        "Would you like a new question?",
-        "Do you want a new question?",
-    ]
+    phrases = get_phrases()
 
     # Check if there's no value provided for the answer in the JSON request.
     # If there is a value provided, but it's not a valid answer, then that
@@ -1140,153 +987,207 @@ def check_answer_in_session(intent, session):
 
     # User's answer is checked depending on the type of question they're
     # answering and given feedback about whether they are correct/incorrect.
+    # Counter writes are not needed for the response, so they are deferred
+    # until it is ready.
     question_details = session.get('attributes', {})
-    if question_details["QuestionType"] == "TrueFalse":
-        if user_answer == "true" or user_answer == "false":
-            if (question_details["PartialAnswer"] == "true") \
-                and (user_answer == "true"):
-                speech_output = (
-                    "<speak>" + '"<prosody rate="90%" pitch="high">"'+ random.choice(positive_feedback_responses) +
-                    "</prosody>" + " True is correct. " +
-                    question_details["FullAnswer"] + '"<break time="0.75s"/>"' + " " +
-                    random.choice(more_question_responses) + "</speak>"
-                )
-                card_output = card_text_format(speech_output)
-                increment_question_correct(user_id, question_details["QuestionAttribute"])
-            elif (question_details["PartialAnswer"] == "false") \
-                and (user_answer == "false"):
-                speech_output = (
-                    "<speak>" + '"<prosody rate="90%" pitch="high">"'+ random.choice(positive_feedback_responses) +
-                    "</prosody>" + " False is correct. " +
-                    question_details["FullAnswer"] + '"<break time="0.75s"/>"' + " " +
-                    random.choice(more_question_responses) + "</speak>"
-                )
-                card_output = card_text_format(speech_output)
-                increment_question_correct(user_id, question_details["QuestionAttribute"])
-            elif (question_details["PartialAnswer"] == "true") \
-                and (user_answer == "false"):
-                speech_output = (
-                    "<speak>" + "Sorry, the correct answer is True. " +
-                    question_details["FullAnswer"] + " " +
-                    random.choice(more_question_responses) + "</speak>"
-                )
-                card_output = card_text_format(speech_output)
-                increment_question_incorrect(user_id, question_details["QuestionAttribute"])
-            elif (question_details["PartialAnswer"] == "false") \
-                and (user_answer == "true"):
-                speech_output = (
-                    "<speak>" + "Sorry, the correct answer is False. " +
-                    question_details["FullAnswer"] + " " +
-                    random.choice(more_question_responses) + "</speak>"
-                )
-                card_output = card_text_format(speech_output)
-                increment_question_incorrect(user_id, question_details["QuestionAttribute"])
+    question_type = question_details["QuestionType"]
+    correct = grade_answer(question_details, user_answer)
+    if correct is None:
+        speech_output = (
+            "<speak>" + phrases['invalid_answers'][question_type] + " " + PAUSE +
+            say('another_question') + " </speak>"
+        )
+    elif correct:
+        if question_type == "SelectPart":
+            speech_output = (
+                "<speak>" + praise() + " " +
+                say('select_part_correct', answer=question_details["Answer"]) + " " + PAUSE +
+                say('another_question') + " </speak>"
+            )
         else:
             speech_output = (
-                "<speak>" + "Sorry, your answer is invalid. For a true or false question, " +
-                "please make sure your answer is either true or false. " + '"<break time="0.75s"/>"' +
-                "Would you like another question? </speak>"
+                "<speak>" + praise() + " " +
+                say('correct', answer=spoken_answer(question_details),
+                    explanation=question_details["FullAnswer"]) + PAUSE + " " +
+                random.choice(phrases['more_questions']) + "</speak>"
+            )
+        defer(increment_question_correct, user_id, question_details["QuestionAttribute"],
+              question_type)
+    else:
+        if question_type == "SelectPart":
+            speech_output = (
+                "<speak>" + say('incorrect') + " " + PAUSE + " " +
+                say('answer', answer=question_details["Answer"]) + " " +
+                say('another_question') + " </speak>"
             )
-            card_output = card_text_format(speech_output)
-    elif question_details["QuestionType"] == "SelectPart":
-        user_answer = user_answer.replace("&", "and")
-        if (
-                user_answer == "counter up" or
-                user_answer == "CTU" or
-                user_answer == "counter down" or
-                user_answer == "CTD" or
-                user_answer == "both" or
-                user_answer == "both counter up and counter down" or
-                user_answer == "both CTUandC TD"
-        ):
-            if (question_details['Answer'] == "CTU")\
-            and (user_answer == "counter up" or user_answer == "CTU"):
-                speech_output = (
-                    "<speak>" + '"<prosody rate="90%" pitch="high">"'+ random.choice(positive_feedback_responses) +
-                    "</prosody>" + " CTU is the correct answer. " + '"<break time="0.75s"/>"' +
-                    "Would you like another question? </speak>"
-                )
-                card_output = card_text_format(speech_output)
-                increment_question_correct(user_id, question_details["QuestionAttribute"])
-            elif (question_details['Answer'] == "CTD")\
-            and (user_answer == "counter down" or user_answer == "CTD"):
-                speech_output = (
-                    "<speak>" + '"<prosody rate="90%" pitch="high">"'+ random.choice(positive_feedback_responses) +
-                    "</prosody>" + " CTD is the correct answer. " + '"<break time="0.75s"/>"' +
-                    "Would you like another question? </speak>"
-                )
-                card_output = card_text_format(speech_output)
-                increment_question_correct(user_id, question_details["QuestionAttribute"])
-            elif (question_details['Answer'] == "Both")\
-            and (user_answer == "both" or user_answer == "both counter up and counter down"\
-                or user_answer == "both CTUandC TD"):
-                speech_output = (
-                    "<speak>" + '"<prosody rate="90%" pitch="high">"'+ random.choice(positive_feedback_responses) +
-                    "</prosody>" + " Both is the correct answer. " + '"<break time="0.75s"/>"' +
-                    "Would you like another question? </speak>"
-                )
-                card_output = card_text_format(speech_output)
-                increment_question_correct(user_id, question_details["QuestionAttribute"])
-            else:
-                speech_output = (
-                    "<speak>" + "Sorry, your answer is incorrect. " + '"<break time="0.75s"/>"' +
-                    " The correct answer is " + question_details['Answer'] + ". " +
-                    "Would you like another question? </speak>"
-                )
-                card_output = card_text_format(speech_output)
-                increment_question_incorrect(user_id, question_details["QuestionAttribute"])
         else:
             speech_output = (
-                "<speak>" + "Sorry, your answer is invalid. Please make sure to pick one of the " +
-                "listed options for a select instruction question. " + '"<break time="0.75s"/>"' +
-                "Would you like another question? </speak>"
+                "<speak>" +
+                say('sorry_answer_explained', answer=spoken_answer(question_details),
+                    explanation=question_details["FullAnswer"]) + " " +
+                random.choice(phrases['more_questions']) + "</speak>"
             )
-            card_output = card_text_format(speech_output)
-    reprompt_text = "I didn't quite catch that. Can you repeat your answer?"
+        defer(increment_question_incorrect, user_id, question_details["QuestionAttribute"],
+              question_type)
+    card_output = card_text_format(speech_output)
+    reprompt_text = say('answer_reprompt')
     should_end_session = False
 
+    # The question is kept aside, out of reach of another answer, so that
+    # repeating the response can go over its answer.
     session_attributes = {
-        "CardTitle": card_title,
-        "SpeechOutput": speech_output,
-        "RepromptText": reprompt_text,
         "CurrentStage": "CheckAnswer",
-        "QuestionType": question_details["QuestionType"]
+        "QuestionType": question_details["QuestionType"],
+        "AnsweredQuestion": {field: question_details[field] for field in QUESTION_FIELDS
+                             if field in question_details}
+    }
+    carry_over(question_details, session_attributes)
+
+    return build_response(session_attributes, build_speechlet_response(
+        card_title, speech_output, card_output, reprompt_text, should_end_session))
+
+def handle_quiz_round_request(intent, session):
+    """ Starts a round of several questions. The whole round is generated up
+    front and kept in the session attributes, each answer is graded without
+    touching storage, and the results are saved in one write at the end.
+    The number of questions comes from the optional Count slot. """
+
+    card_title = title('quiz_round')
+    session_user = session.get('user', {})
+    user_id = session_user['userId']
+    previous_attributes = session.get('attributes') or {}
+
+    user = get_user_store().get_user(user_id)
+    if user is None:
+        add_user(user_id)
+        user = new_user_item(user_id)
+
+    try:
+        question_count = int(intent['slots']['Count']['value'])
+    except (KeyError, TypeError, ValueError):
+        question_count = previous_attributes.get("QuizRoundSize", QUIZ_ROUND_DEFAULT_QUESTIONS)
+    question_count = min(max(question_count, 1), QUIZ_ROUND_MAX_QUESTIONS)
+
+    recent = RecentQuestions.from_session(previous_attributes)
+    questions = generate_quiz_round(user, question_count, recent)
+
+    speech_output = (
+        "<speak>" + say('round_start', count=question_count) + " " + PAUSE +
+        say('question_number', number=1) + " " + question_speech(questions[0]) + "</speak>"
+    )
+    card_output = card_text_format(speech_output)
+    reprompt_text = say('question_reprompt', question=question_speech(questions[0]))
+    session_attributes = {
+        "CurrentStage": "QuizRound",
+        "QuizRoundSize": question_count,
+        "QuizRound": {
+            "Questions": questions,
+            "Results": []
+        },
+        RECENT_QUESTIONS_KEY: recent.to_session()
     }
+    should_end_session = False
+
+    return build_response(session_attributes, build_speechlet_response(
+        card_title, speech_output, card_output, reprompt_text, should_end_session))
+
+def handle_quiz_round_answer(intent, session, dont_know=False):
+    """ Grades the answer to the current question of a quiz round and asks the
+    next one, or ends the round with a summary once all are answered. Saying
+    "I don't know" counts as an incorrect answer. """
+
+    session_details = session.get('attributes', {})
+    quiz_round = session_details["QuizRound"]
+    questions = quiz_round["Questions"]
+    results = list(quiz_round["Results"])
+    question_details = questions[len(results)]
+
+    try:
+        user_answer = intent['slots']['Answer']['value']
+    except KeyError:
+        user_answer = "NoValue"
+    if user_answer is None:
+        user_answer = "NoValue"
+    correct = False if dont_know else grade_answer(question_details, user_answer)
+
+    speech_output = "<speak>"
+    if correct is None:
+        # Not a valid reply, so the same question is asked again.
+        speech_output += say('invalid_answer') + " " + question_speech(question_details)
+        speech_output += "</speak>"
+        card_title = title('quiz_round')
+        reprompt_text = say('question_reprompt', question=question_speech(question_details))
+        return build_response(dict(session_details), build_speechlet_response(
+            card_title, speech_output, card_text_format(speech_output), reprompt_text, False))
+
+    results.append(correct)
+    if correct:
+        speech_output += praise('round_positive_feedback') + " "
+    elif question_details["QuestionType"] == "SelectPart":
+        speech_output += say('sorry_answer', answer=question_details["Answer"]) + " "
+    else:
+        speech_output += say('sorry_answer_explained', answer=spoken_answer(question_details),
+                             explanation=question_details["FullAnswer"]) + " "
+    speech_output += PAUSE
+
+    if len(results) < len(questions):
+        next_question = questions[len(results)]
+        card_title = title('quiz_round')
+        speech_output += say('question_number', number=len(results) + 1) + " " + \
+            question_speech(next_question) + "</speak>"
+        card_output = card_text_format(speech_output)
+        reprompt_text = say('question_reprompt', question=question_speech(next_question))
+        session_attributes = dict(session_details)
+        session_attributes.update({
+            "QuizRound": {
+                "Questions": questions,
+                "Results": results
+            }
+        })
+    else:
+        # The round is over: everything it changed is saved in one write.
+        session_user = session.get('user', {})
+        defer(commit_quiz_round, session_user['userId'],
+              round_answers({"Questions": questions, "Results": results}))
+
+        card_title = title('quiz_round_summary')
+        right_answers = sum(1 for result in results if result)
+        speech_output += round_summary_speech(right_answers, len(questions)) + "</speak>"
+        card_output = say('round_score', right=right_answers, count=len(questions)) + "\n"
+        for question, result in zip(questions, results):
+            card_output += "\n" + say('round_right' if result else 'round_wrong',
+                                      question=question["Question"])
+        reprompt_text = say('round_reprompt')
+        session_attributes = {
+            "CurrentStage": "QuizRoundSummary",
+            "QuizRoundSize": len(questions),
+            "QuizRoundScore": right_answers
+        }
+        carry_over(session_details, session_attributes)
+    should_end_session = False
 
     return build_response(session_attributes, build_speechlet_response(
         card_title, speech_output, card_output, reprompt_text, should_end_session))
 
+def round_summary_speech(right_answers, question_count):
+    """ Returns the text that ends a quiz round. """
+
+    return say('round_summary', right=right_answers, count=question_count)
+
 def give_quiz_feedback(session):
     """ Provides feedback to the user after they finish a question session
     in the form of telling them what attribute(s) of question they got
     wrong the most, and asks if they want to review them. """
 
-    card_title = "Quiz Feedback"
+    card_title = title('quiz_feedback')
     session_user = session.get('user', {})
     user_id = session_user['userId']
 
     feedback_statements = get_attribute_feedback(user_id)
-    if "None" in feedback_statements:
-        speech_output = "<speak>" + feedback_statements["None"] + " "
-        speech_output += "Would you like me to quiz you again, "
-        speech_output += "tutor you, or would you like to end this study session? "
-        speech_output += "</speak>"
-        card_output = card_text_format(speech_output)
-        reprompt_text = "I didn't quite get that. Would you like me to quiz you, "\
-        + "tutor you, or would you like to end this study session?"
-    else:
-        speech_output = "<speak>" + "I think you should take a look at: "
-        for key in feedback_statements:
-            speech_output += feedback_statements[key] + ", and "
-        speech_output = speech_output.rstrip(", and")
-        speech_output += ". Would you like to review?" + "</speak>"
-        card_output = card_text_format(speech_output)
-        reprompt_text = "I didn't quite catch that. Would you like to review?"
+    speech_output, reprompt_text = feedback_prompt(feedback_statements)
+    card_output = card_text_format(speech_output)
 
     session_attributes = {
-        "CardTitle": card_title,
-        "SpeechOutput": speech_output,
-        "RepromptText": reprompt_text,
         "CurrentStage": "GiveQuizFeedback",
         "QuizFeedback": feedback_statements
     }
@@ -1295,55 +1196,69 @@ def give_quiz_feedback(session):
     return build_response(session_attributes, build_speechlet_response(
         card_title, speech_output, card_output, reprompt_text, should_end_session))
 
+def feedback_prompt(feedback_statements):
+    """ Returns the speech output and reprompt text that give quiz feedback. """
+
+    if "None" in feedback_statements:
+        speech_output = "<speak>" + feedback_statements["None"] + " " + say('feedback_next') + \
+            " </speak>"
+        reprompt_text = say('feedback_reprompt')
+    else:
+        attributes = say('feedback_separator').join(feedback_statements.values())
+        speech_output = "<speak>" + say('feedback_weakest', attributes=attributes) + "</speak>"
+        reprompt_text = say('review_reprompt')
+    return speech_output, reprompt_text
+
 def review_quiz_feedback(session):
     """ Provides the user with review for the material they're the weakest on. """
 
-    card_title = "Quiz Review"
+    card_title = title('quiz_review')
+    mark_active(session['user']['userId'])
 
-    speech_output = "<speak>"
     feedback_statements = session['attributes']["QuizFeedback"]
-    print(feedback_statements)
-    for key in feedback_statements:
-        tutoring_statements = get_tutoring_statement(attribute=key)
-        print(tutoring_statements)
-        for index in range(len(tutoring_statements)):
-            speech_output += tutoring_statements[index] + " "
-    speech_output = speech_output.rstrip(" ")
-    speech_output += '"<break time="0.75s"/>"'
-    speech_output += "Would you like me to quiz you again, "
-    speech_output += "tutor you, or would you like to end this study session? "
-    speech_output += "</speak>"
+    structured_log.debug("quiz_feedback", feedback_statements=feedback_statements)
+    all_tutoring_statements = [get_tutoring_statement(attribute=key)
+                               for key in feedback_statements]
+    speech_output, reprompt_text = review_prompt(all_tutoring_statements)
     card_output = card_text_format(speech_output)
-    reprompt_text = "I didn't quite get that. Would you like me to quiz you, "\
-        + "tutor you, or would you like to end this study session?"
 
     session_attributes = {
-        "CardTitle": card_title,
-        "SpeechOutput": speech_output,
-        "RepromptText": reprompt_text,
-        "CurrentStage": "ReviewQuizFeedback"
+        "CurrentStage": "ReviewQuizFeedback",
+        "QuizFeedback": feedback_statements
     }
     should_end_session = False
 
     return build_response(session_attributes, build_speechlet_response(
         card_title, speech_output, card_output, reprompt_text, should_end_session))
 
+def review_prompt(all_tutoring_statements):
+    """ Returns the speech output and reprompt text that review the tutoring
+    statements of the attributes given as feedback. """
+
+    speech_output = "<speak>"
+    for tutoring_statements in all_tutoring_statements:
+        structured_log.debug("review_statements", tutoring_statements=tutoring_statements)
+        for index in range(len(tutoring_statements)):
+            speech_output += tutoring_statements[index] + " "
+    speech_output = speech_output.rstrip(" ")
+    speech_output += PAUSE + say('feedback_next') + " </speak>"
+    reprompt_text = say('feedback_reprompt')
+    return speech_output, reprompt_text
+
 def handle_tutor_request(intent, session):
     """ Provides tutoring information output. """
 
-    card_title = "Teaching Counter Instructions"
+    card_title = title('tutoring')
     session_user = session.get('user', {})
     user_id = session_user['userId']
+    mark_active(user_id)
 
-    tutoring_intro = [
-        "Let's begin!",
-        "Let's get started!"
-    ]
-
-    current_statement_level = get_statement_level(user_id)
-    current_order_level = get_order_level(user_id)
-    max_order_level = get_max_order_levels(current_statement_level)
+    current_statement_level, current_order_level = get_tutoring_status(user_id)
     max_statement_level = get_max_statement_level()
+    max_order_level = get_max_order_levels(current_statement_level)
+    session_attributes = {
+        "CurrentStage": "Tutoring"
+    }
 
     if current_statement_level <= max_statement_level:
         # This if statement essentially loops through all the orders of
@@ -1354,32 +1269,23 @@ def handle_tutor_request(intent, session):
                 current_order_level
             )
             increment_order_level(user_id)
-            speech_output = "<speak>"
+            intro = None
             if current_statement_level == 1 and current_order_level == 1:
-                speech_output += random.choice(tutoring_intro) + " "
-            for index in range(len(tutoring_statement)):
-                speech_output += tutoring_statement[index] + " "
-            speech_output += '"<break time="0.75s"/>"'
-            if max_order_level - current_order_level == 0:
-                speech_output += "There are no statements left in this level. "
-                speech_output += "Would you like me to go to the next statement level, or repeat this statement?"
-                reprompt_text = "I didn't quite catch that. Would you like me "\
-                    + "to go to the next tutoring statement level, or repeat this statement?"
-            else:
-                speech_output += "There are " + str(max_order_level-current_order_level) + " statements left. "
-                speech_output += "Would you like me to go to the next statement, or repeat this statement?"
-                reprompt_text = "I didn't quite catch that. Would you like me to go to the "\
-                    + "next tutoring statement, or repeat this statement?"
-            speech_output += "</speak>"
+                intro = random.randrange(len(get_phrases()['tutoring_intros']))
+            speech_output, reprompt_text = tutoring_prompt(
+                tutoring_statement, max_order_level - current_order_level, intro)
             card_output = card_text_format(speech_output)
+            session_attributes["TutoringStep"] = [
+                int(current_statement_level), int(current_order_level),
+                int(max_order_level - current_order_level), intro]
         else:
             # If we've reached the max order, then we know we have to
             # move the statement level up by 1, so we do that and
             # reset the order to start from the beginning.
-            reset_order_level(user_id)
-            increment_statement_level(user_id)
-            current_statement_level = get_statement_level(user_id)
-            current_order_level = get_order_level(user_id)
+            get_user_store().update(user_id,
+                values={('TutoringStatus', 'OrderLevel'): 1},
+                deltas={('TutoringStatus', 'StatementLevel'): 1})
+            current_statement_level, current_order_level = get_tutoring_status(user_id)
             max_order_level = get_max_order_levels(current_statement_level)
             # This particular if statement is for checking if we've reached
             # the max level, which signifies the end of the tutoring session
@@ -1390,62 +1296,72 @@ def handle_tutor_request(intent, session):
                         current_order_level
                     )
                     increment_order_level(user_id)
-                    speech_output = "<speak>"
-                    for index in range(len(tutoring_statement)):
-                        speech_output += tutoring_statement[index] + " "
-                    speech_output += '"<break time="0.75s"/>"'
-                    if max_order_level - current_order_level == 0:
-                        speech_output += "There are no statements left in this level. "
-                        speech_output += "Would you like me to go to the next statement level, or repeat this statement?"
-                        reprompt_text = "I didn't quite catch that. Would you like me "\
-                            + "to go to the next tutoring statement level, or repeat this statement?"
-                    else:
-                        speech_output += "There are " + str(max_order_level-current_order_level) + " statements left. "
-                        speech_output += "Would you like me to go to the next statement, or repeat this statement?"
-                        reprompt_text = "I didn't quite catch that. Would you like me to go to the "\
-                            + "next tutoring statement, or repeat this statement?"
-                    speech_output += "</speak>"
+                    speech_output, reprompt_text = tutoring_prompt(
+                        tutoring_statement, max_order_level - current_order_level)
                     card_output = card_text_format(speech_output)
+                    session_attributes["TutoringStep"] = [
+                        int(current_statement_level), int(current_order_level),
+                        int(max_order_level - current_order_level), None]
             else:
                 reset_statement_level(user_id)
                 reset_order_level(user_id)
-                speech_output = (
-                    "<speak>" + "You've reached the end of the tutoring session. Great work! " +
-                    "Would you like me to quiz you now, tutor you again, or would you like to end this study session?" +
-                    "</speak>"
-                )
+                speech_output, reprompt_text = tutoring_end_prompt()
                 card_output = card_text_format(speech_output)
-                reprompt_text = "I didn't quite catch that. Would you like me to tutor you again, "\
-                    + ", quiz you, or would you like to end this study session?"
 
-    session_attributes = {
-        "CardTitle": card_title,
-        "SpeechOutput": speech_output,
-        "RepromptText": reprompt_text,
-        "CurrentStage": "Tutoring"
-    }
     should_end_session = False
 
     return build_response(session_attributes, build_speechlet_response(
         card_title, speech_output, card_output, reprompt_text, should_end_session))
 
+def tutoring_prompt(tutoring_statement, statements_left, intro=None):
+    """ Returns the speech output and reprompt text that give a tutoring
+    statement and say how many are left in its level, starting with the
+    tutoring intro at index intro if there is one. """
+
+    speech_output = "<speak>"
+    if intro is not None:
+        speech_output += get_phrases()['tutoring_intros'][intro] + " "
+    for index in range(len(tutoring_statement)):
+        speech_output += tutoring_statement[index] + " "
+    speech_output += PAUSE
+    if statements_left == 0:
+        speech_output += say('tutoring_level_done')
+        reprompt_text = say('tutoring_level_done_reprompt')
+    else:
+        speech_output += say('tutoring_statements_left', count=statements_left)
+        reprompt_text = say('tutoring_statements_left_reprompt')
+    speech_output += "</speak>"
+    return speech_output, reprompt_text
+
+def tutoring_end_prompt():
+    """ Returns the speech output and reprompt text that end tutoring. """
+
+    speech_output = "<speak>" + say('tutoring_end') + "</speak>"
+    reprompt_text = say('tutoring_end_reprompt')
+    return speech_output, reprompt_text
+
+def get_still_processing_response(session):
+    """ Answers a retried request whose first attempt is still being
+    handled. The session stays where it was, so the user can simply say
+    their reply again. """
+
+    card_title = title('still_processing')
+    speech_output = "<speak> " + say('still_processing') + " </speak>"
+    card_output = card_text_format(speech_output)
+    reprompt_text = say('still_processing_reprompt')
+    should_end_session = False
+
+    return build_response(dict(session.get('attributes') or {}), build_speechlet_response(
+        card_title, speech_output, card_output, reprompt_text, should_end_session))
+
 def get_options_menu():
     """ A voice-based options menu. """
 
-    card_title = "What would you like to do?"
-
-    speech_output = (
-        "<speak> Would you like me to quiz you, tutor you, " +
-        "or would you like to end this study session? </speak>"
-    )
+    card_title = title('options_menu')
+    speech_output, reprompt_text = options_menu_prompt()
     card_output = card_text_format(speech_output)
-    reprompt_text = "I didn't quite get that. Would you like me to quiz you, "\
-        + "tutor you, or do you want to end this study session?"
 
     session_attributes = {
-        "CardTitle": card_title,
-        "SpeechOutput": speech_output,
-        "RepromptText": reprompt_text,
         "CurrentStage": "OptionsMenu"
     }
     should_end_session = False
@@ -1453,36 +1369,101 @@ def get_options_menu():
     return build_response(session_attributes, build_speechlet_response(
         card_title, speech_output, card_output, reprompt_text, should_end_session))
 
+def options_menu_prompt():
+    """ Returns the speech output and reprompt text of the options menu. """
+
+    speech_output = "<speak> " + say('options_menu') + " </speak>"
+    reprompt_text = say('options_menu_reprompt')
+    return speech_output, reprompt_text
+
 def handle_dont_know(session):
     session_user = session.get('user', {})
     user_id = session_user['userId']
 
     question_details = session.get('attributes', {})
-    increment_question_incorrect(user_id, question_details["QuestionAttribute"])
+    defer(increment_question_incorrect, user_id, question_details["QuestionAttribute"],
+          question_details["QuestionType"])
+
+# --------------- Repeating the previous response --------------- #
+
+def repeat_welcome(session_details):
+    return (title('welcome'),) + welcome_prompt(returning=not session_details.get("NewUser"))
+
+def repeat_answer(session_details):
+    return answer_prompt(session_details["AnsweredQuestion"])
+
+def repeat_help(session_details):
+    return (title('help'), help_speech(session_details["HelpStage"], session_details),
+            say('help_reprompt'))
+
+def repeat_feedback(session_details):
+    return (title('quiz_feedback'),) + feedback_prompt(session_details["QuizFeedback"])
+
+def repeat_options_menu(session_details):
+    return (title('options_menu'),) + options_menu_prompt()
+
+def repeat_tutoring(session_details):
+    if "TutoringStep" not in session_details:
+        return (title('tutoring'),) + tutoring_end_prompt()
+    statement_level, order_level, statements_left, intro = session_details["TutoringStep"]
+    tutoring_statement = get_content().catalog().tutoring_statement(statement_level, order_level)
+    return (title('tutoring'),) + \
+        tutoring_prompt(tutoring_statement, statements_left, intro)
+
+def repeat_review(session_details):
+    catalog = get_content().catalog()
+    return (title('quiz_review'),) + review_prompt(
+        [catalog.attribute_tutoring_statement(key) for key in session_details["QuizFeedback"]])
+
+def repeat_quiz_round(session_details):
+    quiz_round = session_details["QuizRound"]
+    question_num = len(quiz_round["Results"])
+    question_details = quiz_round["Questions"][question_num]
+    speech_output = "<speak>" + say('question_number', number=question_num + 1) + " " + \
+        question_speech(question_details) + "</speak>"
+    return title('quiz_round'), speech_output, \
+        say('question_reprompt', question=question_speech(question_details))
+
+def repeat_round_summary(session_details):
+    speech_output = "<speak>" + round_summary_speech(
+        session_details["QuizRoundScore"], session_details["QuizRoundSize"]) + "</speak>"
+    return title('quiz_round_summary'), speech_output, say('round_reprompt')
+
+# Stage -> function rendering the card title, speech output and reprompt text
+# of the response that led to the stage, for repeating it.
+REPEAT_PROMPTS = {
+    "WelcomeResponse": repeat_welcome,
+    "GenerateQuestion": question_prompt,
+    "CheckAnswer": repeat_answer,
+    "HelpRequest": repeat_help,
+    "GiveQuizFeedback": repeat_feedback,
+    "ReviewQuizFeedback": repeat_review,
+    "Tutoring": repeat_tutoring,
+    "OptionsMenu": repeat_options_menu,
+    "QuizRound": repeat_quiz_round,
+    "QuizRoundSummary": repeat_round_summary
+}
 
 # --------------- Events ------------------
 
 def on_session_started(session_started_request, session):
     """ Called when the session starts """
 
-    print("on_session_started requestId=" + session_started_request['requestId']
-          + ", sessionId=" + session['sessionId'])
+    structured_log.info("session_started", sessionId=session['sessionId'])
 
 def on_launch(launch_request, session):
     """ Called when the user launches the skill without specifying what they
     want
     """
 
-    print("on_launch requestId=" + launch_request['requestId'] +
-          ", sessionId=" + session['sessionId'])
+    structured_log.info("launch", sessionId=session['sessionId'])
     # Dispatch to your skill's launch
     return get_welcome_response(session)
 
 def on_intent(intent_request, session):
     """ Called when the user specifies an intent for this skill """
 
-    print("on_intent requestId=" + intent_request['requestId'] +
-          ", sessionId=" + session['sessionId'])
+    structured_log.info("intent", sessionId=session['sessionId'])
 
     intent = intent_request['intent']
     intent_name = intent_request['intent']['name']
@@ -1492,7 +1473,11 @@ def on_intent(intent_request, session):
         return handle_tutor_request(intent, session)
     elif intent_name == "QuestionIntent":
         return get_question_from_session(intent, session)
+    elif intent_name == "QuizRoundIntent":
+        return handle_quiz_round_request(intent, session)
     elif intent_name == "AnswerIntent":
+        if session.get('attributes', {}).get('CurrentStage') == "QuizRound":
+            return handle_quiz_round_answer(intent, session)
         return check_answer_in_session(intent, session)
     elif intent_name == "AMAZON.HelpIntent":
         return handle_help_request(intent, session)
@@ -1508,6 +1493,8 @@ def on_intent(intent_request, session):
         if session['attributes']['CurrentStage'] == "GenerateQuestion":
             handle_dont_know(session)
             return get_question_from_session(intent, session)
+        elif session['attributes']['CurrentStage'] == "QuizRound":
+            return handle_quiz_round_answer(intent, session, dont_know=True)
     elif intent_name == "AMAZON.YesIntent":
         if session['attributes']['CurrentStage'] == "CheckAnswer":
             return get_question_from_session(intent, session)
@@ -1515,6 +1502,8 @@ def on_intent(intent_request, session):
             return get_question_from_session(intent, session)
         elif session['attributes']['CurrentStage'] == "GiveQuizFeedback":
             return review_quiz_feedback(session)
+        elif session['attributes']['CurrentStage'] == "QuizRoundSummary":
+            return handle_quiz_round_request(intent, session)
     elif intent_name == "AMAZON.NoIntent":
         if session['attributes']['CurrentStage'] == "CheckAnswer":
             return give_quiz_feedback(session)
@@ -1522,7 +1511,10 @@ def on_intent(intent_request, session):
             return get_options_menu()
         elif session['attributes']['CurrentStage'] == "GiveQuizFeedback":
             return get_options_menu()
+        elif session['attributes']['CurrentStage'] == "QuizRoundSummary":
+            return give_quiz_feedback(session)
     elif intent_name == "AMAZON.CancelIntent" or intent_name == "AMAZON.StopIntent":
+        commit_interrupted_round(session)
         return handle_session_end_request(session)
     else:
         raise ValueError("Invalid intent")
@@ -1532,9 +1524,54 @@ def on_session_ended(session_ended_request, session):
 
     Is not called when the skill returns should_end_session=true
     """
-    print("on_session_ended requestId=" + session_ended_request['requestId'] +
-          ", sessionId=" + session['sessionId'])
-    # add cleanup logic here
+    structured_log.info("session_ended", sessionId=session['sessionId'],
+                        reason=session_ended_request.get('reason'))
+    commit_interrupted_round(session)
+
+# --------------- Session state ------------------
+
+def load_session_state(session, catalog):
+    """ Returns a copy of the session with its attributes decoded from their
+    compact form. Raises SessionStateError if they cannot be. """
+
+    return dict(session, attributes=session_state.decode(session.get('attributes'), catalog))
+
+def save_session_state(response, catalog):
+    """ Encodes the session attributes of a response in their compact form. """
+
+    if response is not None:
+        response['sessionAttributes'] = session_state.encode(
+            response['sessionAttributes'], catalog)
+    return response
+
+def respond_after_writes(response):
+    """ Applies the writes deferred while building response, as far as the
+    time left allows, then returns it. A failed or dropped write is logged
+    but never fails the turn, so Alexa does not retry it. """
+
+    run_deferred()
+    return response
+
+# --------------- Container initialization ------------------
+
+def init_storage():
+    """ Sets up rate limiting for the DynamoDB tables the skill uses, so the
+    first request does not wait on describing them. Only the default
+    locale's content tables are described: each locale's content is read
+    once per container, so the other locales' tables are only limited by
+    the capacity TUTOR_TABLE_CAPACITY gives them, and adding a locale adds
+    nothing to a cold start. """
+
+    table_names = []
+    if os.environ.get('TUTOR_USER_STORE', 'dynamodb') == 'dynamodb':
+        table_names += [USER_TABLE_NAME, REQUEST_LOG_TABLE_NAME]
+    if os.environ.get('TUTOR_CONTENT_SOURCE', 'dynamodb') == 'dynamodb':
+        table_names += CONTENT_TABLE_NAMES
+    dynamodb_access.load_capacity(table_names)
+
+# Lambda runs module level code once per container, before its first request.
+if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
+    init_storage()
 
 # --------------- Main handler ------------------
 
@@ -1542,8 +1579,12 @@ def lambda_handler(event, context):
     """ Route the incoming request based on type (LaunchRequest, IntentRequest,
     etc.) The JSON body of the request is provided in the event parameter.
     """
-    print("event.session.application.applicationId=" +
-          event['session']['application']['applicationId'])
+    # Log records of the request are written together once it is finished.
+    request = event['request']
+    request_log = structured_log.start_request(
+        request.get('requestId'), request.get('type'), (request.get('intent') or {}).get('name'),
+        event['session'].get('user', {}).get('userId'))
+    structured_log.debug("application", applicationId=event['session']['application']['applicationId'])
 
     """
     Uncomment this if statement and populate with your skill's application ID to
@@ -1551,15 +1592,51 @@ def lambda_handler(event, context):
     function.
     """
     if (event['session']['application']['applicationId'] != "amzn1.ask.skill.c32dfdf8-721b-4772-a801-98941de04300"):
+        structured_log.warning("invalid_application",
+                               applicationId=event['session']['application']['applicationId'])
+        structured_log.finish_request(request_log)
         raise ValueError("Invalid Application ID")
 
-    if event['session']['new']:
-        on_session_started({'requestId': event['request']['requestId']},
-                           event['session'])
+    # Content and phrases come from the request's locale.
+    locales.set_current_locale(request.get('locale'))
 
-    if event['request']['type'] == "LaunchRequest":
-        return on_launch(event['request'], event['session'])
-    elif event['request']['type'] == "IntentRequest":
-        return on_intent(event['request'], event['session'])
-    elif event['request']['type'] == "SessionEndedRequest":
-        return on_session_ended(event['request'], event['session'])
+    # Writes deferred while a response is built run once it is ready.
+    deadline = start_request(context)
+    try:
+        if event['session']['new']:
+            on_session_started({'requestId': event['request']['requestId']},
+                               event['session'])
+
+        # The session attributes refer to content by index. If the content
+        # changed since they were saved they no longer mean anything, and the
+        # user is offered the options menu unless they are leaving.
+        catalog = get_content().catalog()
+        try:
+            session = load_session_state(event['session'], catalog)
+        except SessionStateError as error:
+            structured_log.warning("session_state_discarded", error=str(error))
+            session = dict(event['session'], attributes={})
+            if event['request']['type'] == "IntentRequest" and event['request']['intent']['name'] \
+                    not in ("AMAZON.CancelIntent", "AMAZON.StopIntent"):
+                return save_session_state(get_options_menu(), catalog)
+
+        # Launch and intent requests change user data, so a retried request gets
+        # the response of its first attempt instead of being handled again.
+        still_processing = lambda: save_session_state(get_still_processing_response(session), catalog)
+        if event['request']['type'] == "LaunchRequest":
+            return get_deduplicator().run_once(event['request']['requestId'],
+                lambda: respond_after_writes(save_session_state(on_launch(event['request'], session), catalog)),
+                still_processing)
+        elif event['request']['type'] == "IntentRequest":
+            return get_deduplicator().run_once(event['request']['requestId'],
+                lambda: respond_after_writes(save_session_state(on_intent(event['request'], session), catalog)),
+                still_processing)
+        elif event['request']['type'] == "SessionEndedRequest":
+            return respond_after_writes(on_session_ended(event['request'], session))
+    except Exception as error:
+        structured_log.error("request_failed", error=repr(error))
+        raise
+    finally:
+        finish_request(deadline)
+        locales.set_current_locale(None)
+        structured_log.finish_request(request_log)
@@ -0,0 +1,274 @@
+"""
+Class-wide analytics over every user's answer counters.
+
+Streams every user item from the user store (a parallel scan on DynamoDB)
+into NumPy arrays of users x attributes and writes them as a columnar export
+directory:
+
+    attributes.json       attribute names, in column order
+    user_ids.txt          one user id per line, in row order
+    correct.npy           correct answers, users x attributes
+    incorrect.npy         incorrect answers, users x attributes
+    level.npy             question level of each user
+    last_active.npy       day each user was last active (-1 if unknown)
+    summary.json          the statistics below
+
+The counter arrays are stored column-major, so each attribute's column is
+contiguous on disk and can be memory mapped on its own. Users are gathered in
+chunks of CHUNK_USERS, each saved as soon as it is full to a temporary
+directory of the run's own inside the export directory, and the
+statistics are computed from memory maps one attribute (or block of users)
+at a time, so memory stays bounded however many users there are.
+
+For every attribute the summary holds answer totals, the overall error rate,
+how many users answered about it and percentiles of their individual error
+rates. It also holds the distribution of question levels and percentiles of
+answers per user.
+
+    python analytics_export.py --output export/
+    python analytics_export.py --backend sqlite --path llptutor_userdata.db --output export/
+"""
+
+import os
+import sys
+import json
+import glob
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from leveling import MAX_LEVEL
+from user_store import (SQLiteUserStore, DynamoDBUserStore, USER_TABLE_NAME, DEFAULT_SQLITE_PATH,
+                        DEFAULT_SCAN_SEGMENTS)
+
+# Users gathered in memory before a chunk is written out.
+CHUNK_USERS = 65536
+
+# Users summed at a time when totalling answers per user.
+ROW_BLOCK = 65536
+
+PERCENTILES = [10, 25, 50, 75, 90]
+
+EXPORT_FIELDS = ['CounterCorrect', 'CounterIncorrect', 'QuestionLevel', 'LastActive']
+
+# --------------- Gathering --------------- #
+
+class ChunkWriter(object):
+    """ Collects user items into chunks of arrays saved under chunk_directory,
+    and their ids into user_ids_path. Attributes get a column the first time
+    any user has answered about them, so chunks written earlier may have
+    fewer columns. """
+
+    def __init__(self, chunk_directory, user_ids_path, chunk_users=CHUNK_USERS):
+        self.chunk_directory = chunk_directory
+        self.chunk_users = chunk_users
+        self.attributes = {}
+        self.users = 0
+        self.chunks = 0
+        self._user_ids = open(user_ids_path, 'w')
+        self._reset()
+
+    def _reset(self):
+        self._correct = []
+        self._incorrect = []
+        self._levels = []
+        self._last_active = []
+
+    def _columns(self, counters):
+        # (column, count) pairs for a counter map.
+        columns = []
+        for attribute, count in counters.items():
+            if count:
+                column = self.attributes.setdefault(attribute, len(self.attributes))
+                columns.append((column, int(count)))
+        return columns
+
+    def add(self, item):
+        self._user_ids.write(item['UserID'] + "\n")
+        self._correct.append(self._columns(item.get('CounterCorrect', {})))
+        self._incorrect.append(self._columns(item.get('CounterIncorrect', {})))
+        self._levels.append(int(item.get('QuestionLevel', 1)))
+        self._last_active.append(int(item.get('LastActive', -1)))
+        self.users += 1
+        if len(self._levels) >= self.chunk_users:
+            self.flush()
+
+    def _matrix(self, rows):
+        matrix = np.zeros((len(rows), len(self.attributes)), dtype=np.uint32)
+        for row, columns in enumerate(rows):
+            for column, count in columns:
+                matrix[row, column] = count
+        return matrix
+
+    def flush(self):
+        if not self._levels:
+            return
+        prefix = os.path.join(self.chunk_directory, 'chunk_%05d_' % self.chunks)
+        np.save(prefix + 'correct.npy', self._matrix(self._correct))
+        np.save(prefix + 'incorrect.npy', self._matrix(self._incorrect))
+        np.save(prefix + 'level.npy', np.array(self._levels, dtype=np.uint8))
+        np.save(prefix + 'last_active.npy', np.array(self._last_active, dtype=np.int32))
+        self.chunks += 1
+        self._reset()
+
+    def close(self):
+        self.flush()
+        self._user_ids.close()
+
+def combine_chunks(chunk_directory, directory, users, attribute_count):
+    """ Joins the chunk files in chunk_directory into the final arrays in
+    directory, padding the columns of attributes that first appeared after a
+    chunk was written, and removes the chunks. """
+
+    shape = (users, attribute_count)
+    combined = {
+        'correct': np.lib.format.open_memmap(os.path.join(directory, 'correct.npy'), mode='w+',
+                                             dtype=np.uint32, shape=shape, fortran_order=True),
+        'incorrect': np.lib.format.open_memmap(os.path.join(directory, 'incorrect.npy'), mode='w+',
+                                               dtype=np.uint32, shape=shape, fortran_order=True),
+        'level': np.lib.format.open_memmap(os.path.join(directory, 'level.npy'), mode='w+',
+                                           dtype=np.uint8, shape=(users,)),
+        'last_active': np.lib.format.open_memmap(os.path.join(directory, 'last_active.npy'),
+                                                 mode='w+', dtype=np.int32, shape=(users,))
+    }
+    row = 0
+    for prefix in sorted(set(path[:-len('level.npy')] for path in
+                             glob.glob(os.path.join(chunk_directory, 'chunk_*_level.npy')))):
+        size = 0
+        for name, array in combined.items():
+            chunk = np.load(prefix + name + '.npy')
+            size = len(chunk)
+            if chunk.ndim == 2:
+                array[row:row + size, :chunk.shape[1]] = chunk
+                array[row:row + size, chunk.shape[1]:] = 0
+            else:
+                array[row:row + size] = chunk
+            os.remove(prefix + name + '.npy')
+        row += size
+    for array in combined.values():
+        array.flush()
+    return combined
+
+# --------------- Statistics --------------- #
+
+def attribute_statistics(correct, incorrect, attributes, percentiles=PERCENTILES):
+    """ Returns per-attribute statistics, worst error rate first, computed
+    one column at a time. """
+
+    statistics = []
+    for column, attribute in enumerate(attributes):
+        column_correct = np.asarray(correct[:, column], dtype=np.int64)
+        column_incorrect = np.asarray(incorrect[:, column], dtype=np.int64)
+        answers = column_correct + column_incorrect
+        answered = answers > 0
+        user_error_rates = column_incorrect[answered] / answers[answered]
+        total_answers = int(answers.sum())
+        statistics.append({
+            'attribute': attribute,
+            'correct': int(column_correct.sum()),
+            'incorrect': int(column_incorrect.sum()),
+            'error_rate': float(column_incorrect.sum()) / total_answers if total_answers else None,
+            'users_answered': int(answered.sum()),
+            'user_error_rate_percentiles': dict(zip(
+                (str(percentile) for percentile in percentiles),
+                np.percentile(user_error_rates, percentiles).tolist()
+                if len(user_error_rates) else [None] * len(percentiles)))
+        })
+    statistics.sort(key=lambda entry: -1 if entry['error_rate'] is None else entry['error_rate'],
+                    reverse=True)
+    return statistics
+
+def answers_per_user(correct, incorrect):
+    """ Returns each user's total answers, summing a block of users at a time. """
+
+    totals = np.zeros(correct.shape[0], dtype=np.int64)
+    for start in range(0, correct.shape[0], ROW_BLOCK):
+        end = start + ROW_BLOCK
+        totals[start:end] = correct[start:end].sum(axis=1, dtype=np.int64) \
+            + incorrect[start:end].sum(axis=1, dtype=np.int64)
+    return totals
+
+def summarize(arrays, attributes, percentiles=PERCENTILES):
+    users = len(arrays['level'])
+    totals = answers_per_user(arrays['correct'], arrays['incorrect'])
+    level_counts = np.bincount(arrays['level'], minlength=MAX_LEVEL + 1)
+    return {
+        'users': users,
+        'attributes': attribute_statistics(arrays['correct'], arrays['incorrect'], attributes,
+                                           percentiles),
+        'level_distribution': {str(level): int(count)
+                               for level, count in enumerate(level_counts) if level},
+        'answers_per_user_percentiles': dict(zip(
+            (str(percentile) for percentile in percentiles),
+            np.percentile(totals, percentiles).tolist() if users else [None] * len(percentiles)))
+    }
+
+# --------------- Export --------------- #
+
+def export(store, directory, chunk_users=CHUNK_USERS):
+    """ Exports every user of store into directory and returns the summary. """
+
+    os.makedirs(directory, exist_ok=True)
+    # Chunks go to a directory of this run's own, so none left behind by an
+    # interrupted run can be mixed in, and it goes away however the run ends.
+    chunk_directory = tempfile.mkdtemp(prefix='chunks_', dir=directory)
+    try:
+        writer = ChunkWriter(chunk_directory, os.path.join(directory, 'user_ids.txt'), chunk_users)
+        try:
+            for item in store.iter_users(EXPORT_FIELDS):
+                writer.add(item)
+        finally:
+            writer.close()
+
+        attributes = sorted(writer.attributes, key=writer.attributes.get)
+        arrays = combine_chunks(chunk_directory, directory, writer.users, len(attributes))
+    finally:
+        shutil.rmtree(chunk_directory, ignore_errors=True)
+    with open(os.path.join(directory, 'attributes.json'), 'w') as attributes_file:
+        json.dump(attributes, attributes_file, indent=1)
+    summary = summarize(arrays, attributes)
+    with open(os.path.join(directory, 'summary.json'), 'w') as summary_file:
+        json.dump(summary, summary_file, indent=1)
+    return summary
+
+def print_summary(summary):
+    print(str(summary['users']) + " users")
+    print("levels: " + ", ".join(level + ": " + str(count)
+                                 for level, count in summary['level_distribution'].items()))
+    print("answers per user: " + ", ".join(
+        "p" + percentile + " " + str(value)
+        for percentile, value in summary['answers_per_user_percentiles'].items()))
+    for entry in summary['attributes']:
+        if entry['error_rate'] is None:
+            continue
+        print("%5.1f%% errors  %7d answers  %6d users  %s" % (
+            entry['error_rate'] * 100, entry['correct'] + entry['incorrect'],
+            entry['users_answered'], entry['attribute']))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export class-wide answer analytics.")
+    parser.add_argument('--output', required=True, help="Export directory")
+    parser.add_argument('--backend', choices=['sqlite', 'dynamodb'], default='dynamodb')
+    parser.add_argument('--path', default=DEFAULT_SQLITE_PATH, help="SQLite database file")
+    parser.add_argument('--table', default=USER_TABLE_NAME, help="DynamoDB table name")
+    parser.add_argument('--segments', type=int, default=DEFAULT_SCAN_SEGMENTS,
+                        help="Segments of the DynamoDB parallel scan")
+    parser.add_argument('--chunk-users', type=int, default=CHUNK_USERS)
+    parser.add_argument('--json', action='store_true', help="Print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    if args.backend == 'sqlite':
+        store = SQLiteUserStore(args.path, group_commit=False)
+    else:
+        store = DynamoDBUserStore(args.table, args.segments)
+    try:
+        summary = export(store, args.output, args.chunk_users)
+    finally:
+        store.close()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Offline grading of answer transcripts.
+
+Recomputes every user's progress from a log of the answers they gave,
+applying the skill's own grading (grade_answer) and leveling
+(leveling.next_question_level) without going through Alexa requests or the
+user store. The leveling thresholds can be changed to see how an alternative
+rule would have treated the same answers.
+
+Transcripts are JSONL files with one answer per line:
+
+    {"user": "amzn1.ask.account...", "timestamp": "2026-10-19T15:04:05Z",
+     "question": {"QuestionType": "TrueFalse", "QuestionAttribute": "counts",
+                  "PartialAnswer": "true", ...},
+     "answer": "true"}
+
+where question holds the question's details as the session attributes keep
+them while it is asked, and timestamp is an ISO 8601 time or seconds since
+the epoch. A user's answers may be spread over any number of files and in
+any order; they are replayed in timestamp order. Each answer is replayed as
+the skill handles it: the question level is updated from the user's totals
+as the question is asked, then the answer is graded and applied to the
+counters, mastery, weakest attributes and review schedule. Invalid answers
+are counted but change nothing, as in the skill.
+
+    python batch_grading.py transcripts/*.jsonl --output progress.jsonl
+    python batch_grading.py transcripts/*.jsonl --output progress.jsonl --level-up-every 3
+
+The output has one line per user: the user item recomputed from scratch,
+plus how many answers were replayed and how many were invalid.
+
+The work is spread over a pool of processes in two steps that share nothing
+but files. First the transcripts, split into ranges of lines, are
+partitioned by a hash of the user id into shards. Then each shard's users
+are graded on their own. Both steps run in parallel, so grading scales with
+the number of cores.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import zlib
+import decimal
+import argparse
+import datetime
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import leveling
+from user_store import new_user_item, activity_day
+from alexa_plc_counter_instruction_tutor import grade_answer, apply_answer
+
+# Transcript files are split into ranges of at most this many bytes, each
+# partitioned by one worker. Smaller inputs are split so that every worker
+# gets a range, but not into ranges below MIN_RANGE_BYTES.
+RANGE_BYTES = 64 * 1024 * 1024
+MIN_RANGE_BYTES = 1024 * 1024
+
+# Shards per worker. More shards than workers evens out the work when some
+# users have far more answers than others.
+SHARDS_PER_WORKER = 4
+
+# --------------- Reading transcripts --------------- #
+
+def parse_timestamp(timestamp):
+    """ Returns a transcript timestamp as seconds since the epoch. """
+
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    parsed = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+def user_shard(user_id, shards):
+    return zlib.crc32(user_id.encode('utf-8')) % shards
+
+def split_ranges(paths, range_bytes=RANGE_BYTES):
+    """ Returns (path, start, end) byte ranges covering every file. """
+
+    ranges = []
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), range_bytes):
+            ranges.append((path, start, min(start + range_bytes, size)))
+    return ranges
+
+def read_range(path, start, end):
+    """ Yields the lines that start within [start, end) of a file. A line
+    running over the end belongs to this range, and one running over the
+    start to the range before it. """
+
+    with open(path, 'rb') as transcript_file:
+        if start:
+            transcript_file.seek(start - 1)
+            transcript_file.readline()
+        while transcript_file.tell() < end:
+            line = transcript_file.readline()
+            if not line:
+                break
+            yield line
+
+def partition_range(path, start, end, directory, shards, range_index):
+    """ Writes the answers of a range of a transcript to one file per shard
+    and returns how many answers there were. """
+
+    shard_files = {}
+    answers = 0
+    try:
+        for line in read_range(path, start, end):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            shard = user_shard(record['user'], shards)
+            if shard not in shard_files:
+                shard_files[shard] = open(os.path.join(
+                    directory, 'shard_%04d_range_%05d.jsonl' % (shard, range_index)), 'wb')
+            shard_files[shard].write(line if line.endswith(b"\n") else line + b"\n")
+            answers += 1
+    finally:
+        for shard_file in shard_files.values():
+            shard_file.close()
+    return answers
+
+# --------------- Grading --------------- #
+
+def _json_number(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(repr(value) + " is not JSON serializable")
+
+def replay_user(user_id, records, level_up_every=leveling.LEVEL_UP_EVERY,
+                level_down_every=leveling.LEVEL_DOWN_EVERY):
+    """ Returns the user item recomputed from a user's answer records, which
+    must be in the order they were given. """
+
+    user = new_user_item(user_id)
+    if records:
+        user['LastActive'] = decimal.Decimal(activity_day(parse_timestamp(records[0]['timestamp'])))
+    invalid = 0
+    for record in records:
+        # The level is updated as the question is asked, from the totals
+        # before it is answered.
+        total_correct = sum(user['CounterCorrect'].values())
+        total_incorrect = sum(user['CounterIncorrect'].values())
+        user['QuestionLevel'] = decimal.Decimal(leveling.next_question_level(
+            user['QuestionLevel'], total_correct, total_incorrect,
+            user['PreviousTotalCorrect'], user['PreviousTotalIncorrect'],
+            level_up_every, level_down_every))
+        user['PreviousTotalCorrect'] = decimal.Decimal(total_correct)
+        user['PreviousTotalIncorrect'] = decimal.Decimal(total_incorrect)
+
+        question = record['question']
+        correct = grade_answer(question, record['answer'] or "NoValue")
+        if correct is None:
+            invalid += 1
+            continue
+        apply_answer(user, question['QuestionAttribute'], correct, question['QuestionType'])
+        user['LastActive'] = decimal.Decimal(activity_day(parse_timestamp(record['timestamp'])))
+
+    user['Answers'] = len(records)
+    user['InvalidAnswers'] = invalid
+    return user
+
+def grade_shard(directory, shard, output_path, level_up_every=leveling.LEVEL_UP_EVERY,
+                level_down_every=leveling.LEVEL_DOWN_EVERY):
+    """ Grades every user of a shard and writes their progress to
+    output_path. Returns (users, answers). """
+
+    users = {}
+    order = 0
+    for path in sorted(glob.glob(os.path.join(directory, 'shard_%04d_range_*.jsonl' % shard))):
+        with open(path, 'rb') as shard_file:
+            for line in shard_file:
+                record = json.loads(line)
+                # Answers with the same timestamp keep the order they were
+                # read in.
+                users.setdefault(record['user'], []).append(
+                    (parse_timestamp(record['timestamp']), order, record))
+                order += 1
+
+    answers = 0
+    with open(output_path, 'w') as output_file:
+        for user_id in sorted(users):
+            records = [record for _, _, record in sorted(users[user_id], key=lambda entry: entry[:2])]
+            user = replay_user(user_id, records, level_up_every, level_down_every)
+            output_file.write(json.dumps(user, default=_json_number, sort_keys=True) + "\n")
+            answers += len(records)
+    return len(users), answers
+
+# --------------- Running --------------- #
+
+def grade(paths, output_path, workers=None, level_up_every=leveling.LEVEL_UP_EVERY,
+          level_down_every=leveling.LEVEL_DOWN_EVERY, range_bytes=RANGE_BYTES, work_directory=None):
+    """ Grades every user in the transcripts at paths on a pool of workers
+    and writes their progress to output_path. Returns (users, answers). """
+
+    workers = workers or os.cpu_count() or 1
+    shards = workers * SHARDS_PER_WORKER
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    range_bytes = min(range_bytes, max(-(-total_bytes // workers), MIN_RANGE_BYTES))
+    with tempfile.TemporaryDirectory(dir=work_directory) as directory:
+        shard_paths = [os.path.join(directory, 'progress_%04d.jsonl' % shard)
+                       for shard in range(shards)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(partition_range, path, start, end, directory, shards, index)
+                       for index, (path, start, end) in enumerate(split_ranges(paths, range_bytes))]
+            for future in futures:
+                future.result()
+
+            futures = [executor.submit(grade_shard, directory, shard, shard_paths[shard],
+                                       level_up_every, level_down_every)
+                       for shard in range(shards)]
+            counts = [future.result() for future in futures]
+
+        with open(output_path, 'wb') as output_file:
+            for shard_path in shard_paths:
+                with open(shard_path, 'rb') as shard_file:
+                    while True:
+                        block = shard_file.read(1024 * 1024)
+                        if not block:
+                            break
+                        output_file.write(block)
+    return sum(users for users, _ in counts), sum(answers for _, answers in counts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute user progress from answer transcripts.")
+    parser.add_argument('transcripts', nargs='+', help="JSONL transcript files")
+    parser.add_argument('--output', required=True, help="JSONL file of recomputed progress")
+    parser.add_argument('--workers', type=int, help="Worker processes; defaults to one per core")
+    parser.add_argument('--level-up-every', type=int, default=leveling.LEVEL_UP_EVERY)
+    parser.add_argument('--level-down-every', type=int, default=leveling.LEVEL_DOWN_EVERY)
+    parser.add_argument('--snapshot', help="Content snapshot, for select part questions "
+                                           "recorded without their parts")
+    parser.add_argument('--work-dir', help="Directory for the shards; defaults to the system's")
+    args = parser.parse_args(argv)
+
+    # Workers grade without any storage; the little content grading needs
+    # comes from the snapshot.
+    os.environ['TUTOR_CONTENT_SOURCE'] = 'snapshot'
+    if args.snapshot:
+        os.environ['TUTOR_SNAPSHOT_PATH'] = args.snapshot
+
+    start = time.monotonic()
+    users, answers = grade(args.transcripts, args.output, args.workers, args.level_up_every,
+                           args.level_down_every, work_directory=args.work_dir)
+    elapsed = time.monotonic() - start
+    print("graded %d answers of %d users in %.1fs (%.0f answers/s)" % (
+        answers, users, elapsed, answers / elapsed if elapsed else 0.0))
+
+if __name__ == '__main__':
+    sys.exit(main())
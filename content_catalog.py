@@ -0,0 +1,444 @@
+"""
+Access to the curriculum content: tutoring statements (TutorTable), facts
+about each instruction part (FactTable) and question templates
+(QuestionTemplate_SelectPart and QuestionTemplate_TrueFalse).
+
+Content is normally read from DynamoDB, a whole table at a time, into an
+in-memory catalog that answers every lookup. Loads go through a circuit
+breaker, and when DynamoDB is failing the catalog comes from a compact
+snapshot of the tables bundled with the code (content_snapshot.json), so
+users keep getting questions and tutoring statements instead of an error.
+
+The snapshot is refreshed from the live tables with
+
+    python content_catalog.py snapshot
+
+and question templates are checked against the facts with
+
+    python content_catalog.py compile
+
+Each locale has content of its own, see locales.py; --locale picks the locale
+the commands work on.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import decimal
+import argparse
+import threading
+import dynamodb_access
+import structured_log
+import locales
+from locales import DEFAULT_LOCALE, LocaleCache, localized_name, localized_path
+from botocore.exceptions import ClientError
+from resilience import CircuitBreaker, STORAGE_ERRORS
+from content_compiler import compile_templates
+
+CONTENT_TABLE_NAMES = [
+    'TutorTable',
+    'FactTable',
+    'QuestionTemplate_SelectPart',
+    'QuestionTemplate_TrueFalse'
+]
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content_snapshot.json')
+
+# Fields of each table that the skill uses. Everything else is left out of
+# the snapshot to keep it small.
+SNAPSHOT_FIELDS = {
+    'TutorTable': ['Attribute', 'StatementLevel', 'OrderLevel', 'TutoringStatements',
+                   'FeedbackStatement'],
+    'FactTable': ['Part & Attribute', 'Value'],
+    'QuestionTemplate_SelectPart': ['Attribute', 'Level', 'SelectPart'],
+    'QuestionTemplate_TrueFalse': ['Attribute', 'QuestionLevel', 'TrueFalse']
+}
+
+# How long a container keeps using the content it loaded into memory before
+# loading it again.
+CATALOG_TTL_SECONDS = 300
+
+# The content loader bumps a version marker after changing the content.
+# Containers check it this often and reload their catalog when it changed,
+# without waiting for the catalog to expire.
+CONTENT_VERSION_TABLE_NAME = 'LLPTutor_ContentVersion'
+CONTENT_VERSION_NAME = 'curriculum'
+CONTENT_VERSION_CHECK_SECONDS = 30
+
+# --------------- DynamoDB content --------------- #
+
+class DynamoDBContent(object):
+    """ Reads the content tables of a locale from DynamoDB. They are only
+    ever read whole, to build a ContentCatalog; every lookup the skill makes
+    goes to the catalog. """
+
+    def __init__(self, locale=DEFAULT_LOCALE):
+        self.locale = locale
+
+    def table_name(self, name):
+        """ Returns the name of this locale's table for a content table. """
+
+        return localized_name(name, self.locale)
+
+    def content_version(self):
+        """ Returns the content version marker, or None if there is none. """
+
+        try:
+            response = dynamodb_access.call(
+                CONTENT_VERSION_TABLE_NAME, 'get_item',
+                Key={'Name': localized_name(CONTENT_VERSION_NAME, self.locale)})
+        except ClientError as error:
+            # Content that was never loaded with the content loader has no
+            # marker table.
+            if error.response['Error']['Code'] == 'ResourceNotFoundException':
+                return None
+            raise
+        return response.get('Item', {}).get('Version')
+
+    def scan_table(self, table_name):
+        """ Returns every item of a content table. """
+
+        response = dynamodb_access.call(self.table_name(table_name), 'scan')
+        items = response['Items']
+        while 'LastEvaluatedKey' in response:
+            response = dynamodb_access.call(
+                self.table_name(table_name), 'scan', ExclusiveStartKey=response['LastEvaluatedKey'])
+            items.extend(response['Items'])
+        return items
+
+# --------------- In-memory content --------------- #
+
+class ContentCatalog(object):
+    """ All content held in memory and indexed for the lookups the skill
+    makes. Built from the raw items of each content table, of which only
+    the SNAPSHOT_FIELDS are kept, in a canonical order. The same content
+    thus gives the same catalog whether it comes from DynamoDB, in whatever
+    order a scan returns it, or from the snapshot. """
+
+    def __init__(self, tables):
+        tables = canonical_tables(tables)
+        self.tables = tables
+        self.version = None
+        # Identifies the content, so state that refers to it by index (such
+        # as session state) can tell whether it still means the same thing.
+        self.fingerprint = zlib.crc32(_canonical_json(tables).encode('utf-8'))
+        self._statements = {}
+        self._attribute_items = {}
+        self._order_counts = {}
+        self._facts = {}
+
+        for item in tables.get('TutorTable', []):
+            statement_level = item['StatementLevel']
+            self._statements[(statement_level, item['OrderLevel'])] = item['TutoringStatements']
+            self._attribute_items[item['Attribute']] = item
+            self._order_counts[statement_level] = self._order_counts.get(statement_level, 0) + 1
+        for item in tables.get('FactTable', []):
+            self._facts.setdefault(item['Part & Attribute'], []).append(item['Value'])
+        self._build_fact_indexes()
+
+        # Templates are compiled against the facts. Broken ones are left out
+        # and listed in template_errors.
+        self._select_part, select_part_errors = compile_templates(
+            'QuestionTemplate_SelectPart', tables.get('QuestionTemplate_SelectPart', []),
+            self.fact_parts)
+        self._true_false, true_false_errors = compile_templates(
+            'QuestionTemplate_TrueFalse', tables.get('QuestionTemplate_TrueFalse', []),
+            self.fact_parts)
+        self.template_errors = select_part_errors + true_false_errors
+        for error in self.template_errors:
+            structured_log.warning("question_template_skipped", error=error)
+
+        attributes = set(self._part_values) | set(self._attribute_items)
+        for templates in list(self._select_part.values()) + list(self._true_false.values()):
+            attributes.update(attribute for attribute, _ in templates)
+        self._attributes = sorted(attributes)
+
+    def _build_fact_indexes(self):
+        """ Indexes the facts by attribute. FactTable keys are the part name,
+        which has no spaces, followed by the attribute. Parts and attributes
+        are whatever the content holds, so new instructions only need new
+        content. """
+
+        self._part_values = {}
+        for key, values in self._facts.items():
+            part, _, attribute = key.partition(" ")
+            self._part_values.setdefault(attribute, {})[part] = values
+
+        self._attribute_parts = {}
+        self._attribute_values = {}
+        self._value_parts = {}
+        all_values = {}
+        for attribute, part_values in self._part_values.items():
+            parts = sorted(part_values)
+            self._attribute_parts[attribute] = parts
+            attribute_values = {}
+            for part in parts:
+                for value in part_values[part]:
+                    attribute_values[value] = True
+                    all_values[value] = True
+                    self._value_parts.setdefault((attribute, value), set()).add(part)
+            self._attribute_values[attribute] = list(attribute_values)
+        self._value_parts = {key: frozenset(parts) for key, parts in self._value_parts.items()}
+        self._all_values = list(all_values)
+
+        self._parts = sorted({part for parts in self._attribute_parts.values() for part in parts})
+
+        # Plausible wrong values for multiple choice questions: for a part and
+        # attribute those are the attribute's values for other parts that do
+        # not hold for this part. Any value of another attribute can serve as
+        # a less plausible one.
+        self._distractors = {}
+        for attribute, parts in self._attribute_parts.items():
+            for part in parts:
+                self._distractors[(part, attribute)] = [
+                    value for value in self._attribute_values[attribute]
+                    if part not in self._value_parts[(attribute, value)]]
+
+    @classmethod
+    def from_dynamodb(cls, content=None):
+        content = content or DynamoDBContent()
+        # The version is read first, so content changed while the tables are
+        # scanned is picked up by the next version check.
+        version = content.content_version()
+        catalog = cls({name: content.scan_table(name) for name in CONTENT_TABLE_NAMES})
+        catalog.version = version
+        return catalog
+
+    @classmethod
+    def from_snapshot(cls, path=SNAPSHOT_PATH):
+        with open(path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        return cls(snapshot['tables'])
+
+    def write_snapshot(self, path=SNAPSHOT_PATH):
+        with open(path, 'w') as snapshot_file:
+            json.dump({'version': 1, 'tables': self.tables}, snapshot_file,
+                      separators=(',', ':'), default=_json_number)
+
+    def max_order_levels(self, statement_level):
+        return self._order_counts.get(statement_level, 0)
+
+    def max_statement_level(self):
+        return max(self._order_counts) if self._order_counts else 0
+
+    def tutoring_statement(self, statement_level, order_level):
+        return self._statements.get((statement_level, order_level), [])
+
+    def attribute_tutoring_statement(self, attribute):
+        return self._attribute_items.get(attribute, {}).get('TutoringStatements', [])
+
+    def feedback_statements(self):
+        return {attribute: self.feedback_statement(attribute) for attribute in self._attribute_items}
+
+    def feedback_statement(self, attribute):
+        """ Returns the feedback statement that names an attribute, or the
+        attribute itself if the content has none for it. """
+
+        return self._attribute_items.get(attribute, {}).get('FeedbackStatement') or attribute
+
+    def select_part_templates(self, question_level):
+        """ Returns (attribute, CompiledTemplate) pairs for a level. """
+
+        return self._select_part.get(question_level, [])
+
+    def true_false_templates(self, question_level):
+        """ Returns (attribute, CompiledTemplate) pairs for a level. """
+
+        return self._true_false.get(question_level, [])
+
+    def fact_values(self, part, attribute):
+        return self._facts.get(part + " " + attribute, [])
+
+    def parts(self):
+        """ Returns every part the FactTable holds facts about. """
+
+        return self._parts
+
+    def attributes(self):
+        """ Returns every attribute the content teaches or asks about. """
+
+        return self._attributes
+
+    def fact_parts(self, attribute):
+        """ Returns the parts the FactTable holds values for an attribute. """
+
+        return self._attribute_parts.get(attribute, [])
+
+    def attribute_values(self, attribute):
+        """ Returns the distinct values of an attribute across its parts. """
+
+        return self._attribute_values.get(attribute, [])
+
+    def parts_with_value(self, attribute, value):
+        """ Returns the set of parts for which value holds for the attribute. """
+
+        return self._value_parts.get((attribute, value), frozenset())
+
+    def distractor_values(self, part, attribute):
+        """ Returns values of the attribute that do not hold for the part. """
+
+        return self._distractors.get((part, attribute), [])
+
+    def all_fact_values(self):
+        """ Returns every distinct value in the FactTable. """
+
+        return self._all_values
+
+def _json_number(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(repr(value) + " is not JSON serializable")
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=_json_number)
+
+def canonical_tables(tables):
+    """ Returns the content tables with only their SNAPSHOT_FIELDS, the items
+    of each sorted by their contents. """
+
+    canonical = {}
+    for name in CONTENT_TABLE_NAMES:
+        fields = SNAPSHOT_FIELDS[name]
+        items = [{field: item[field] for field in fields if field in item}
+                 for item in tables.get(name, [])]
+        canonical[name] = sorted(items, key=_canonical_json)
+    return canonical
+
+# --------------- Content with fallback --------------- #
+
+class ResilientContent(object):
+    """ Loads the catalog from a primary source through a circuit breaker and
+    falls back to the bundled snapshot when the primary source fails. """
+
+    def __init__(self, primary, breaker=None, snapshot_path=SNAPSHOT_PATH,
+                 catalog_ttl=CATALOG_TTL_SECONDS,
+                 version_check_interval=CONTENT_VERSION_CHECK_SECONDS):
+        self.primary = primary
+        self.breaker = breaker or CircuitBreaker('content')
+        self.snapshot_path = snapshot_path
+        self.catalog_ttl = catalog_ttl
+        self.version_check_interval = version_check_interval
+        self._version_checked_at = 0.0
+        self.fallback_reads = 0
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._catalog = None
+        self._catalog_expires_at = 0.0
+        self._catalog_lock = threading.Lock()
+
+    def fallback_catalog(self):
+        if self._fallback is None:
+            with self._fallback_lock:
+                if self._fallback is None:
+                    self._fallback = ContentCatalog.from_snapshot(self.snapshot_path)
+        return self._fallback
+
+    def catalog(self):
+        """ Returns all content as an in-memory ContentCatalog, loaded from the
+        primary source at most once every catalog_ttl seconds, or sooner when
+        the content version marker changes. While the primary source fails,
+        the last catalog loaded (or the snapshot) is used. """
+
+        if isinstance(self.primary, ContentCatalog):
+            return self.primary
+        if self._catalog is not None and time.monotonic() < self._catalog_expires_at:
+            if time.monotonic() < self._version_checked_at + self.version_check_interval \
+                    or not self._content_changed():
+                return self._catalog
+        with self._catalog_lock:
+            if self._catalog is None or time.monotonic() >= self._catalog_expires_at:
+                try:
+                    self._catalog = self.breaker.call(ContentCatalog.from_dynamodb, self.primary)
+                except STORAGE_ERRORS:
+                    if self._catalog is None:
+                        if not os.path.exists(self.snapshot_path):
+                            raise
+                        self.fallback_reads += 1
+                        self._catalog = self.fallback_catalog()
+                self._catalog_expires_at = time.monotonic() + self.catalog_ttl
+                self._version_checked_at = time.monotonic()
+        return self._catalog
+
+    def _content_changed(self):
+        """ Checks the content version marker, at most once per
+        version_check_interval across threads. Returns True, and expires the
+        catalog, if the content changed since the catalog was loaded. """
+
+        with self._catalog_lock:
+            if time.monotonic() < self._version_checked_at + self.version_check_interval:
+                return False
+            self._version_checked_at = time.monotonic()
+        try:
+            version = self.breaker.call(self.primary.content_version)
+        except STORAGE_ERRORS:
+            return False
+        if version == self._catalog.version:
+            return False
+        self._catalog_expires_at = 0.0
+        return True
+
+def create_content(locale=DEFAULT_LOCALE):
+    """ Returns a new content source for a locale. Setting
+    TUTOR_CONTENT_SOURCE=snapshot serves content from the snapshot
+    (TUTOR_SNAPSHOT_PATH) instead of DynamoDB, e.g. for local runs. """
+
+    snapshot_path = localized_path(os.environ.get('TUTOR_SNAPSHOT_PATH', SNAPSHOT_PATH), locale)
+    if os.environ.get('TUTOR_CONTENT_SOURCE', 'dynamodb') == 'snapshot':
+        primary = ContentCatalog.from_snapshot(snapshot_path)
+    else:
+        primary = DynamoDBContent(locale)
+    return ResilientContent(primary, snapshot_path=snapshot_path)
+
+_contents = LocaleCache(create_content)
+
+def get_content(locale=None):
+    """ Returns the content source of a locale, by default the locale of the
+    request being handled, shared by every request in this process. """
+
+    return _contents.get(locales.resolve_locale(locale) if locale else locales.current_locale())
+
+def set_content(content, locale=DEFAULT_LOCALE):
+    """ Replaces the shared content source of a locale. """
+
+    _contents.set(locale, content)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Curriculum content tools.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    snapshot_parser = subparsers.add_parser(
+        'snapshot', help="Write the fallback snapshot from the DynamoDB tables.")
+    snapshot_parser.add_argument('--output', help="Defaults to the locale's bundled snapshot")
+    snapshot_parser.add_argument('--force', action='store_true',
+                                 help="Write the snapshot even if some templates do not compile")
+    compile_parser = subparsers.add_parser(
+        'compile', help="Check that every question template compiles against the facts.")
+    compile_parser.add_argument('--snapshot', help="Check a snapshot instead of the DynamoDB tables")
+    for subparser in (snapshot_parser, compile_parser):
+        subparser.add_argument('--locale', default=DEFAULT_LOCALE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'snapshot':
+        catalog = ContentCatalog.from_dynamodb(DynamoDBContent(args.locale))
+        if catalog.template_errors and not args.force:
+            print("not writing a snapshot with templates that do not compile")
+            return 1
+        catalog.write_snapshot(args.output or localized_path(SNAPSHOT_PATH, args.locale))
+        for name in CONTENT_TABLE_NAMES:
+            print(name + ": " + str(len(catalog.tables[name])) + " items")
+
+    elif args.command == 'compile':
+        if args.snapshot:
+            catalog = ContentCatalog.from_snapshot(args.snapshot)
+        else:
+            catalog = ContentCatalog.from_dynamodb(DynamoDBContent(args.locale))
+        compiled = sum(len(templates) for templates in
+                       list(catalog._select_part.values()) + list(catalog._true_false.values()))
+        print(str(compiled) + " templates compiled, " +
+              str(len(catalog.template_errors)) + " errors")
+        if catalog.template_errors:
+            return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Compiles question templates ahead of time.
+
+Question templates hold <PART>, <ATTRIBUTE> and <VALUE> placeholders.
+Compiling a template splits it into literal text and slots, fills in the
+attribute the template belongs to straight away, and checks that every
+placeholder resolves: each must be one the question type fills in, and the
+attribute must have facts in the FactTable. Rendering a compiled template is
+then a single join.
+
+The catalog compiles templates when it loads content and leaves out the ones
+that fail, so a broken template never reaches a user. The errors are listed,
+without serving anything, by
+
+    python content_catalog.py compile
+"""
+
+import re
+
+PLACEHOLDER = re.compile(r"<([A-Z]+)>")
+
+# Anything else that looks like the start of a placeholder, such as <Value>
+# or an unclosed <PART.
+MALFORMED_PLACEHOLDER = re.compile(r"<\w")
+
+# Placeholders each template table requires and allows. Select part
+# templates leave the part out, since it is what the user has to answer.
+TEMPLATE_PLACEHOLDERS = {
+    'QuestionTemplate_SelectPart': (('VALUE',), ('ATTRIBUTE', 'VALUE')),
+    'QuestionTemplate_TrueFalse': (('PART', 'VALUE'), ('PART', 'ATTRIBUTE', 'VALUE'))
+}
+
+# Field holding the template text and field holding its level, per table.
+TEMPLATE_FIELDS = {
+    'QuestionTemplate_SelectPart': ('SelectPart', 'Level'),
+    'QuestionTemplate_TrueFalse': ('TrueFalse', 'QuestionLevel')
+}
+
+class TemplateError(ValueError):
+    """ Raised for a template that cannot be compiled. """
+
+class CompiledTemplate(object):
+    """ A template split into literal segments and the indexes of its part
+    and value slots, with the attribute already filled in. """
+
+    __slots__ = ('source', 'attribute', '_segments', '_part_slots', '_value_slots')
+
+    def __init__(self, source, attribute, segments, part_slots, value_slots):
+        self.source = source
+        self.attribute = attribute
+        self._segments = segments
+        self._part_slots = part_slots
+        self._value_slots = value_slots
+
+    def render(self, part=None, value=None):
+        segments = list(self._segments)
+        for index in self._part_slots:
+            segments[index] = part
+        for index in self._value_slots:
+            segments[index] = value
+        return "".join(segments)
+
+    def __repr__(self):
+        return "CompiledTemplate(" + repr(self.source) + ", " + repr(self.attribute) + ")"
+
+def compile_template(source, attribute, required=('PART', 'VALUE'),
+                     allowed=('PART', 'ATTRIBUTE', 'VALUE')):
+    """ Compiles a template for an attribute. Raises TemplateError if it has
+    a placeholder that is not allowed or lacks one that is required. """
+
+    segments = []
+    part_slots = []
+    value_slots = []
+    found = set()
+    position = 0
+    for match in PLACEHOLDER.finditer(source):
+        name = match.group(1)
+        if name not in allowed:
+            raise TemplateError("unknown placeholder <" + name + ">")
+        found.add(name)
+        if match.start() > position:
+            segments.append(source[position:match.start()])
+        if name == 'ATTRIBUTE':
+            segments.append(attribute)
+        else:
+            (part_slots if name == 'PART' else value_slots).append(len(segments))
+            segments.append(None)
+        position = match.end()
+    if position < len(source):
+        segments.append(source[position:])
+
+    missing = [name for name in required if name not in found]
+    if missing:
+        raise TemplateError("missing placeholder " + ", ".join("<" + name + ">" for name in missing))
+    if MALFORMED_PLACEHOLDER.search(PLACEHOLDER.sub("", source)):
+        raise TemplateError("malformed placeholder")
+
+    return CompiledTemplate(source, attribute, segments, part_slots, value_slots)
+
+def compile_templates(table_name, items, fact_parts):
+    """ Compiles the templates of a template table, given a function returning
+    the parts with facts about an attribute. Returns
+    ({level: [(attribute, CompiledTemplate)]}, [error message]). """
+
+    template_field, level_field = TEMPLATE_FIELDS[table_name]
+    required, allowed = TEMPLATE_PLACEHOLDERS[table_name]
+    templates = {}
+    errors = []
+    for item in items:
+        attribute = item.get('Attribute')
+        try:
+            if not attribute:
+                raise TemplateError("no attribute")
+            if not fact_parts(attribute):
+                raise TemplateError("no facts about the attribute")
+            compiled = compile_template(item.get(template_field) or "", attribute,
+                                        required, allowed)
+        except TemplateError as error:
+            errors.append(table_name + " level " + str(item.get(level_field)) + ", " +
+                          repr(attribute) + ": " + str(error))
+            continue
+        templates.setdefault(item[level_field], []).append((attribute, compiled))
+    return templates, errors
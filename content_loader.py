@@ -0,0 +1,233 @@
+"""
+Loads a curriculum into the content tables.
+
+A curriculum is either a directory holding one file per content table, named
+after the table (TutorTable.json or TutorTable.csv, FactTable.json or
+FactTable.csv, and so on) with an optional VERSION file, or a single JSON file
+in the snapshot format: {"curriculum_version": ..., "tables": {...}}. JSON
+files hold a list of items. CSV files have a header row naming the fields;
+level fields are read as numbers and TutoringStatements as a JSON list.
+
+The loader diffs the curriculum against what the tables hold now, item by
+item on each table's primary key, and only writes the items that are new or
+changed and deletes the ones no longer in the curriculum. Writes go out in
+batches from parallel workers, and items DynamoDB leaves unprocessed are sent
+again. Finally the content version marker is bumped, so running containers
+reload their content within CONTENT_VERSION_CHECK_SECONDS.
+
+    python content_loader.py diff curriculum/
+    python content_loader.py load curriculum/ --workers 8
+    python content_loader.py load curriculum-de/ --locale de-DE
+
+A locale other than the default is loaded into that locale's tables, see
+locales.py.
+
+Question templates are compiled against the curriculum's facts first, and a
+curriculum with templates that do not compile is not loaded unless --force
+is given.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import decimal
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import dynamodb_access
+from locales import DEFAULT_LOCALE, localized_name
+from botocore.exceptions import BotoCoreError, ClientError
+from content_catalog import (ContentCatalog, DynamoDBContent, CONTENT_TABLE_NAMES,
+                             CONTENT_VERSION_TABLE_NAME, CONTENT_VERSION_NAME)
+
+# Primary key of each content table, used when the table cannot be described.
+CONTENT_TABLE_KEYS = {
+    'TutorTable': ['Attribute'],
+    'FactTable': ['Part & Attribute', 'Value'],
+    'QuestionTemplate_SelectPart': ['Attribute', 'Level'],
+    'QuestionTemplate_TrueFalse': ['Attribute', 'QuestionLevel']
+}
+
+DEFAULT_WORKERS = 4
+
+# Attempts at writing a batch before giving up on its unprocessed items. A
+# bulk load can afford to wait out throttling for longer than a request can.
+BATCH_WRITE_ATTEMPTS = 10
+
+# Fields that CSV files hold as numbers and as JSON lists.
+NUMBER_FIELDS = ('StatementLevel', 'OrderLevel', 'Level', 'QuestionLevel')
+LIST_FIELDS = ('TutoringStatements',)
+
+# --------------- Reading a curriculum --------------- #
+
+def _csv_value(field, text):
+    if field in NUMBER_FIELDS:
+        return decimal.Decimal(text)
+    if field in LIST_FIELDS:
+        return json.loads(text, parse_float=decimal.Decimal, parse_int=decimal.Decimal)
+    return text
+
+def read_table_file(path):
+    """ Returns the items of a table file, with numbers as decimal.Decimal like
+    DynamoDB returns them. """
+
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as table_file:
+            return [{field: _csv_value(field, text) for field, text in row.items() if text != ''}
+                    for row in csv.DictReader(table_file)]
+    with open(path, encoding='utf-8') as table_file:
+        return json.load(table_file, parse_float=decimal.Decimal, parse_int=decimal.Decimal)
+
+def read_curriculum(path):
+    """ Returns (curriculum version, {table name: items}) for a curriculum
+    directory or JSON file. Tables without a file are left out. """
+
+    if not os.path.isdir(path):
+        with open(path, encoding='utf-8') as curriculum_file:
+            curriculum = json.load(curriculum_file, parse_float=decimal.Decimal,
+                                   parse_int=decimal.Decimal)
+        return curriculum.get('curriculum_version'), curriculum['tables']
+
+    tables = {}
+    for name in CONTENT_TABLE_NAMES:
+        for extension in ('.json', '.csv'):
+            table_path = os.path.join(path, name + extension)
+            if os.path.exists(table_path):
+                tables[name] = read_table_file(table_path)
+                break
+    version = None
+    version_path = os.path.join(path, 'VERSION')
+    if os.path.exists(version_path):
+        with open(version_path) as version_file:
+            version = version_file.read().strip()
+    return version, tables
+
+# --------------- Diffing --------------- #
+
+def table_key(table_name, locale=DEFAULT_LOCALE):
+    """ Returns the primary key fields of a table. """
+
+    try:
+        return [key['AttributeName'] for key in
+                dynamodb_access.get_table(localized_name(table_name, locale)).key_schema]
+    except (BotoCoreError, ClientError) as error:
+        print("using the default key of " + table_name + ": " + str(error))
+        return CONTENT_TABLE_KEYS[table_name]
+
+def index_items(items, key_fields, source):
+    """ Returns {key: item}. Raises ValueError if two items share a key or an
+    item lacks a key field. """
+
+    indexed = {}
+    for item in items:
+        missing = [field for field in key_fields if field not in item]
+        if missing:
+            raise ValueError(source + " item without " + ", ".join(missing) + ": " + repr(item))
+        key = tuple(item[field] for field in key_fields)
+        if key in indexed:
+            raise ValueError(source + " has more than one item with key " + repr(key))
+        indexed[key] = item
+    return indexed
+
+def diff_table(current_items, new_items, key_fields, table_name='table'):
+    """ Returns (items to put, keys to delete), each key as a dict of its key
+    fields, to turn current_items into new_items. """
+
+    current = index_items(current_items, key_fields, table_name)
+    new = index_items(new_items, key_fields, "curriculum " + table_name)
+    puts = [item for key, item in new.items() if current.get(key) != item]
+    deletes = [dict(zip(key_fields, key)) for key in current if key not in new]
+    return puts, deletes
+
+# --------------- Loading --------------- #
+
+def write_changes(changes, workers=DEFAULT_WORKERS, locale=DEFAULT_LOCALE):
+    """ Applies {table name: (puts, deletes)} to a locale's tables with batch
+    writes spread over parallel workers. """
+
+    batches = []
+    for table_name, (puts, deletes) in changes.items():
+        requests = [{'PutRequest': {'Item': item}} for item in puts]
+        requests += [{'DeleteRequest': {'Key': key}} for key in deletes]
+        for start in range(0, len(requests), dynamodb_access.BATCH_WRITE_SIZE):
+            batches.append((localized_name(table_name, locale),
+                            requests[start:start + dynamodb_access.BATCH_WRITE_SIZE]))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(dynamodb_access.batch_write, table_name, requests,
+                                   BATCH_WRITE_ATTEMPTS)
+                   for table_name, requests in batches]
+        for future in futures:
+            future.result()
+    return len(batches)
+
+def bump_content_version(curriculum_version=None, locale=DEFAULT_LOCALE):
+    """ Increments a locale's content version marker and returns the new
+    version. """
+
+    names = {'#version': 'Version', '#updated': 'UpdatedAt'}
+    values = {':one': decimal.Decimal(1), ':now': decimal.Decimal(int(time.time()))}
+    expression = 'ADD #version :one SET #updated = :now'
+    if curriculum_version is not None:
+        names['#curriculum'] = 'CurriculumVersion'
+        values[':curriculum'] = str(curriculum_version)
+        expression += ', #curriculum = :curriculum'
+    response = dynamodb_access.call(
+        CONTENT_VERSION_TABLE_NAME,
+        'update_item',
+        Key={'Name': localized_name(CONTENT_VERSION_NAME, locale)},
+        UpdateExpression=expression,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues='UPDATED_NEW'
+    )
+    return response['Attributes']['Version']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load a curriculum into the content tables.")
+    parser.add_argument('command', choices=['diff', 'load'])
+    parser.add_argument('curriculum', help="Curriculum directory or JSON file")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--locale', default=DEFAULT_LOCALE, help="Locale of the curriculum")
+    parser.add_argument('--keep-missing', action='store_true',
+                        help="Keep items that are not in the curriculum instead of deleting them")
+    parser.add_argument('--force', action='store_true',
+                        help="Load even if some question templates do not compile")
+    parser.add_argument('--verbose', action='store_true', help="List every changed item")
+    args = parser.parse_args(argv)
+
+    curriculum_version, tables = read_curriculum(args.curriculum)
+    catalog = ContentCatalog(tables)
+    if catalog.template_errors and not args.force:
+        print("not loading a curriculum with templates that do not compile")
+        return 1
+
+    content = DynamoDBContent(args.locale)
+    changes = {}
+    for table_name in CONTENT_TABLE_NAMES:
+        if table_name not in tables:
+            continue
+        key_fields = table_key(table_name, args.locale)
+        puts, deletes = diff_table(content.scan_table(table_name), tables[table_name],
+                                   key_fields, table_name)
+        if args.keep_missing:
+            deletes = []
+        print(table_name + ": " + str(len(puts)) + " to write, " +
+              str(len(deletes)) + " to delete")
+        if args.verbose:
+            for item in puts:
+                print("    write " + repr(tuple(item[field] for field in key_fields)))
+            for key in deletes:
+                print("    delete " + repr(tuple(key[field] for field in key_fields)))
+        if puts or deletes:
+            changes[table_name] = (puts, deletes)
+
+    if args.command == 'diff' or not changes:
+        return 0
+    batches = write_changes(changes, args.workers, args.locale)
+    version = bump_content_version(curriculum_version, args.locale)
+    print("wrote " + str(batches) + " batches, content version is now " + str(version))
+
+if __name__ == '__main__':
+    sys.exit(main())
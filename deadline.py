@@ -0,0 +1,134 @@
+"""
+Latency budget handling for a single request.
+
+Alexa stops waiting for a response after a few seconds, so retries and waits
+on slow storage must give up while there is still time to answer. The time
+left is tracked per request, from the Lambda context when there is one.
+
+Rendering the response is the critical path. Bookkeeping writes (answer
+counters, previous totals) are deferred with defer() while it is rendered,
+and run_deferred() applies them in order once it is ready, for as long as
+more than RESPONSE_RESERVE_MS is left. A write that fails is logged and the
+rest still run; the turn is answered either way. Writes there is no time for
+are dropped rather than kept in memory past the end of their request, and
+the request is counted and logged as degraded.
+"""
+
+import time
+import threading
+import structured_log
+
+# Alexa's response deadline, used when there is no Lambda context to ask.
+ALEXA_RESPONSE_BUDGET_MS = 8000
+
+# Time kept back for returning the response. Retries, waits and deferred
+# writes give up rather than eat into it.
+RESPONSE_RESERVE_MS = 1500
+
+stats = {
+    'requests': 0,
+    'deferred': 0,
+    'run_deferred': 0,
+    'failed_deferred': 0,
+    'dropped_deferred': 0,
+    'degraded_requests': 0
+}
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+
+def _count(key, amount=1):
+    with _stats_lock:
+        stats[key] += amount
+
+class RequestDeadline(object):
+    """ Tracks the time left to answer one request and the work deferred
+    until its response is ready. """
+
+    def __init__(self, context=None, budget_ms=ALEXA_RESPONSE_BUDGET_MS):
+        self.context = context
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+        self.deferred = []
+
+    def remaining_ms(self):
+        """ Milliseconds left before the earlier of the Alexa deadline and the
+        Lambda timeout. """
+
+        remaining = (self.expires_at - time.monotonic()) * 1000
+        if self.context is not None:
+            remaining = min(remaining, self.context.get_remaining_time_in_millis())
+        return remaining
+
+    def defer(self, func, *args):
+        self.deferred.append((func, args))
+        _count('deferred')
+
+def start_request(context=None):
+    """ Starts tracking a new request. """
+
+    deadline = RequestDeadline(context)
+    _local.deadline = deadline
+    _count('requests')
+    return deadline
+
+def current_deadline():
+    return getattr(_local, 'deadline', None)
+
+def set_current_deadline(request_deadline):
+    """ Makes request_deadline the current one on this thread, e.g. on a
+    worker running a call for the request. """
+
+    _local.deadline = request_deadline
+
+def defer(func, *args):
+    """ Runs func(*args) once the response is ready. Outside of a tracked
+    request it simply runs now. """
+
+    deadline = current_deadline()
+    if deadline is None:
+        func(*args)
+    else:
+        deadline.defer(func, *args)
+
+def _drop_deferred(deadline, reason):
+    """ Drops the work a request deferred but did not run, counting the
+    request as degraded. """
+
+    _count('dropped_deferred', len(deadline.deferred))
+    _count('degraded_requests')
+    structured_log.warning("deadline_degraded", reason=reason, dropped=len(deadline.deferred),
+                           remaining_ms=int(deadline.remaining_ms()))
+    deadline.deferred = []
+
+def run_deferred(deadline=None):
+    """ Runs the work deferred so far by a request, by default the current
+    one, in the order it was deferred, while more than RESPONSE_RESERVE_MS is
+    left. A piece that fails is logged and the others still run; nothing is
+    raised. Returns True if work had to be dropped for lack of time. """
+
+    deadline = deadline or current_deadline()
+    if deadline is None:
+        return False
+    while deadline.deferred:
+        if deadline.remaining_ms() <= RESPONSE_RESERVE_MS:
+            _drop_deferred(deadline, "out_of_time")
+            return True
+        func, args = deadline.deferred.pop(0)
+        try:
+            func(*args)
+        except Exception as error:
+            _count('failed_deferred')
+            structured_log.error("deferred_write_failed", write=getattr(func, '__name__', repr(func)),
+                                 error=repr(error))
+        else:
+            _count('run_deferred')
+    return False
+
+def finish_request(deadline):
+    """ Stops tracking a request. Work it deferred but never ran, because
+    handling it failed before its response was ready, is dropped along with
+    the response. """
+
+    _local.deadline = None
+    if deadline.deferred:
+        _drop_deferred(deadline, "request_failed")
@@ -0,0 +1,306 @@
+"""
+Shared access to the skill's DynamoDB tables.
+
+Every get_item, put_item, update_item, query and scan the skill makes goes
+through call(), and batch writes from the content tools go through
+batch_write(). Both:
+
+  * waits on a per-table token bucket so this container stays within the
+    table's read or write capacity instead of getting throttled,
+  * retries throttled and failed calls with jittered exponential backoff,
+    without sleeping past the current request's deadline, and
+  * records calls, retries, throttles and rate limiting per table.
+
+Table capacity is taken from the TUTOR_TABLE_CAPACITY environment variable
+(e.g. "LLPTutor_UserData=25:25,TutorTable=5:1" for read:write units per
+second), otherwise from the table's provisioned throughput, which
+load_capacity() reads when the container starts so no request waits on it.
+Only the user tables and the default locale's content tables are read then;
+other locales' content tables only get a configured capacity. On-demand
+tables are not rate limited. TUTOR_CAPACITY_SHARE scales that
+capacity down when several containers share a table.
+"""
+
+import os
+import time
+import random
+import threading
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+import deadline
+from resilience import is_transient
+
+REGION_NAME = 'us-east-1'
+
+# Size of the HTTP connection pool of each DynamoDB client. Every thread has
+# a client of its own and makes one call at a time.
+MAX_POOL_CONNECTIONS = 1
+
+# Retries are handled here, so botocore's own retries are turned off.
+CLIENT_CONFIG = Config(
+    connect_timeout=2,
+    read_timeout=5,
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    retries={'max_attempts': 1, 'mode': 'standard'}
+)
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.05
+BACKOFF_CAP = 1.0
+
+# Longest time a call waits for rate limiting before it is sent anyway. Calls
+# made for a request also stop waiting before its deadline.
+MAX_RATE_LIMIT_WAIT = 1.0
+
+READ_OPERATIONS = ('get_item', 'query', 'scan', 'batch_get_item')
+
+# Most write requests DynamoDB accepts in one batch_write_item call.
+BATCH_WRITE_SIZE = 25
+
+_local = threading.local()
+_backoff_random = random.Random()
+
+# --------------- Rate limiting --------------- #
+
+class TokenBucket(object):
+    """ Token bucket refilled at rate tokens per second, holding at most one
+    second's worth. The balance may go negative when a call consumes more
+    than was estimated up front, which delays the calls after it. """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.capacity = max(float(rate), 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1.0, max_wait=MAX_RATE_LIMIT_WAIT):
+        """ Takes tokens, waiting up to max_wait for them. Returns the time
+        spent waiting. """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens or waited >= max_wait:
+                    self.tokens -= tokens
+                    return waited
+                wait = min((tokens - self.tokens) / self.rate, max_wait - waited)
+            time.sleep(wait)
+            waited += wait
+
+    def adjust(self, tokens):
+        """ Takes (or with a negative amount, returns) tokens without waiting. """
+
+        with self._lock:
+            self._refill()
+            self.tokens -= tokens
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def _configured_capacity():
+    capacity = {}
+    for entry in os.environ.get('TUTOR_TABLE_CAPACITY', '').split(','):
+        if '=' in entry:
+            table_name, units = entry.split('=', 1)
+            read_units, write_units = units.split(':')
+            capacity[table_name.strip()] = (float(read_units), float(write_units))
+    return capacity
+
+def _provisioned_capacity(table_name):
+    try:
+        description = _client().describe_table(TableName=table_name)['Table']
+    except (BotoCoreError, ClientError):
+        return 0, 0
+    throughput = description.get('ProvisionedThroughput', {})
+    return throughput.get('ReadCapacityUnits', 0), throughput.get('WriteCapacityUnits', 0)
+
+def _set_buckets(table_name, read_units, write_units):
+    share = float(os.environ.get('TUTOR_CAPACITY_SHARE', '1'))
+    _buckets[table_name] = (
+        TokenBucket(read_units * share) if read_units else None,
+        TokenBucket(write_units * share) if write_units else None
+    )
+
+def load_capacity(table_names):
+    """ Sets up rate limiting for tables ahead of their first call, reading
+    the provisioned throughput of those without a configured capacity. """
+
+    configured = _configured_capacity()
+    for table_name in table_names:
+        if table_name in configured:
+            read_units, write_units = configured[table_name]
+        else:
+            read_units, write_units = _provisioned_capacity(table_name)
+        with _buckets_lock:
+            _set_buckets(table_name, read_units, write_units)
+
+def get_buckets(table_name):
+    """ Returns the (read, write) buckets of a table. A bucket is None when the
+    table has no capacity limit. A table load_capacity() was not given only
+    gets its configured capacity, if any. """
+
+    if table_name not in _buckets:
+        with _buckets_lock:
+            if table_name not in _buckets:
+                _set_buckets(table_name, *_configured_capacity().get(table_name, (0, 0)))
+    return _buckets[table_name]
+
+# --------------- Metrics --------------- #
+
+metrics = {}
+_metrics_lock = threading.Lock()
+
+def _count(table_name, key, amount=1):
+    with _metrics_lock:
+        table_metrics = metrics.setdefault(table_name, {
+            'calls': 0,
+            'retries': 0,
+            'throttles': 0,
+            'failures': 0,
+            'rate_limited': 0,
+            'rate_limit_wait_seconds': 0.0,
+            'consumed_capacity': 0.0
+        })
+        table_metrics[key] += amount
+
+def get_metrics():
+    """ Returns a copy of the per-table call metrics. """
+
+    with _metrics_lock:
+        return {table_name: dict(values) for table_name, values in metrics.items()}
+
+# --------------- Calls --------------- #
+
+def _resource():
+    resource = getattr(_local, 'resource', None)
+    if resource is None:
+        # Neither boto3 resources nor the default session they would be made
+        # from are thread safe, so each thread gets a session of its own.
+        resource = boto3.session.Session().resource(
+            'dynamodb', region_name=REGION_NAME, config=CLIENT_CONFIG)
+        _local.resource = resource
+    return resource
+
+def _client():
+    return _resource().meta.client
+
+def get_table(table_name):
+    """ Returns this thread's Table object for a table. """
+
+    return _resource().Table(table_name)
+
+def _rate_limit_wait():
+    """ Returns how long a call may wait for rate limiting. """
+
+    request_deadline = deadline.current_deadline()
+    if request_deadline is None:
+        return MAX_RATE_LIMIT_WAIT
+    spare = (request_deadline.remaining_ms() - deadline.RESPONSE_RESERVE_MS) / 1000.0
+    return max(0.0, min(MAX_RATE_LIMIT_WAIT, spare))
+
+def _backoff_delay(attempt):
+    return _backoff_random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def call(table_name, operation, **kwargs):
+    """ Calls a Table method (e.g. 'query') with rate limiting and retries,
+    and returns its response. """
+
+    read_bucket, write_bucket = get_buckets(table_name)
+    bucket = read_bucket if operation in READ_OPERATIONS else write_bucket
+    if bucket is not None:
+        kwargs.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+    attempt = 0
+    while True:
+        if bucket is not None:
+            waited = bucket.acquire(1.0, _rate_limit_wait())
+            if waited:
+                _count(table_name, 'rate_limited')
+                _count(table_name, 'rate_limit_wait_seconds', waited)
+        _count(table_name, 'calls')
+        try:
+            response = getattr(get_table(table_name), operation)(**kwargs)
+        except (BotoCoreError, ClientError) as error:
+            if isinstance(error, ClientError) and is_transient(error):
+                _count(table_name, 'throttles')
+            attempt += 1
+            delay = _backoff_delay(attempt)
+            if not is_transient(error) or attempt >= MAX_ATTEMPTS or not _fits_deadline(delay):
+                _count(table_name, 'failures')
+                raise
+            _count(table_name, 'retries')
+            time.sleep(delay)
+            continue
+
+        consumed = response.get('ConsumedCapacity', {}).get('CapacityUnits')
+        if consumed is not None:
+            _count(table_name, 'consumed_capacity', consumed)
+            if bucket is not None:
+                bucket.adjust(consumed - 1.0)
+        return response
+
+class UnprocessedItemsError(Exception):
+    """ Raised when DynamoDB keeps leaving items of a batch write unprocessed. """
+
+    def __init__(self, table_name, requests):
+        Exception.__init__(self, str(len(requests)) + " items left unprocessed in " + table_name)
+        self.table_name = table_name
+        self.requests = requests
+
+def batch_write(table_name, requests, max_attempts=MAX_ATTEMPTS):
+    """ Writes up to BATCH_WRITE_SIZE put or delete requests, in the
+    batch_write_item request format, to a table with rate limiting. Items
+    DynamoDB leaves unprocessed, usually because the table is throttling,
+    are sent again with backoff. """
+
+    write_bucket = get_buckets(table_name)[1]
+    pending = list(requests)
+    attempt = 0
+    while pending:
+        if write_bucket is not None:
+            waited = write_bucket.acquire(float(len(pending)), _rate_limit_wait())
+            if waited:
+                _count(table_name, 'rate_limited')
+                _count(table_name, 'rate_limit_wait_seconds', waited)
+        _count(table_name, 'calls')
+        try:
+            response = _resource().batch_write_item(RequestItems={table_name: pending})
+        except (BotoCoreError, ClientError) as error:
+            if isinstance(error, ClientError) and is_transient(error):
+                _count(table_name, 'throttles')
+            attempt += 1
+            delay = _backoff_delay(attempt)
+            if not is_transient(error) or attempt >= max_attempts or not _fits_deadline(delay):
+                _count(table_name, 'failures')
+                raise
+            _count(table_name, 'retries')
+            time.sleep(delay)
+            continue
+
+        pending = response.get('UnprocessedItems', {}).get(table_name, [])
+        if pending:
+            _count(table_name, 'throttles')
+            attempt += 1
+            delay = _backoff_delay(attempt)
+            if attempt >= max_attempts or not _fits_deadline(delay):
+                _count(table_name, 'failures')
+                raise UnprocessedItemsError(table_name, pending)
+            _count(table_name, 'retries')
+            time.sleep(delay)
+
+def _fits_deadline(delay):
+    """ Returns False if sleeping for delay would eat into the time reserved
+    for answering the current request. """
+
+    request_deadline = deadline.current_deadline()
+    if request_deadline is None:
+        return True
+    return request_deadline.remaining_ms() - delay * 1000 > deadline.RESPONSE_RESERVE_MS
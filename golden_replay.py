@@ -0,0 +1,247 @@
+"""
+Golden output checks for changes that should not change behavior.
+
+Recorded event sequences are replayed through an implementation of the skill
+and everything it produced is kept: each response with its session
+attributes, and the state of every user in the user store at the end. The
+first run is stored as the golden snapshot; later runs of the current tree
+and of a candidate tree are diffed against it.
+
+An event sequence is a file with one Alexa request event per line, such as
+the ones load_test.py --record writes. Events are replayed in order, each
+with the session attributes of the previous response in its session, as
+Alexa would send them. The global random source is seeded at the start of
+every sequence, so both implementations make the same random choices as
+long as they make them in the same order.
+
+    python golden_replay.py record sessions/*.jsonl --golden golden.json
+    git worktree add /tmp/candidate my-branch
+    python golden_replay.py check sessions/*.jsonl --golden golden.json --candidate /tmp/candidate
+
+Each implementation runs in a process of its own, with a fresh SQLite user
+store and content from a snapshot, so no AWS access is needed and the
+implementations cannot see each other's modules. check exits with status 1
+if any implementation differs from the golden snapshot.
+"""
+
+import os
+import sys
+import json
+import random
+import decimal
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SNAPSHOT_PATH = os.path.join(HERE, 'content_snapshot.json')
+
+GOLDEN_VERSION = 1
+
+DEFAULT_SEED = 0
+
+# Differences listed per implementation before the rest are only counted.
+MAX_LISTED_DIFFERENCES = 20
+
+# --------------- Replaying --------------- #
+
+class ReplayContext(object):
+    """ A Lambda context with time to spare, so no retry or wait gives up
+    early because of the deadline. """
+
+    def get_remaining_time_in_millis(self):
+        return 60000
+
+def read_sequence(path):
+    with open(path, encoding='utf-8') as sequence_file:
+        return [json.loads(line) for line in sequence_file if line.strip()]
+
+def _json_value(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(repr(value) + " is not JSON serializable")
+
+def replay(sequence_paths, seed=DEFAULT_SEED):
+    """ Replays sequences through the implementation this process imports
+    and returns what it produced. The user store and content must already
+    be configured through the environment. """
+
+    import alexa_plc_counter_instruction_tutor as tutor
+    import user_store
+
+    sequences = []
+    for path in sequence_paths:
+        random.seed(seed)
+        session_attributes = {}
+        responses = []
+        for event in read_sequence(path):
+            session = dict(event['session'])
+            if session.get('new'):
+                session['attributes'] = {}
+            else:
+                session['attributes'] = session_attributes.get(session['sessionId'], {})
+            try:
+                response = tutor.lambda_handler(dict(event, session=session), ReplayContext())
+            except Exception as error:
+                response = {'error': repr(error)}
+            session_attributes[session['sessionId']] = (response or {}).get('sessionAttributes') or {}
+            responses.append(response)
+        sequences.append({'name': os.path.basename(path), 'responses': responses})
+
+    # Closing the store commits any writes it still holds, and a store of
+    # its own reads back what was committed.
+    store = user_store.get_user_store()
+    store.close()
+    reader = user_store.SQLiteUserStore(os.environ['TUTOR_SQLITE_PATH'], group_commit=False)
+    run_day = user_store.activity_day()
+    users = {}
+    for item in reader.iter_users():
+        # The day a user was last active depends on when the replay runs, so
+        # it is kept relative to that day.
+        if 'LastActive' in item:
+            item['LastActive'] = int(item['LastActive']) - run_day
+        users[item['UserID']] = item
+    reader.close()
+    return json.loads(json.dumps({'sequences': sequences, 'users': users}, default=_json_value))
+
+def run_implementation(tree, sequence_paths, seed=DEFAULT_SEED, snapshot_path=SNAPSHOT_PATH):
+    """ Replays sequences through the implementation in directory tree, in a
+    process of its own, and returns what it produced. """
+
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, 'output.json')
+        env = dict(os.environ,
+                   TUTOR_USER_STORE='sqlite',
+                   TUTOR_SQLITE_PATH=os.path.join(directory, 'users.db'),
+                   TUTOR_CONTENT_SOURCE='snapshot',
+                   TUTOR_SNAPSHOT_PATH=os.path.abspath(snapshot_path))
+        command = [sys.executable, os.path.abspath(__file__), 'replay', '--tree', tree,
+                   '--seed', str(seed), '--output', output_path] + \
+            [os.path.abspath(path) for path in sequence_paths]
+        subprocess.run(command, env=env, cwd=directory, check=True)
+        with open(output_path) as output_file:
+            return json.load(output_file)
+
+# --------------- Diffing --------------- #
+
+def diff(expected, actual, path=''):
+    """ Returns a (path, expected, actual) tuple for every place actual
+    differs from expected. """
+
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in sorted(set(expected) | set(actual), key=str):
+            key_path = path + '.' + str(key) if path else str(key)
+            if key not in actual:
+                differences.append((key_path, expected[key], '<missing>'))
+            elif key not in expected:
+                differences.append((key_path, '<missing>', actual[key]))
+            else:
+                differences += diff(expected[key], actual[key], key_path)
+        return differences
+    if isinstance(expected, list) and isinstance(actual, list):
+        differences = []
+        for index in range(max(len(expected), len(actual))):
+            index_path = path + '[' + str(index) + ']'
+            if index >= len(actual):
+                differences.append((index_path, expected[index], '<missing>'))
+            elif index >= len(expected):
+                differences.append((index_path, '<missing>', actual[index]))
+            else:
+                differences += diff(expected[index], actual[index], index_path)
+        return differences
+    if expected != actual:
+        return [(path, expected, actual)]
+    return []
+
+def diff_outputs(golden, output):
+    """ Diffs a replay's output against the golden snapshot, naming
+    responses after their sequence. """
+
+    differences = []
+    golden_sequences = {sequence['name']: sequence for sequence in golden['sequences']}
+    for sequence in output['sequences']:
+        expected = golden_sequences.get(sequence['name'])
+        if expected is None:
+            differences.append((sequence['name'], '<missing>', '<sequence>'))
+            continue
+        differences += diff(expected['responses'], sequence['responses'], sequence['name'])
+    differences += diff(golden['users'], output['users'], 'users')
+    return differences
+
+def print_differences(label, differences, max_listed=MAX_LISTED_DIFFERENCES):
+    if not differences:
+        print(label + ": same as the golden snapshot")
+        return
+    print(label + ": " + str(len(differences)) + " differences")
+    for path, expected, actual in differences[:max_listed]:
+        print("    " + path)
+        print("        golden:   " + json.dumps(expected)[:200])
+        print("        replayed: " + json.dumps(actual)[:200])
+    if len(differences) > max_listed:
+        print("    ... and " + str(len(differences) - max_listed) + " more")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay event sequences against golden output.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="Store the golden snapshot.")
+    check_parser = subparsers.add_parser('check', help="Diff implementations against it.")
+    for subparser in (record_parser, check_parser):
+        subparser.add_argument('sequences', nargs='+', help="Event sequence files")
+        subparser.add_argument('--golden', required=True, help="Golden snapshot file")
+        subparser.add_argument('--snapshot', default=SNAPSHOT_PATH, help="Content snapshot")
+    record_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    record_parser.add_argument('--tree', default=HERE,
+                               help="Implementation to record; defaults to this one")
+    check_parser.add_argument('--candidate', action='append', default=[],
+                              help="Candidate implementation directory; may be repeated")
+    check_parser.add_argument('--skip-current', action='store_true',
+                              help="Only check the candidates")
+    check_parser.add_argument('--max-listed', type=int, default=MAX_LISTED_DIFFERENCES)
+
+    replay_parser = subparsers.add_parser(
+        'replay', help="Replay in this process; used by record and check.")
+    replay_parser.add_argument('sequences', nargs='+')
+    replay_parser.add_argument('--tree', required=True)
+    replay_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    replay_parser.add_argument('--output', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'replay':
+        # The implementation under test is imported from its tree, never from
+        # the directory this file is in.
+        tree = os.path.abspath(args.tree)
+        sys.path[:] = [tree] + [path for path in sys.path if os.path.abspath(path or '.') != HERE]
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                output = replay(args.sequences, args.seed)
+        with open(args.output, 'w') as output_file:
+            json.dump(output, output_file)
+
+    elif args.command == 'record':
+        output = run_implementation(args.tree, args.sequences, args.seed, args.snapshot)
+        golden = dict(output, version=GOLDEN_VERSION, seed=args.seed)
+        with open(args.golden, 'w') as golden_file:
+            json.dump(golden, golden_file, indent=1, sort_keys=True)
+        print("recorded " + str(sum(len(sequence['responses']) for sequence in output['sequences'])) +
+              " responses and " + str(len(output['users'])) + " users")
+
+    else:
+        with open(args.golden) as golden_file:
+            golden = json.load(golden_file)
+        trees = ([] if args.skip_current else [HERE]) + args.candidate
+        changed = False
+        for tree in trees:
+            output = run_implementation(tree, args.sequences, golden['seed'], args.snapshot)
+            differences = diff_outputs(golden, output)
+            print_differences(tree, differences, args.max_listed)
+            changed = changed or bool(differences)
+        return 1 if changed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
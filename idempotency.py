@@ -0,0 +1,356 @@
+"""
+Idempotent handling of retried Alexa requests.
+
+Alexa can send the same request again (with the same requestId) when the
+first attempt times out. Without protection the retry re-runs every write the
+handler makes, so counters get incremented twice. Each request is therefore
+claimed with a conditional write before it runs, and its response is stored
+once it finishes. A retry finds the claim and gets the stored response back
+instead of running the handler again. Recent responses are also kept in a
+small in-container cache so a retry landing on the same container needs no
+storage call at all.
+
+A retry can also arrive while the first attempt is still running. It then
+waits, as long as its own deadline allows, for the first attempt's response,
+and if none comes it answers that the skill is still busy rather than run
+the handler a second time. Only a claim that has gone without a response for
+longer than any attempt can take, CLAIM_TIMEOUT, belongs to an attempt that
+died; a retry takes such a claim over and runs the handler again. A response
+is stored only once the handler, writes included, has finished, and the
+claim of an attempt that fails is released so that a retry can run it
+afresh.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import collections
+import deadline
+import dynamodb_access
+from botocore.exceptions import ClientError
+from user_store import DEFAULT_SQLITE_PATH
+from resilience import CircuitBreaker, STORAGE_ERRORS
+
+REQUEST_LOG_TABLE_NAME = 'LLPTutor_RequestLog'
+
+# How long a claimed request is remembered. Alexa retries within seconds, so
+# an hour is plenty; DynamoDB's TTL on ExpiresAt cleans up after that.
+REQUEST_MARKER_TTL = 3600
+
+# A claim without a response is taken to belong to an attempt that died once
+# it is this many seconds old, well past the Lambda timeout.
+CLAIM_TIMEOUT = 30
+
+# How often a retry checks for the response of an attempt still running.
+RESPONSE_POLL_INTERVAL = 0.1
+
+# Outcomes of claiming a request.
+CLAIMED = 'claimed'
+RECLAIMED = 'reclaimed'
+COMPLETED = 'completed'
+IN_PROGRESS = 'in_progress'
+
+class RequestInProgressError(Exception):
+    """ Raised for a retry whose first attempt is still running, when there
+    is no response to answer it with. """
+
+    def __init__(self, request_id):
+        super(RequestInProgressError, self).__init__(request_id)
+        self.request_id = request_id
+
+class ResponseCache(object):
+    """ Bounded least-recently-used map of requestId -> serialized response. """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, request_id):
+        with self._lock:
+            response = self._entries.get(request_id)
+            if response is not None:
+                self._entries.move_to_end(request_id)
+            return response
+
+    def put(self, request_id, response):
+        with self._lock:
+            self._entries[request_id] = response
+            self._entries.move_to_end(request_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# --------------- Request markers --------------- #
+
+class DynamoDBRequestLog(object):
+    """ Request markers kept in the LLPTutor_RequestLog DynamoDB table. """
+
+    def __init__(self, table_name=REQUEST_LOG_TABLE_NAME):
+        self.table_name = table_name
+
+    def claim(self, request_id):
+        """ Claims a request. Returns (outcome, stored response or None), the
+        outcome being CLAIMED the first time the request is seen, RECLAIMED
+        if an earlier claim timed out without a response, COMPLETED if there
+        is a response and IN_PROGRESS otherwise. """
+
+        now = int(time.time())
+        try:
+            result = dynamodb_access.call(
+                self.table_name,
+                'put_item',
+                Item={
+                    'RequestID': request_id,
+                    'ClaimedAt': now,
+                    'ExpiresAt': now + REQUEST_MARKER_TTL
+                },
+                ConditionExpression="attribute_not_exists(RequestID) OR "
+                                    "(attribute_not_exists(#resp) AND "
+                                    "(attribute_not_exists(ClaimedAt) OR ClaimedAt < :stale))",
+                ExpressionAttributeNames={
+                    '#resp': 'Response'
+                },
+                ExpressionAttributeValues={
+                    ':stale': now - CLAIM_TIMEOUT
+                },
+                ReturnValues='ALL_OLD'
+            )
+            return (RECLAIMED if result.get('Attributes') else CLAIMED), None
+        except ClientError as error:
+            if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        stored = self.response(request_id)
+        return (COMPLETED if stored is not None else IN_PROGRESS), stored
+
+    def response(self, request_id):
+        """ Returns the stored response of a request, or None. """
+
+        item = dynamodb_access.call(
+            self.table_name, 'get_item', Key={'RequestID': request_id},
+            ConsistentRead=True).get('Item', {})
+        return item.get('Response')
+
+    def complete(self, request_id, response):
+        """ Stores the serialized response of a claimed request. """
+
+        dynamodb_access.call(
+            self.table_name,
+            'update_item',
+            Key={
+                'RequestID': request_id,
+            },
+            UpdateExpression="set #resp = :resp",
+            ExpressionAttributeNames={
+                '#resp': 'Response'
+            },
+            ExpressionAttributeValues={
+                ':resp': response
+            }
+        )
+
+    def release(self, request_id):
+        """ Drops the claim of a request that failed, unless it has a
+        response. """
+
+        try:
+            dynamodb_access.call(
+                self.table_name,
+                'delete_item',
+                Key={
+                    'RequestID': request_id,
+                },
+                ConditionExpression="attribute_not_exists(#resp)",
+                ExpressionAttributeNames={
+                    '#resp': 'Response'
+                }
+            )
+        except ClientError as error:
+            if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+class SQLiteRequestLog(object):
+    """ Request markers kept in a table next to the SQLite user store. """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._claims = 0
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS request_log ("
+            " request_id TEXT PRIMARY KEY,"
+            " expires_at INTEGER NOT NULL,"
+            " claimed_at INTEGER,"
+            " response TEXT)"
+        )
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(request_log)")]
+        if 'claimed_at' not in columns:
+            connection.execute("ALTER TABLE request_log ADD COLUMN claimed_at INTEGER")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                         check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def claim(self, request_id):
+        connection = self._connection()
+        now = int(time.time())
+        self._claims += 1
+        if self._claims % 1000 == 0:
+            connection.execute("DELETE FROM request_log WHERE expires_at < ?", (now,))
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT claimed_at, response FROM request_log WHERE request_id = ?", (request_id,)
+            ).fetchone()
+            if row is None:
+                outcome, stored = CLAIMED, None
+                connection.execute(
+                    "INSERT INTO request_log (request_id, expires_at, claimed_at) VALUES (?, ?, ?)",
+                    (request_id, now + REQUEST_MARKER_TTL, now)
+                )
+            elif row[1] is not None:
+                outcome, stored = COMPLETED, row[1]
+            elif row[0] is None or row[0] < now - CLAIM_TIMEOUT:
+                outcome, stored = RECLAIMED, None
+                connection.execute(
+                    "UPDATE request_log SET claimed_at = ?, expires_at = ? WHERE request_id = ?",
+                    (now, now + REQUEST_MARKER_TTL, request_id)
+                )
+            else:
+                outcome, stored = IN_PROGRESS, None
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return outcome, stored
+
+    def response(self, request_id):
+        row = self._connection().execute(
+            "SELECT response FROM request_log WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def complete(self, request_id, response):
+        self._connection().execute(
+            "UPDATE request_log SET response = ? WHERE request_id = ?", (response, request_id)
+        )
+
+    def release(self, request_id):
+        self._connection().execute(
+            "DELETE FROM request_log WHERE request_id = ? AND response IS NULL", (request_id,)
+        )
+
+# --------------- Deduplication --------------- #
+
+class RequestDeduplicator(object):
+    """ Runs each requestId at most once and replays its response on retries. """
+
+    def __init__(self, request_log, cache_size=256, breaker=None):
+        self.request_log = request_log
+        self.cache = ResponseCache(cache_size)
+        self.breaker = breaker or CircuitBreaker('request_log')
+        self.unprotected = 0
+        self.replayed = 0
+        self.reexecuted = 0
+        self.in_progress = 0
+
+    def run_once(self, request_id, handler, in_progress=None):
+        """ Returns handler() for a new request, or the stored response if the
+        request has already been handled. A retry of a request still being
+        handled gets in_progress() if its response does not come in time, or
+        RequestInProgressError if there is no in_progress. """
+
+        cached = self.cache.get(request_id)
+        if cached is not None:
+            self.replayed += 1
+            return json.loads(cached)
+
+        # If the marker store is down, the request still runs; it is only
+        # unprotected against a retry for as long as the outage lasts.
+        protected = True
+        try:
+            outcome, stored = self.breaker.call(self.request_log.claim, request_id)
+        except STORAGE_ERRORS:
+            outcome, stored = CLAIMED, None
+            protected = False
+            self.unprotected += 1
+        if outcome == IN_PROGRESS:
+            stored = self._wait_for_response(request_id)
+            if stored is None:
+                self.in_progress += 1
+                if in_progress is None:
+                    raise RequestInProgressError(request_id)
+                return in_progress()
+        if stored is not None:
+            self.cache.put(request_id, stored)
+            self.replayed += 1
+            return json.loads(stored)
+        if outcome == RECLAIMED:
+            # The first attempt never stored a response and has run out of
+            # time, so it died before finishing.
+            self.reexecuted += 1
+
+        try:
+            response = handler()
+        except Exception:
+            if protected:
+                try:
+                    self.breaker.call(self.request_log.release, request_id)
+                except STORAGE_ERRORS:
+                    pass
+            raise
+        serialized = json.dumps(response, default=str)
+        self.cache.put(request_id, serialized)
+        try:
+            self.breaker.call(self.request_log.complete, request_id, serialized)
+        except STORAGE_ERRORS:
+            pass
+        return response
+
+    def _wait_for_response(self, request_id):
+        """ Waits for the response of an attempt still running, while the
+        current request's deadline allows. Returns it, or None. """
+
+        request_deadline = deadline.current_deadline() or deadline.RequestDeadline()
+        wait_ms = RESPONSE_POLL_INTERVAL * 1000 + deadline.RESPONSE_RESERVE_MS
+        while request_deadline.remaining_ms() > wait_ms:
+            time.sleep(RESPONSE_POLL_INTERVAL)
+            try:
+                stored = self.breaker.call(self.request_log.response, request_id)
+            except STORAGE_ERRORS:
+                return None
+            if stored is not None:
+                return stored
+        return None
+
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+def get_deduplicator():
+    """ Returns the deduplicator shared by every request in this process. The
+    marker backend follows the TUTOR_USER_STORE setting. """
+
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                if os.environ.get('TUTOR_USER_STORE', 'dynamodb') == 'sqlite':
+                    request_log = SQLiteRequestLog(
+                        os.environ.get('TUTOR_SQLITE_PATH', DEFAULT_SQLITE_PATH))
+                else:
+                    request_log = DynamoDBRequestLog()
+                _deduplicator = RequestDeduplicator(request_log)
+    return _deduplicator
+
+def set_deduplicator(deduplicator):
+    """ Replaces the shared deduplicator, e.g. in load tests. """
+
+    global _deduplicator
+    with _deduplicator_lock:
+        _deduplicator = deduplicator
@@ -0,0 +1,209 @@
+"""
+Monte Carlo simulation of the question difficulty leveling rule.
+
+Runs a large batch of synthetic learners through leveling.next_question_level
+with NumPy, one question at a time for the whole batch. Each question the
+level is updated from the learner's totals (as update_user_level does when a
+question is requested) and the learner answers it correctly with probability
+
+    1 / (1 + exp(difficulty[level] - ability))
+
+where ability is drawn per learner from a normal distribution and can grow
+with every answer. For each pair of thresholds the simulation reports how
+long learners take to reach the top level, how often the level reverses
+direction, and where learners spend their questions:
+
+    python level_simulator.py --learners 1000000 --questions 60
+    python level_simulator.py --sweep-up 2,3,4,5,6 --sweep-down 2,3,4
+
+--verify checks the vectorized rule against next_question_level on random
+states before simulating.
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import leveling
+from leveling import MIN_LEVEL, MAX_LEVEL
+
+# Difficulty of each question level on the same scale as learner ability.
+LEVEL_DIFFICULTY = {1: -1.0, 2: 0.0, 3: 1.0, 4: 2.0}
+
+# Learners are simulated in chunks of this size to bound memory use.
+CHUNK_SIZE = 250000
+
+def next_question_levels(levels, correct, incorrect, previous_correct, previous_incorrect,
+                         level_up_every=leveling.LEVEL_UP_EVERY,
+                         level_down_every=leveling.LEVEL_DOWN_EVERY):
+    """ next_question_level applied element-wise to integer arrays. """
+
+    correct_step = correct % level_up_every == 0
+    incorrect_step = incorrect % level_down_every == 0
+    any_correct = correct != 0
+    any_incorrect = incorrect != 0
+
+    only_correct = any_correct & ~any_incorrect
+    only_incorrect = ~any_correct & any_incorrect
+    mixed = any_correct & any_incorrect
+    stagnant = ((previous_correct == correct) & ~incorrect_step) \
+        | ((previous_incorrect == incorrect) & ~correct_step)
+
+    step = np.zeros_like(levels)
+    step[only_correct & correct_step] = 1
+    step[only_incorrect & incorrect_step & (levels != MIN_LEVEL)] = -1
+    moving = mixed & ~stagnant
+    step[moving & incorrect_step] = -1
+    step[moving & correct_step & ~incorrect_step] = 1
+    return np.clip(levels + step, MIN_LEVEL, MAX_LEVEL)
+
+def simulate(learners, questions, level_up_every=leveling.LEVEL_UP_EVERY,
+             level_down_every=leveling.LEVEL_DOWN_EVERY, ability_mean=0.5, ability_sd=1.0,
+             learning_rate=0.0, seed=0):
+    """ Simulates learners answering questions and returns summary
+    statistics for the leveling rule. """
+
+    rng = np.random.default_rng(seed)
+    difficulty = np.array([LEVEL_DIFFICULTY.get(level, 0.0) for level in range(MAX_LEVEL + 1)])
+    first_top = []
+    reversals = np.zeros(learners, dtype=np.int64)
+    level_counts = np.zeros(MAX_LEVEL + 1, dtype=np.int64)
+    final_counts = np.zeros(MAX_LEVEL + 1, dtype=np.int64)
+    total_correct = 0
+
+    for start in range(0, learners, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, learners - start)
+        ability = rng.normal(ability_mean, ability_sd, size)
+        levels = np.full(size, MIN_LEVEL, dtype=np.int64)
+        correct = np.zeros(size, dtype=np.int64)
+        incorrect = np.zeros(size, dtype=np.int64)
+        previous_correct = np.zeros(size, dtype=np.int64)
+        previous_incorrect = np.zeros(size, dtype=np.int64)
+        last_direction = np.zeros(size, dtype=np.int64)
+        reached_top = np.full(size, -1, dtype=np.int64)
+        chunk_reversals = np.zeros(size, dtype=np.int64)
+
+        for question_num in range(questions):
+            new_levels = next_question_levels(levels, correct, incorrect, previous_correct,
+                                              previous_incorrect, level_up_every,
+                                              level_down_every)
+            direction = np.sign(new_levels - levels)
+            chunk_reversals += (direction != 0) & (direction == -last_direction)
+            last_direction = np.where(direction != 0, direction, last_direction)
+            levels = new_levels
+            previous_correct = correct.copy()
+            previous_incorrect = incorrect.copy()
+
+            reached_top[(reached_top < 0) & (levels == MAX_LEVEL)] = question_num
+            level_counts += np.bincount(levels, minlength=MAX_LEVEL + 1)
+
+            answered_correctly = rng.random(size) < 1.0 / (1.0 + np.exp(difficulty[levels] - ability))
+            correct += answered_correctly
+            incorrect += ~answered_correctly
+            ability += learning_rate
+
+        first_top.append(reached_top)
+        reversals[start:start + size] = chunk_reversals
+        final_counts += np.bincount(levels, minlength=MAX_LEVEL + 1)
+        total_correct += int(correct.sum())
+
+    first_top = np.concatenate(first_top)
+    reached = first_top[first_top >= 0]
+    answers = learners * questions
+    return {
+        'level_up_every': level_up_every,
+        'level_down_every': level_down_every,
+        'learners': learners,
+        'questions': questions,
+        'accuracy': total_correct / float(answers),
+        'reached_top_level': len(reached) / float(learners),
+        'questions_to_top_level_mean': float(reached.mean()) if len(reached) else None,
+        'questions_to_top_level_median': float(np.median(reached)) if len(reached) else None,
+        'reversals_per_learner': float(reversals.mean()),
+        'oscillating_learners': float((reversals >= 2).mean()),
+        'level_share': {str(level): level_counts[level] / float(answers)
+                        for level in range(MIN_LEVEL, MAX_LEVEL + 1)},
+        'final_level_share': {str(level): final_counts[level] / float(learners)
+                              for level in range(MIN_LEVEL, MAX_LEVEL + 1)}
+    }
+
+def verify(states=200000, seed=0):
+    """ Checks next_question_levels against next_question_level on random
+    states. Returns the number of states where they disagree. """
+
+    rng = np.random.default_rng(seed)
+    mismatches = 0
+    for level_up_every, level_down_every in ((leveling.LEVEL_UP_EVERY, leveling.LEVEL_DOWN_EVERY),
+                                             (2, 5), (5, 2)):
+        levels = rng.integers(MIN_LEVEL, MAX_LEVEL + 1, states)
+        correct = rng.integers(0, 20, states)
+        incorrect = rng.integers(0, 20, states)
+        # Previous totals are usually equal to or just below the current ones.
+        previous_correct = np.maximum(correct - rng.integers(0, 2, states), 0)
+        previous_incorrect = np.maximum(incorrect - rng.integers(0, 2, states), 0)
+        vectorized = next_question_levels(levels, correct, incorrect, previous_correct,
+                                          previous_incorrect, level_up_every, level_down_every)
+        for num in range(states):
+            expected = leveling.next_question_level(
+                int(levels[num]), int(correct[num]), int(incorrect[num]),
+                int(previous_correct[num]), int(previous_incorrect[num]),
+                level_up_every, level_down_every)
+            if expected != vectorized[num]:
+                mismatches += 1
+    return mismatches
+
+def print_result(result, seconds):
+    def optional(value):
+        return "%.1f" % value if value is not None else "-"
+
+    print("up every %d, down every %d: accuracy %.1f%%, reached level %d %.1f%% "
+          "(mean %s, median %s questions), %.2f reversals/learner, %.1f%% oscillating  [%.1fs]" % (
+              result['level_up_every'], result['level_down_every'], result['accuracy'] * 100,
+              MAX_LEVEL, result['reached_top_level'] * 100,
+              optional(result['questions_to_top_level_mean']),
+              optional(result['questions_to_top_level_median']),
+              result['reversals_per_learner'], result['oscillating_learners'] * 100, seconds))
+    print("    questions at level  " + "  ".join(
+        "%s: %5.1f%%" % (level, share * 100) for level, share in result['level_share'].items()))
+    print("    final level         " + "  ".join(
+        "%s: %5.1f%%" % (level, share * 100) for level, share in result['final_level_share'].items()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the question leveling rule.")
+    parser.add_argument('--learners', type=int, default=100000)
+    parser.add_argument('--questions', type=int, default=60, help="Questions per learner")
+    parser.add_argument('--sweep-up', default=str(leveling.LEVEL_UP_EVERY),
+                        help="Comma separated correct answer thresholds to try")
+    parser.add_argument('--sweep-down', default=str(leveling.LEVEL_DOWN_EVERY),
+                        help="Comma separated incorrect answer thresholds to try")
+    parser.add_argument('--ability-mean', type=float, default=0.5)
+    parser.add_argument('--ability-sd', type=float, default=1.0)
+    parser.add_argument('--learning-rate', type=float, default=0.0,
+                        help="Ability gained with every answer")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verify', action='store_true',
+                        help="Check the vectorized rule against next_question_level first")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        mismatches = verify(seed=args.seed)
+        print("verify: " + str(mismatches) + " mismatches", file=sys.stderr)
+        if mismatches:
+            return 1
+
+    results = []
+    for level_up_every in (int(value) for value in args.sweep_up.split(',')):
+        for level_down_every in (int(value) for value in args.sweep_down.split(',')):
+            start = time.perf_counter()
+            result = simulate(args.learners, args.questions, level_up_every, level_down_every,
+                              args.ability_mean, args.ability_sd, args.learning_rate, args.seed)
+            results.append(result)
+            if not args.json:
+                print_result(result, time.perf_counter() - start)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+The rule that moves a user between question difficulty levels. Kept free of
+any storage access so the skill, the leveling simulator and offline grading
+all apply exactly the same rule.
+"""
+
+MIN_LEVEL = 1
+MAX_LEVEL = 4
+
+# A user moves up a level on every multiple of LEVEL_UP_EVERY correct answers
+# and down a level on every multiple of LEVEL_DOWN_EVERY incorrect answers.
+LEVEL_UP_EVERY = 4
+LEVEL_DOWN_EVERY = 3
+
+def next_question_level(question_level, current_total_correct, current_total_incorrect,
+                        previous_total_correct, previous_total_incorrect,
+                        level_up_every=LEVEL_UP_EVERY, level_down_every=LEVEL_DOWN_EVERY):
+    """ Returns the question difficulty level a user moves to given their
+    current level, their current correct/incorrect totals, and the totals from
+    the last time the level was updated. """
+
+    new_level = question_level
+
+    # Whether the totals just reached a multiple that moves the level
+    correct_step = current_total_correct % level_up_every == 0
+    incorrect_step = current_total_incorrect % level_down_every == 0
+
+    # Conditionals to update level, MAX_LEVEL is the max difficulty level
+    if question_level <= MAX_LEVEL:
+        # Conditionals to deal with initial conditions that could happen when
+        # the user first starts answering questions.
+        if current_total_correct == 0 and current_total_incorrect == 0:
+            pass
+        elif current_total_correct != 0 and current_total_incorrect == 0:
+            if correct_step:
+                new_level += 1
+        elif current_total_correct == 0 and current_total_incorrect != 0:
+            if incorrect_step and question_level != MIN_LEVEL:
+                new_level -= 1
+
+        # The following conditionals deal with conditions that can happen after a user
+        # has questions both right and wrong.
+        else:
+            if (previous_total_correct == current_total_correct and not incorrect_step)\
+                or (previous_total_incorrect == current_total_incorrect and not correct_step):
+                pass
+            elif correct_step and incorrect_step:
+                new_level -= 1
+            elif correct_step and not incorrect_step:
+                new_level += 1
+            elif not correct_step and incorrect_step:
+                new_level -= 1
+
+    # Keeps user level limited to 1 through MAX_LEVEL
+    return min(max(new_level, MIN_LEVEL), MAX_LEVEL)
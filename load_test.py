@@ -0,0 +1,393 @@
+"""
+Whole-system load test with synthetic learners.
+
+Each learner walks the flows a real user would: launch the skill, get tutored
+through a few statements, answer a round of quiz questions (correctly with a
+probability given by its skill for the question's attribute), ask for
+feedback and review it, then stop. Learners run concurrently and the number
+of them is ramped up in stages. For every stage the test reports sustained
+requests per second, error rate, latency percentiles per intent, the size of
+the session attributes and whole responses and, when run in-process, storage
+calls per session.
+
+By default requests go straight to lambda_handler in this process with the
+SQLite user store and the content snapshot, so no AWS access is needed:
+
+    python load_test.py --stages 1,8,32 --duration 20
+
+To load a running server.py instead:
+
+    python load_test.py --url http://localhost:8080/ --stages 8,64,256
+
+--record writes every event sent to a file, one per line, which
+golden_replay.py can replay as an event sequence.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import contextlib
+import urllib.request
+
+APPLICATION_ID = "amzn1.ask.skill.c32dfdf8-721b-4772-a801-98941de04300"
+
+# --------------- Sending requests --------------- #
+
+class LocalTarget(object):
+    """ Calls lambda_handler in this process and counts the storage calls the
+    handlers make. """
+
+    name = 'local'
+
+    def __init__(self):
+        import alexa_plc_counter_instruction_tutor as tutor
+        import content_catalog
+        import user_store
+        self.tutor = tutor
+        self.content = content_catalog.get_content()
+        self.storage_calls = 0
+        self._lock = threading.Lock()
+        user_store.set_user_store(CountingProxy(user_store.get_user_store(), self))
+        content_catalog.set_content(CountingProxy(content_catalog.get_content(), self))
+
+    def count_call(self):
+        with self._lock:
+            self.storage_calls += 1
+
+    def send(self, event):
+        return self.tutor.lambda_handler(event, LocalContext())
+
+    def decode_state(self, attributes):
+        import session_state
+        return session_state.decode(attributes, self.content.catalog())
+
+class LocalContext(object):
+    def __init__(self):
+        self.expires_at = time.monotonic() + 8.0
+
+    def get_remaining_time_in_millis(self):
+        return int((self.expires_at - time.monotonic()) * 1000)
+
+class CountingProxy(object):
+    """ Forwards to a user store or content source, counting method calls.
+    Getting the content's in-memory catalog is not counted. """
+
+    UNCOUNTED = ('catalog',)
+
+    def __init__(self, target, counter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute) or name.startswith('_') or name in self.UNCOUNTED:
+            return attribute
+
+        def counted(*args, **kwargs):
+            self._counter.count_call()
+            return attribute(*args, **kwargs)
+        return counted
+
+class HTTPTarget(object):
+    """ Posts requests to a running server.py. """
+
+    name = 'http'
+    storage_calls = None
+
+    def __init__(self, url):
+        import content_catalog
+        self.url = url
+        self.content = content_catalog.get_content()
+
+    def send(self, event):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(event).encode('utf-8'), method='POST',
+            headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+    def decode_state(self, attributes):
+        # Decoded against this process's content, which must be the same as
+        # the server's.
+        import session_state
+        return session_state.decode(attributes, self.content.catalog())
+
+# --------------- Synthetic learners --------------- #
+
+class Learner(object):
+    """ A simulated user with a probability of answering correctly for each
+    attribute, drawn the first time the attribute comes up. """
+
+    def __init__(self, target, recorder, rng, skill):
+        self.target = target
+        self.recorder = recorder
+        self.rng = rng
+        self.user_id = 'amzn1.ask.account.loadtest-' + uuid.uuid4().hex
+        self.mean_skill = skill
+        self.skill = {}
+        self.attributes = {}
+        self.state = {}
+
+    def request(self, request_type, intent_name=None, slots=None, new=False):
+        request = {
+            'type': request_type,
+            'requestId': 'amzn1.echo-api.request.' + uuid.uuid4().hex,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'locale': 'en-US'
+        }
+        if intent_name is not None:
+            request['intent'] = {'name': intent_name, 'slots': slots or {}}
+        event = {
+            'version': '1.0',
+            'session': {
+                'new': new,
+                'sessionId': self.session_id,
+                'application': {'applicationId': APPLICATION_ID},
+                'attributes': self.attributes,
+                'user': {'userId': self.user_id}
+            },
+            'request': request
+        }
+
+        self.recorder.record_event(event)
+        label = intent_name or request_type
+        start = time.perf_counter()
+        try:
+            response = self.target.send(event)
+        except Exception as error:
+            self.recorder.record(label, time.perf_counter() - start, error)
+            raise
+        self.recorder.record(label, time.perf_counter() - start, None)
+        self.attributes = (response or {}).get('sessionAttributes') or {}
+        self.recorder.record_size(json_size(self.attributes), json_size(response))
+        self.state = self.target.decode_state(self.attributes)
+        return response
+
+    def answer(self):
+        """ Answers the current question, correctly with the learner's skill
+        for the question's attribute. """
+
+        attribute = self.state.get('QuestionAttribute')
+        if attribute not in self.skill:
+            self.skill[attribute] = min(max(self.rng.gauss(self.mean_skill, 0.15), 0.0), 1.0)
+        correct = self.rng.random() < self.skill[attribute]
+        if self.state.get('QuestionType') == 'TrueFalse':
+            right = self.state.get('PartialAnswer', 'true')
+            value = right if correct else ('false' if right == 'true' else 'true')
+        elif self.state.get('QuestionType') == 'MultipleChoice':
+            right = self.state.get('Answer', 'A')
+            wrong = [letter for letter in 'ABC' if letter != right]
+            value = right if correct else self.rng.choice(wrong)
+        else:
+            parts = self.state.get('Parts', [])
+            right = self.state.get('Answer', 'Both')
+            choices = parts + ['both' if len(parts) == 2 else 'more than one']
+            right = right if right in parts else choices[-1]
+            wrong = [choice for choice in choices if choice != right]
+            value = right if correct else self.rng.choice(wrong)
+        self.request('IntentRequest', 'AnswerIntent', {'Answer': {'name': 'Answer', 'value': value}})
+
+    def run_session(self):
+        """ One study session: launch, tutoring, a quiz round, feedback and
+        review. """
+
+        self.session_id = 'amzn1.echo-api.session.' + uuid.uuid4().hex
+        self.attributes = {}
+        self.state = {}
+        self.request('LaunchRequest', new=True)
+
+        for _ in range(self.rng.randint(0, 6)):
+            self.request('IntentRequest', 'TutorIntent')
+
+        self.request('IntentRequest', 'QuestionIntent')
+        for question_num in range(self.rng.randint(3, 10)):
+            if question_num:
+                self.request('IntentRequest', 'AMAZON.YesIntent')
+            if self.rng.random() < 0.05:
+                self.request('IntentRequest', 'AMAZON.RepeatIntent')
+            self.answer()
+
+        self.request('IntentRequest', 'AMAZON.NoIntent')
+        feedback = self.state.get('QuizFeedback', {})
+        if feedback and 'None' not in feedback:
+            self.request('IntentRequest', 'AMAZON.YesIntent')
+        self.request('IntentRequest', 'AMAZON.StopIntent')
+
+# --------------- Measurements --------------- #
+
+def json_size(value):
+    return len(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+class Recorder(object):
+    """ Collects request latencies and errors per intent, and the sizes of
+    responses and their session attributes. Events sent are written to
+    event_file if there is one. """
+
+    def __init__(self, event_file=None):
+        self.event_file = event_file
+        self.latencies = {}
+        self.errors = 0
+        self.sessions = 0
+        self.session_sizes = []
+        self.response_sizes = []
+        self._lock = threading.Lock()
+
+    def record(self, label, seconds, error):
+        with self._lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if error is not None:
+                self.errors += 1
+
+    def record_size(self, session_size, response_size):
+        with self._lock:
+            self.session_sizes.append(session_size)
+            self.response_sizes.append(response_size)
+
+    def record_event(self, event):
+        if self.event_file is None:
+            return
+        # Replays thread session attributes through themselves, so they are
+        # left out.
+        session = {key: value for key, value in event['session'].items() if key != 'attributes'}
+        line = json.dumps(dict(event, session=session), separators=(',', ':'))
+        with self._lock:
+            self.event_file.write(line + "\n")
+
+    def session_done(self):
+        with self._lock:
+            self.sessions += 1
+
+def percentile(values, fraction):
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+def run_stage(target, concurrency, duration, skill, seed, event_file=None):
+    """ Runs concurrency learners for duration seconds and returns the
+    stage's measurements. """
+
+    recorder = Recorder(event_file)
+    stop_at = time.monotonic() + duration
+    storage_calls_before = target.storage_calls
+
+    def learner_loop(learner_num):
+        rng = random.Random(seed * 100003 + learner_num)
+        learner = Learner(target, recorder, rng, skill)
+        while time.monotonic() < stop_at:
+            try:
+                learner.run_session()
+            except Exception:
+                # The error is already recorded; start a fresh session.
+                continue
+            recorder.session_done()
+
+    threads = [threading.Thread(target=learner_loop, args=(num,)) for num in range(concurrency)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    all_latencies = sorted(value for values in recorder.latencies.values() for value in values)
+    result = {
+        'concurrency': concurrency,
+        'requests': len(all_latencies),
+        'requests_per_second': len(all_latencies) / elapsed,
+        'sessions': recorder.sessions,
+        'error_rate': recorder.errors / float(max(len(all_latencies), 1)),
+        'intents': {}
+    }
+    if target.storage_calls is not None and recorder.sessions:
+        result['storage_calls_per_session'] = \
+            (target.storage_calls - storage_calls_before) / float(recorder.sessions)
+    for label, values in sorted(recorder.latencies.items()):
+        values.sort()
+        result['intents'][label] = {
+            'count': len(values),
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000
+        }
+    if all_latencies:
+        result['p50_ms'] = percentile(all_latencies, 0.50) * 1000
+        result['p99_ms'] = percentile(all_latencies, 0.99) * 1000
+    if recorder.session_sizes:
+        session_sizes = sorted(recorder.session_sizes)
+        result['session_attributes_bytes'] = {
+            'mean': sum(session_sizes) / float(len(session_sizes)),
+            'p95': percentile(session_sizes, 0.95),
+            'max': session_sizes[-1]
+        }
+        result['response_bytes_mean'] = \
+            sum(recorder.response_sizes) / float(len(recorder.response_sizes))
+    return result
+
+def print_stage(result):
+    line = "concurrency %d: %.1f req/s, %d sessions, error rate %.2f%%" % (
+        result['concurrency'], result['requests_per_second'], result['sessions'],
+        result['error_rate'] * 100)
+    if 'p50_ms' in result:
+        line += ", p50 %.1fms, p99 %.1fms" % (result['p50_ms'], result['p99_ms'])
+    if 'storage_calls_per_session' in result:
+        line += ", %.1f storage calls/session" % result['storage_calls_per_session']
+    print(line)
+    if 'session_attributes_bytes' in result:
+        sizes = result['session_attributes_bytes']
+        print("    session attributes %.0f bytes mean, %d p95, %d max; responses %.0f bytes mean" % (
+            sizes['mean'], sizes['p95'], sizes['max'], result['response_bytes_mean']))
+    for label, values in result['intents'].items():
+        print("    %-24s %6d  p50 %7.1fms  p95 %7.1fms  p99 %7.1fms" % (
+            label, values['count'], values['p50_ms'], values['p95_ms'], values['p99_ms']))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the tutor with synthetic learners.")
+    parser.add_argument('--stages', default='1,4,16',
+                        help="Comma separated numbers of concurrent learners")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per stage")
+    parser.add_argument('--skill', type=float, default=0.7,
+                        help="Mean probability of answering correctly")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help="Load a running server.py instead of running in-process")
+    parser.add_argument('--sqlite-path', default='llptutor_loadtest.db')
+    parser.add_argument('--snapshot', help="Content snapshot to serve in-process and to decode session attributes with")
+    parser.add_argument('--record', help="Write the events sent to this file")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--verbose', action='store_true',
+                        help="Keep the handlers' own output instead of discarding it")
+    args = parser.parse_args(argv)
+
+    # Session attributes are decoded against the content, so it is loaded
+    # here even when loading a server.
+    os.environ.setdefault('TUTOR_CONTENT_SOURCE', 'snapshot')
+    if args.snapshot:
+        os.environ['TUTOR_SNAPSHOT_PATH'] = args.snapshot
+    if args.url:
+        target = HTTPTarget(args.url)
+    else:
+        os.environ.setdefault('TUTOR_USER_STORE', 'sqlite')
+        os.environ.setdefault('TUTOR_SQLITE_PATH', args.sqlite_path)
+        target = LocalTarget()
+
+    results = []
+    event_file = open(args.record, 'w') if args.record else None
+    try:
+        for stage_num, concurrency in enumerate(int(stage) for stage in args.stages.split(',')):
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                    result = run_stage(target, concurrency, args.duration, args.skill,
+                                       args.seed + stage_num, event_file)
+            results.append(result)
+            if not args.json:
+                print_stage(result)
+    finally:
+        if event_file is not None:
+            event_file.close()
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    sys.exit(main())
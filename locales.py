@@ -0,0 +1,130 @@
+"""
+Locales the skill speaks in.
+
+Alexa sends the locale of each request (event['request']['locale']). The
+default locale's content and phrases are the ones the skill always had.
+TUTOR_LOCALES lists the other locales there is content for, e.g.
+"de-DE,fr-FR". A request in a locale without content of its own is served in
+a locale of the same language if there is one, and in the default otherwise.
+
+A locale's content lives in tables and files named after the default
+locale's with the locale appended, e.g. TutorTable.de-DE and
+content_snapshot.de-DE.json. It is loaded the first time a request needs it,
+and at most TUTOR_MAX_LOCALES locales besides the default stay in memory, the
+one used least recently being dropped first. The default locale's content is
+loaded as it always was and never dropped, so locales that are not used cost
+nothing.
+"""
+
+import os
+import threading
+import collections
+
+DEFAULT_LOCALE = 'en-US'
+
+MAX_RESIDENT_LOCALES = int(os.environ.get('TUTOR_MAX_LOCALES', '4'))
+
+SUPPORTED_LOCALES = [DEFAULT_LOCALE] + [
+    locale.strip() for locale in os.environ.get('TUTOR_LOCALES', '').split(',')
+    if locale.strip() and locale.strip() != DEFAULT_LOCALE]
+
+_resolved = {}
+_local = threading.local()
+
+def resolve_locale(locale):
+    """ Returns the supported locale that serves a request's locale. """
+
+    resolved = _resolved.get(locale)
+    if resolved is None:
+        resolved = DEFAULT_LOCALE
+        if locale in SUPPORTED_LOCALES:
+            resolved = locale
+        elif locale:
+            language = locale.split('-')[0].lower()
+            for supported in SUPPORTED_LOCALES:
+                if supported.split('-')[0].lower() == language:
+                    resolved = supported
+                    break
+        _resolved[locale] = resolved
+    return resolved
+
+def localized_name(name, locale):
+    """ Returns the name of a table or file for a locale. """
+
+    if locale == DEFAULT_LOCALE:
+        return name
+    return name + '.' + locale
+
+def localized_path(path, locale):
+    """ Returns the path of a file for a locale, with the locale before the
+    extension. """
+
+    if locale == DEFAULT_LOCALE:
+        return path
+    root, extension = os.path.splitext(path)
+    return root + '.' + locale + extension
+
+def current_locale():
+    """ Returns the supported locale of the request being handled on this
+    thread, or the default locale outside a request. """
+
+    return getattr(_local, 'locale', None) or DEFAULT_LOCALE
+
+def set_current_locale(locale):
+    """ Makes locale the current one on this thread, resolved to a supported
+    locale. None goes back to the default. """
+
+    _local.locale = resolve_locale(locale) if locale else None
+
+class LocaleCache(object):
+    """ Something loaded per locale, such as its content, with load(locale)
+    on first use. The default locale's is kept for good; of the others at
+    most max_resident are kept, dropping the least recently used. """
+
+    def __init__(self, load, max_resident=MAX_RESIDENT_LOCALES):
+        self.load = load
+        self.max_resident = max_resident
+        self.evictions = 0
+        self._default = None
+        self._resident = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, locale):
+        if locale == DEFAULT_LOCALE:
+            if self._default is None:
+                with self._lock:
+                    if self._default is None:
+                        self._default = self.load(locale)
+            return self._default
+
+        with self._lock:
+            value = self._resident.get(locale)
+            if value is not None:
+                self._resident.move_to_end(locale)
+                return value
+        # Loading can take a while, so it does not hold up requests in other
+        # locales. Two requests loading the same locale keep the first load.
+        value = self.load(locale)
+        with self._lock:
+            value = self._resident.setdefault(locale, value)
+            self._resident.move_to_end(locale)
+            while len(self._resident) > self.max_resident:
+                self._resident.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def set(self, locale, value):
+        """ Replaces what is kept for a locale. """
+
+        with self._lock:
+            if locale == DEFAULT_LOCALE:
+                self._default = value
+            else:
+                self._resident[locale] = value
+                self._resident.move_to_end(locale)
+
+    def resident(self):
+        """ Returns the locales loaded into memory, the default first. """
+
+        with self._lock:
+            return ([DEFAULT_LOCALE] if self._default is not None else []) + list(self._resident)
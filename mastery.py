@@ -0,0 +1,139 @@
+"""
+Per-attribute mastery estimates using Bayesian Knowledge Tracing.
+
+For every attribute the user has answered about, the user item holds the
+probability that the user knows it, in a 'Mastery' map of integers scaled by
+MASTERY_SCALE; attributes not in the map are at PRIOR_MASTERY. Each answer
+updates the estimate for its attribute in constant time: the
+probability is first conditioned on the answer (allowing for slips and
+lucky guesses), then the chance of having learned the attribute from the
+question is added. Question scheduling and quiz feedback read the estimates
+directly instead of re-deriving them from the answer counters.
+
+The few attributes with the lowest mastery are also kept in a small
+'WeakestAttributes' map, maintained as answers come in, so quiz feedback only
+has to look at those.
+
+Like the answer counters and the review schedule, the map is keyed by
+attribute name rather than by position in the content's attribute order.
+Positions shift whenever the content gains or loses an attribute, and every
+stored estimate after that point would silently move to another attribute.
+Names cost space: about 30 bytes per attribute against 2 for a packed
+position, so a user who has answered about every attribute has an item of
+around 2 KB and each answer write takes two write units instead of one.
+"""
+
+import heapq
+
+# Mastery is stored as an integer from 0 to MASTERY_SCALE.
+MASTERY_SCALE = 10000
+
+# Probability the user already knows an attribute before answering anything.
+PRIOR_MASTERY = 0.3
+
+# Probability of learning an attribute from answering a question about it.
+LEARN_PROBABILITY = 0.1
+
+# Probability of answering incorrectly despite knowing the attribute.
+SLIP_PROBABILITY = 0.1
+
+# Probability of answering correctly without knowing the attribute, by
+# question type. True or false questions can be guessed half the time, and
+# select part questions (CTU, CTD or both) and multiple choice questions
+# (three choices) a third of the time.
+GUESS_PROBABILITY = {
+    'TrueFalse': 0.5,
+    'SelectPart': 1.0 / 3,
+    'MultipleChoice': 1.0 / 3
+}
+DEFAULT_GUESS_PROBABILITY = 0.2
+
+# Number of weakest attributes kept in the user item for quiz feedback.
+WEAKEST_ATTRIBUTES_KEPT = 3
+
+def to_stored(probability):
+    return int(round(probability * MASTERY_SCALE))
+
+def from_stored(value):
+    return int(value) / float(MASTERY_SCALE)
+
+def update_mastery(probability, correct, question_type=None):
+    """ Returns the mastery probability after one answer. """
+
+    guess = GUESS_PROBABILITY.get(question_type, DEFAULT_GUESS_PROBABILITY)
+    if correct:
+        known = probability * (1 - SLIP_PROBABILITY)
+        unknown = (1 - probability) * guess
+    else:
+        known = probability * SLIP_PROBABILITY
+        unknown = (1 - probability) * (1 - guess)
+    posterior = known / (known + unknown)
+    return posterior + (1 - posterior) * LEARN_PROBABILITY
+
+def mastery_from_counters(correct_count, incorrect_count):
+    """ Estimates mastery for a user item written before mastery was tracked.
+    The order of past answers was not recorded, so incorrect answers are
+    replayed before correct ones. """
+
+    probability = PRIOR_MASTERY
+    for _ in range(int(incorrect_count)):
+        probability = update_mastery(probability, False)
+    for _ in range(int(correct_count)):
+        probability = update_mastery(probability, True)
+    return probability
+
+def get_mastery(user):
+    """ Returns {attribute: probability} for a user item. """
+
+    stored = user.get('Mastery')
+    if stored is not None:
+        return {attribute: from_stored(value) for attribute, value in stored.items()}
+    correct = user.get('CounterCorrect', {})
+    incorrect = user.get('CounterIncorrect', {})
+    return {attribute: mastery_from_counters(correct.get(attribute, 0), incorrect.get(attribute, 0))
+            for attribute in set(correct) | set(incorrect)}
+
+def weakest_map(mastery, k=WEAKEST_ATTRIBUTES_KEPT):
+    """ Returns {attribute: stored mastery} for the k attributes with the
+    lowest mastery among those the user's answers have lowered below the
+    prior. """
+
+    prior = to_stored(PRIOR_MASTERY)
+    below_prior = [(to_stored(probability), attribute)
+                   for attribute, probability in mastery.items()
+                   if to_stored(probability) < prior]
+    return {attribute: stored for stored, attribute in heapq.nsmallest(k, below_prior)}
+
+def update_weakest(weakest, mastery, attribute, k=WEAKEST_ATTRIBUTES_KEPT):
+    """ Returns the weakest attributes map after the mastery of attribute
+    changed. Takes O(k) unless an attribute already in the map improved, in
+    which case another attribute may take its place and the map is rebuilt
+    from mastery. """
+
+    stored = to_stored(mastery[attribute])
+    if attribute in weakest and stored > weakest[attribute]:
+        return weakest_map(mastery, k)
+
+    weakest = dict(weakest)
+    if stored < to_stored(PRIOR_MASTERY):
+        weakest[attribute] = stored
+        if len(weakest) > k:
+            del weakest[max(weakest, key=lambda key: (weakest[key], key))]
+    return weakest
+
+def get_weakest(user):
+    """ Returns the weakest attributes map of a user item. """
+
+    weakest = user.get('WeakestAttributes')
+    if weakest is None:
+        return weakest_map(get_mastery(user))
+    return {attribute: int(value) for attribute, value in weakest.items()}
+
+def weakest_attributes(weakest):
+    """ Returns the attributes tied for the lowest mastery in a weakest
+    attributes map. """
+
+    if not weakest:
+        return []
+    lowest = min(weakest.values())
+    return [attribute for attribute, stored in weakest.items() if stored == lowest]
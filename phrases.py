@@ -0,0 +1,237 @@
+"""
+Phrases the skill says around the curriculum content, per locale: every
+prompt, reply and card title that is not content.
+
+The default locale's phrases are held here. Another locale's are read from
+phrases/<locale>.json, a JSON object with any of the keys of DEFAULT_PHRASES;
+keys it leaves out keep the default locale's phrases. Phrase files are read
+the first time a request in their locale needs them and kept like the
+locale's content, see locales.py.
+"""
+
+import os
+import json
+from locales import DEFAULT_LOCALE, LocaleCache, resolve_locale, current_locale
+
+PHRASES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'phrases')
+
+DEFAULT_PHRASES = {
+    # Said before going over a correct answer.
+    'positive_feedback': [
+        "Nice work!",
+        "Great job!",
+        "Good job!",
+        "Nice job!",
+        "Very good!",
+        "Great work!",
+        "Good work!",
+        "Awesome work!",
+        "Superb!",
+        "Excellent!",
+        "Fantastic!",
+        "Bullseye!",
+        "Right on the money!",
+        "Well done!",
+        "Keep it up!",
+        "Way to go!",
+        "Nicely done!",
+        "Good answer!",
+        "Nice one!",
+        "Outstanding!"
+    ],
+    # Said for a correct answer in a quiz round, where the next question
+    # follows straight away.
+    'round_positive_feedback': [
+        "Nice work!",
+        "Great job!",
+        "Good job!",
+        "Nice job!",
+        "Very good!",
+        "Well done!",
+        "Way to go!",
+        "Nicely done!"
+    ],
+    'more_questions': [
+        "Would you like another question?",
+        "Do you want another question?",
+        "Do you want to try another one?",
+        "Would you like to try another one?",
+        "Would you like a new question?",
+        "Do you want a new question?",
+    ],
+    'no_mistakes': "You made no mistakes.",
+    'tutoring_intros': [
+        "Let's begin!",
+        "Let's get started!"
+    ],
+    # Spoken names accepted for a part in a reply to a select part question,
+    # besides the part itself.
+    'part_spoken_names': {
+        "CTU": ["counter up"],
+        "CTD": ["counter down"],
+        "TON": ["timer on delay"],
+        "TOF": ["timer off delay"],
+        "RTO": ["retentive timer on"]
+    },
+    # Said before the letter of a choice in a reply to a multiple choice
+    # question, as in "option B".
+    'choice_reply_prefix': "option ",
+    # Replies to a select part question saying the value holds for more than
+    # one part.
+    'shared_parts_replies': ["both", "both counter up and counter down", "both CTUandC TD",
+                             "more than one", "all", "all of them"],
+
+    # The rest are filled in with str.format(). {pause} is a short break in
+    # the speech; the other fields are named after what they hold.
+    'card_titles': {
+        'welcome': "Welcome",
+        'session_ended': "Session Ended",
+        'help': "Help",
+        'TrueFalse': "True or False Question",
+        'SelectPart': "Select Part Question",
+        'MultipleChoice': "Multiple Choice Question",
+        'answer': "Answer Response",
+        'quiz_round': "Quiz Round",
+        'quiz_round_summary': "Quiz Round Summary",
+        'quiz_feedback': "Quiz Feedback",
+        'quiz_review': "Quiz Review",
+        'tutoring': "Teaching Counter Instructions",
+        'still_processing': "One Moment",
+        'options_menu': "What would you like to do?"
+    },
+    'welcome_new': "Welcome to the PLC Counter Instruction Tutor! "
+                   "Would you like me to quiz you, or tutor you?",
+    'welcome_back': "Welcome back! Would you like me to quiz you, or tutor you? ",
+    'welcome_reprompt': "I didn't quite get that. I can either quiz you or tutor you. "
+                        "Which would you like me to do?",
+    'goodbye': "Thanks for trying out the PLC Counter Instruction Tutor. Have a nice day!",
+    'options_menu': "Would you like me to quiz you, tutor you, "
+                    "or would you like to end this study session?",
+    'options_menu_reprompt': "I didn't quite get that. Would you like me to quiz you, "
+                             "tutor you, or do you want to end this study session?",
+    'still_processing': "I'm still working on that. Please say it again in a moment.",
+    'still_processing_reprompt': "Please say that again.",
+
+    # Help, per stage of the interaction, and per question type for questions.
+    'help_welcome': "Welcome to PLC Counter Instruction Tutor. I can either quiz you or "
+                    "tutor you. I recommend that you start off with tutoring to go over the "
+                    "material, and then test yourself with some questions.{pause}"
+                    "Would you like me to tutor you or quiz you?",
+    'help_questions': {
+        'TrueFalse': "For a true or false question, you need to reply with either true, "
+                     "or false. Would you like another question?",
+        'SelectPart': "For a select instruction question, you need to reply with one of the "
+                      "provided answer choices. Would you like another question?",
+        'MultipleChoice': "For a multiple choice question, you need to reply with the letter "
+                          "of one of the choices. Would you like another question?"
+    },
+    'help_feedback': "The feedback stage is to help you improve on your weakest areas. "
+                     "{pause}Would you like me to tutor you, quiz you again, or would you "
+                     "like to end this study session?",
+    'help_tutoring': "During the tutoring stage I go over the basics of counter instructions "
+                     "in PLC ladder logic programming. {pause}Would you like to return to "
+                     "tutoring, for me to quiz you, or would you like to end this study "
+                     "session?",
+    'help_options_menu': "I can either quiz you or tutor you about counter instructions in "
+                         "PLC ladder logic programming. {pause}Would you like me to tutor "
+                         "you, quiz you, or would you like to end this study session?",
+    'help_quiz_round': "In a quiz round I ask you several questions in a row and tell you how "
+                       "you did at the end. Answer true or false, the letter of a choice, or "
+                       "the part a statement is about. {pause}{question}",
+    'help_quiz_round_summary': "A quiz round asks you several questions in a row. "
+                               "{pause}Would you like another round?",
+    'help_reprompt': "I didn't quite get that; what would you like to do?",
+
+    # Asking questions.
+    'true_false_question': "True or False? {question}",
+    'true_false_reprompt': "I didn't get your answer. Please reply True or False about this "
+                           "statement: {question}",
+    'true_false_answers': {'true': "True", 'false': "False"},
+    'select_part_question': "{question} Is this {options}?",
+    'select_part_reprompt': "I didn't get your answer. Please reply either {options}.",
+    'select_part_options': "{parts}, or {shared}",
+    # The answer to a select part question whose value holds for two parts,
+    # or for more than two.
+    'both_parts': "Both",
+    'several_parts': "More than one",
+    'multiple_choice_question': "Fill in the blank. {question} {choices}",
+    'multiple_choice_reprompt': "I didn't get your answer. Please reply with the letter of "
+                                "your choice. {choices}",
+    'choices': "Is it {choices}, or {last}?",
+    'choice': "{letter}, {choice}",
+    'question_number': "Question {number}.",
+    'question_reprompt': "I didn't get your answer. {question}",
+
+    # Going over answers.
+    'correct': "{answer} is correct. {explanation}",
+    'select_part_correct': "{answer} is the correct answer.",
+    'answer': "The correct answer is {answer}.",
+    'answer_explained': "The correct answer is {answer}. {explanation}",
+    'sorry_answer': "Sorry, the correct answer is {answer}.",
+    'sorry_answer_explained': "Sorry, the correct answer is {answer}. {explanation}",
+    'incorrect': "Sorry, your answer is incorrect.",
+    'invalid_answer': "Sorry, your answer is invalid.",
+    'invalid_answers': {
+        'TrueFalse': "Sorry, your answer is invalid. For a true or false question, please make "
+                     "sure your answer is either true or false.",
+        'SelectPart': "Sorry, your answer is invalid. Please make sure to pick one of the "
+                      "listed options for a select instruction question.",
+        'MultipleChoice': "Sorry, your answer is invalid. For a multiple choice question, "
+                          "please reply with the letter of one of the choices."
+    },
+    'another_question': "Would you like another question?",
+    'answer_reprompt': "I didn't quite catch that. Can you repeat your answer?",
+
+    # Quiz rounds.
+    'round_start': "Here is a round of {count} questions.",
+    'round_summary': "That's the end of the round. You got {right} out of {count} right. "
+                     "Would you like another round?",
+    'round_score': "You got {right} out of {count} right.",
+    'round_right': "Right: {question}",
+    'round_wrong': "Wrong: {question}",
+    'round_reprompt': "I didn't quite catch that. Would you like another round?",
+
+    # Quiz feedback and review.
+    'feedback_weakest': "I think you should take a look at: {attributes}. "
+                        "Would you like to review?",
+    'feedback_separator': ", and ",
+    'feedback_next': "Would you like me to quiz you again, tutor you, "
+                     "or would you like to end this study session?",
+    'feedback_reprompt': "I didn't quite get that. Would you like me to quiz you, "
+                         "tutor you, or would you like to end this study session?",
+    'review_reprompt': "I didn't quite catch that. Would you like to review?",
+
+    # Tutoring.
+    'tutoring_statements_left': "There are {count} statements left. Would you like me to go "
+                                "to the next statement, or repeat this statement?",
+    'tutoring_statements_left_reprompt': "I didn't quite catch that. Would you like me to go "
+                                         "to the next tutoring statement, or repeat this "
+                                         "statement?",
+    'tutoring_level_done': "There are no statements left in this level. Would you like me to "
+                           "go to the next statement level, or repeat this statement?",
+    'tutoring_level_done_reprompt': "I didn't quite catch that. Would you like me to go to "
+                                    "the next tutoring statement level, or repeat this "
+                                    "statement?",
+    'tutoring_end': "You've reached the end of the tutoring session. Great work! Would you "
+                    "like me to quiz you now, tutor you again, or would you like to end this "
+                    "study session?",
+    'tutoring_end_reprompt': "I didn't quite catch that. Would you like me to tutor you "
+                             "again, , quiz you, or would you like to end this study session?"
+}
+
+def load_phrases(locale):
+    """ Returns the phrases of a locale. """
+
+    path = os.path.join(PHRASES_DIRECTORY, locale + '.json')
+    if locale == DEFAULT_LOCALE or not os.path.exists(path):
+        return DEFAULT_PHRASES
+    with open(path, encoding='utf-8') as phrases_file:
+        return dict(DEFAULT_PHRASES, **json.load(phrases_file))
+
+_phrases = LocaleCache(load_phrases)
+
+def get_phrases(locale=None):
+    """ Returns the phrases of a locale, by default the locale of the request
+    being handled. """
+
+    return _phrases.get(resolve_locale(locale) if locale else current_locale())
@@ -0,0 +1,94 @@
+"""
+Picks questions without repeating the ones asked recently in a session.
+
+The ids of the last few questions asked are kept in a ring buffer in the
+session attributes. A question is drawn uniformly from the candidates that
+are not in the buffer by drawing at random and rejecting recent ones, which
+takes O(1) expected draws as long as most of the pool has not been asked
+recently. When the pool is so small that draws keep hitting recent
+questions, the remaining candidates are listed instead, and if every
+candidate was asked recently the one asked longest ago is repeated.
+"""
+
+import zlib
+
+RECENT_QUESTIONS_KEY = "RecentQuestions"
+
+# Number of question ids remembered per session.
+RECENT_QUESTIONS_KEPT = 8
+
+# Random draws made before falling back to listing the fresh candidates.
+MAX_DRAWS = 8
+
+def question_id(*parts):
+    """ Returns a compact integer id for a question made of parts such as its
+    type, attribute, part and value. """
+
+    return zlib.crc32("|".join(parts).encode('utf-8'))
+
+class RecentQuestions(object):
+    """ Ring buffer of the ids of the last questions asked. """
+
+    def __init__(self, ids=None, position=0, size=RECENT_QUESTIONS_KEPT):
+        self.size = size
+        self.ids = list(ids or [])[:size]
+        self.position = position % size
+        self._asked = self._index()
+
+    def _index(self):
+        # Maps each id to how long ago it was asked; 0 is the latest.
+        asked = {}
+        count = len(self.ids)
+        for age in range(count - 1, -1, -1):
+            asked[self.ids[(self.position - 1 - age) % count]] = age
+        return asked
+
+    @classmethod
+    def from_session(cls, session_attributes):
+        stored = (session_attributes or {}).get(RECENT_QUESTIONS_KEY)
+        if not stored:
+            return cls()
+        return cls(stored.get("Ids"), stored.get("Next", 0))
+
+    def to_session(self):
+        return {"Ids": self.ids, "Next": self.position}
+
+    def __contains__(self, question):
+        return question in self._asked
+
+    def asked_ago(self, question):
+        """ Returns how many questions ago question was asked, or None. """
+
+        return self._asked.get(question)
+
+    def add(self, question):
+        if len(self.ids) < self.size:
+            self.ids.append(question)
+            self.position = len(self.ids) % self.size
+        else:
+            self.ids[self.position] = question
+            self.position = (self.position + 1) % self.size
+        self._asked = self._index()
+
+def carry_over(previous_attributes, session_attributes):
+    """ Copies the recent questions from the previous session attributes into
+    new ones, so they survive the turns between questions. """
+
+    if RECENT_QUESTIONS_KEY in (previous_attributes or {}):
+        session_attributes[RECENT_QUESTIONS_KEY] = previous_attributes[RECENT_QUESTIONS_KEY]
+    return session_attributes
+
+def sample_index(candidate_ids, recent, rng, max_draws=MAX_DRAWS):
+    """ Returns the index of a candidate drawn uniformly from those not asked
+    recently. """
+
+    count = len(candidate_ids)
+    for _ in range(max_draws):
+        index = rng.randrange(count)
+        if candidate_ids[index] not in recent:
+            return index
+
+    fresh = [index for index in range(count) if candidate_ids[index] not in recent]
+    if fresh:
+        return rng.choice(fresh)
+    return max(range(count), key=lambda index: recent.asked_ago(candidate_ids[index]))
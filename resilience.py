@@ -0,0 +1,121 @@
+"""
+Circuit breakers for the skill's storage dependencies.
+
+When DynamoDB throttles or is unreachable, each request would otherwise wait
+out its own timeouts before failing. A breaker counts consecutive failures and,
+once a threshold is reached, opens: calls fail immediately with
+CircuitOpenError for a cool-down period so callers can switch to their
+fallback straight away. After the cool-down a single trial call is let
+through, and its result decides whether the breaker closes again.
+"""
+
+import time
+import sqlite3
+import threading
+import structured_log
+from botocore.exceptions import BotoCoreError, ClientError, EndpointConnectionError, \
+    ConnectionClosedError, ReadTimeoutError, ConnectTimeoutError
+
+# Error codes that mean "try again later" rather than "this call is wrong".
+THROTTLING_ERROR_CODES = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+    'ServiceUnavailable'
+)
+
+# Client-side errors that mean the backend could not be reached in time. Other
+# BotoCoreErrors, such as missing credentials or an invalid parameter, fail
+# the same way every time.
+TRANSIENT_CLIENT_ERRORS = (
+    EndpointConnectionError,
+    ConnectionClosedError,
+    ReadTimeoutError,
+    ConnectTimeoutError
+)
+
+class CircuitOpenError(Exception):
+    """ Raised instead of calling a dependency whose breaker is open. """
+
+# Errors that mean a storage dependency is failing. Callers with a fallback
+# catch these.
+STORAGE_ERRORS = (BotoCoreError, ClientError, sqlite3.Error, CircuitOpenError)
+
+def is_transient(error):
+    """ Returns True if error is an outage or throttle that is worth retrying
+    later, as opposed to a request the backend will never accept. """
+
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return code in THROTTLING_ERROR_CODES or status >= 500
+    return isinstance(error, TRANSIENT_CLIENT_ERRORS + (sqlite3.OperationalError, CircuitOpenError))
+
+class CircuitBreaker(object):
+    """ Closed -> open after failure_threshold consecutive transient failures,
+    open -> half open after reset_timeout seconds, half open -> closed on the
+    first success. """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN \
+                    and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected_calls += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    structured_log.warning("circuit_breaker_opened", breaker=self.name)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        """ Calls func unless the breaker is open. Only transient errors count
+        as failures; any other error still propagates to the caller. """
+
+        if not self.allow_request():
+            raise CircuitOpenError(self.name + " circuit is open")
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            if is_transient(error):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+        return result
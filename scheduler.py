@@ -0,0 +1,65 @@
+"""
+Spaced repetition scheduling of question attributes.
+
+Each attribute a user has answered about has a review box and a due time in
+the user item's 'Schedule' map, packed together into one integer. Time is
+counted in questions answered. A correct answer moves the attribute up a box,
+doubling the number of questions before it is due again, and an incorrect one
+puts it back in the first box so it comes up again soon. Attributes that were
+never answered are due straight away.
+
+The next question's attribute is the one at the top of a priority queue of
+the attributes available at the user's level, ordered by due time and then by
+lowest mastery.
+"""
+
+import heapq
+from mastery import PRIOR_MASTERY, to_stored
+
+# Questions until an attribute is due again, for each box.
+BOX_INTERVALS = [1, 2, 4, 8, 16, 32]
+
+def pack(due, box):
+    return due * len(BOX_INTERVALS) + box
+
+def unpack(value):
+    """ Returns (due, box) from a packed schedule entry. """
+
+    return divmod(int(value), len(BOX_INTERVALS))
+
+def next_review(value, correct, clock):
+    """ Returns the packed schedule entry of an attribute after an answer,
+    given its previous entry (None if it was never answered) and the number
+    of questions the user has answered including this one. """
+
+    box = unpack(value)[1] if value is not None else 0
+    if correct:
+        box = min(box + 1, len(BOX_INTERVALS) - 1)
+    else:
+        box = 0
+    return pack(clock + BOX_INTERVALS[box], box)
+
+def postpone(value, due):
+    """ Returns a packed schedule entry moved to a new due time, keeping its
+    box. """
+
+    box = unpack(value)[1] if value is not None else 0
+    return pack(due, box)
+
+def due_queue(attributes, schedule, mastery, rng):
+    """ Returns a heap of (due, mastery, tie breaker, attribute) entries for
+    the given attributes. """
+
+    queue = []
+    for attribute in dict.fromkeys(attributes):
+        value = schedule.get(attribute)
+        due = unpack(value)[0] if value is not None else 0
+        queue.append((due, to_stored(mastery.get(attribute, PRIOR_MASTERY)), rng.random(),
+                      attribute))
+    heapq.heapify(queue)
+    return queue
+
+def next_attribute(attributes, schedule, mastery, rng):
+    """ Returns the attribute, out of attributes, to ask about next. """
+
+    return heapq.heappop(due_queue(attributes, schedule, mastery, rng))[3]
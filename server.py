@@ -0,0 +1,239 @@
+"""
+Self-hosted HTTP front end for the tutor.
+
+Accepts Alexa-format JSON requests with POST (on any path) and answers with
+the same response lambda_handler returns in Lambda. Connections are handled
+by an asyncio server, and each request runs on a worker thread pool since
+the handlers make blocking storage calls. The content source, user store and
+DynamoDB connections are process-wide and shared by all requests, so several
+instances can run behind a load balancer.
+
+    GET /healthz   200 while the process is up
+    GET /readyz    200 once storage is reachable and no circuit breaker is open
+
+    python server.py --port 8080 --workers 32
+
+Alexa requires skill endpoints to verify request signatures; that is expected
+to happen in the proxy in front of this server.
+"""
+
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import alexa_plc_counter_instruction_tutor as tutor
+import deadline
+import structured_log
+from user_store import get_user_store
+from content_catalog import ContentCatalog, get_content
+from resilience import CircuitBreaker, STORAGE_ERRORS
+
+MAX_BODY_BYTES = 1024 * 1024
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+
+def parse_event(body):
+    """ Returns the Alexa request event in a request body. Raises ValueError
+    if the body is not one. """
+
+    event = json.loads(body)
+    if not isinstance(event, dict):
+        raise ValueError("event is not an object")
+    session, request = event.get('session'), event.get('request')
+    if not isinstance(session, dict) or not isinstance(request, dict):
+        raise ValueError("event needs a session and a request")
+    if not isinstance(session.get('application'), dict) or 'new' not in session:
+        raise ValueError("session needs an application and new")
+    if 'type' not in request or 'requestId' not in request:
+        raise ValueError("request needs a type and a requestId")
+    if request['type'] == 'IntentRequest' and not isinstance(request.get('intent'), dict):
+        raise ValueError("intent request needs an intent")
+    return event
+
+def parse_content_length(value):
+    """ Returns the body length a Content-Length header gives, or None if it
+    is not a non-negative integer. """
+
+    value = value.strip()
+    if not (value.isascii() and value.isdigit()):
+        return None
+    return int(value)
+
+class RequestContext(object):
+    """ Stands in for the Lambda context. The time budget starts when the
+    request arrives, so time spent queued for a worker counts against it. """
+
+    def __init__(self, budget_ms=deadline.ALEXA_RESPONSE_BUDGET_MS):
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return int((self.expires_at - time.monotonic()) * 1000)
+
+class TutorServer(object):
+    """ Dispatches HTTP requests to the skill's handlers. """
+
+    def __init__(self, workers=32):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tutor-request')
+        self.ready = False
+        self.in_flight = 0
+        self.served = 0
+
+    def warm_up(self):
+        """ Touches the content source and user store once so connections and
+        caches are set up before traffic arrives. The stores are checked
+        directly rather than through their resilient wrappers, which would
+        answer from fallbacks while storage is unreachable. """
+
+        tutor.init_storage()
+        try:
+            content = get_content()
+            content.catalog()
+            if not isinstance(content.primary, ContentCatalog):
+                content.primary.content_version()
+            get_user_store().store.get_user('readiness-check')
+        except STORAGE_ERRORS as error:
+            structured_log.warning("warm_up_failed", error=repr(error))
+            return
+        self.ready = True
+
+    def readiness(self):
+        breakers = [get_content().breaker, get_user_store().breaker]
+        open_breakers = [breaker.name for breaker in breakers
+                         if breaker.state == CircuitBreaker.OPEN]
+        return {
+            'ready': self.ready and not open_breakers,
+            'open_circuit_breakers': open_breakers,
+            'in_flight': self.in_flight,
+            'served': self.served
+        }
+
+    def handle_event(self, event):
+        return tutor.lambda_handler(event, RequestContext())
+
+    async def respond(self, method, path, body):
+        """ Returns (status, payload) for one HTTP request. """
+
+        if method == 'GET' and path == '/healthz':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/readyz':
+            if not self.ready:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.warm_up)
+            readiness = self.readiness()
+            return (200 if readiness['ready'] else 503), readiness
+        if method != 'POST':
+            return 405, {'error': 'method not allowed'}
+
+        # Only a body that is not a request event is the client's fault; any
+        # error handling the event is the server's.
+        try:
+            event = parse_event(body)
+        except ValueError as error:
+            return 400, {'error': str(error)}
+
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            response = await loop.run_in_executor(self.executor, self.handle_event, event)
+        except Exception as error:
+            structured_log.error("request_failed", error=repr(error))
+            return 500, {'error': 'internal error'}
+        finally:
+            self.in_flight -= 1
+        self.served += 1
+        return 200, response if response is not None else {}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.write_response(writer, 400, {'error': 'bad request line'}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' \
+                    and version == 'HTTP/1.1'
+                length = parse_content_length(headers.get('content-length', '0'))
+                if length is None:
+                    await self.write_response(writer, 400, {'error': 'bad content length'}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.write_response(writer, 413, {'error': 'body too large'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.respond(method, path.split('?')[0], body)
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        head = (
+            "HTTP/1.1 " + str(status) + " " + STATUS_TEXT.get(status, '') + "\r\n"
+            "Content-Type: application/json;charset=UTF-8\r\n"
+            "Content-Length: " + str(len(body)) + "\r\n"
+            "Connection: " + ("keep-alive" if keep_alive else "close") + "\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        print("serving on " + host + ":" + str(port))
+
+        # Warming up makes blocking calls, so it runs on a worker while the
+        # server already answers health checks.
+        loop.run_in_executor(self.executor, self.warm_up)
+
+        stop = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stop.set)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Not available on this platform or outside the main thread.
+                pass
+        async with server:
+            await stop.wait()
+        # Let requests that are already running finish before exiting.
+        self.ready = False
+        self.executor.shutdown(wait=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the tutor over HTTP.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=32,
+                        help="Threads running request handlers")
+    args = parser.parse_args(argv)
+    asyncio.run(TutorServer(args.workers).serve(args.host, args.port))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Compact encoding of the session attributes.
+
+Alexa sends the session attributes of a response back with the next request,
+so everything kept in them travels twice per turn. Instead of the text of
+the current question and its answers, the session keeps where that text
+comes from: the question's template and the part and value it is about, as
+indexes into the content held in memory, along with a stage number. The
+text is rendered again from the content when a request needs it.
+
+Encoded state looks like
+
+    {"v": 1, "c": 2914875463, "s": 1, "q": [0, 4, 2, 1, 0, 1, 1, 2], "r": [[...], 3]}
+
+where "v" is the encoding version and "c" the fingerprint of the content the
+indexes refer to. State whose content has since changed cannot be decoded
+and raises SessionStateError. Session attributes without a version are ones
+saved before the encoding was introduced, and are used as they are.
+"""
+
+from question_sampler import RECENT_QUESTIONS_KEY
+from phrases import get_phrases
+
+SESSION_STATE_VERSION = 1
+
+VERSION_KEY = "v"
+
+# Stages of a session, numbered by their position.
+STAGES = [
+    "WelcomeResponse",
+    "GenerateQuestion",
+    "CheckAnswer",
+    "HelpRequest",
+    "GiveQuizFeedback",
+    "ReviewQuizFeedback",
+    "Tutoring",
+    "OptionsMenu",
+    "QuizRound",
+    "QuizRoundSummary"
+]
+
+QUESTION_TYPES = ["TrueFalse", "SelectPart", "MultipleChoice"]
+
+# Fields of a question's details, which are kept as the question's key.
+QUESTION_FIELDS = ("QuestionType", "QuestionAttribute", "Question", "PartialAnswer", "FullAnswer",
+                   "Answer", "Choices", "Parts", "QuestionKey")
+
+# Session attributes kept as they are, under a shorter name.
+PLAIN_KEYS = {
+    "QuizRoundSize": "n",
+    "QuizRoundScore": "p",
+    "TutoringStep": "t",
+    "NewUser": "w"
+}
+
+class SessionStateError(ValueError):
+    """ Raised for session state that cannot be decoded. """
+
+def _ref(items, item):
+    # The index of item in items, or item in a list of its own if it is not
+    # one of them, so it still decodes.
+    try:
+        return items.index(item)
+    except ValueError:
+        return [item]
+
+def _deref(items, ref):
+    if isinstance(ref, list):
+        return ref[0]
+    try:
+        return items[ref]
+    except (IndexError, TypeError):
+        raise SessionStateError("no item " + repr(ref) + " in the content")
+
+# --------------- Questions --------------- #
+
+def encode_question(details, catalog):
+    """ Encodes a question's details as a list of indexes into the catalog.
+    Questions without a key are kept as they are. """
+
+    key = details.get("QuestionKey")
+    if key is None:
+        return {field: details[field] for field in QUESTION_FIELDS if field in details}
+
+    question_type = details["QuestionType"]
+    attribute = details["QuestionAttribute"]
+    parts = catalog.fact_parts(attribute)
+    values = catalog.attribute_values(attribute)
+    level, template_index, part, value = key[:4]
+    encoded = [QUESTION_TYPES.index(question_type), _ref(catalog.attributes(), attribute),
+               int(level), template_index, _ref(parts, part), _ref(values, value)]
+    if question_type == "TrueFalse":
+        # The part and value of the statement given as the full answer.
+        encoded += [_ref(parts, key[4]), _ref(values, key[5])]
+    elif question_type == "SelectPart":
+        encoded.append(_ref(parts, details["Answer"]))
+    else:
+        all_values = catalog.all_fact_values()
+        encoded += [[_ref(all_values, choice) for choice in details["Choices"]], details["Answer"]]
+    return encoded
+
+def decode_question(encoded, catalog):
+    """ Renders a question's details from encode_question's encoding. """
+
+    if isinstance(encoded, dict):
+        return dict(encoded)
+
+    try:
+        question_type = QUESTION_TYPES[encoded[0]]
+        attribute = _deref(catalog.attributes(), encoded[1])
+        level, template_index = encoded[2], encoded[3]
+        parts = catalog.fact_parts(attribute)
+        values = catalog.attribute_values(attribute)
+        part, value = _deref(parts, encoded[4]), _deref(values, encoded[5])
+        if question_type == "SelectPart":
+            templates = catalog.select_part_templates(level)
+        else:
+            templates = catalog.true_false_templates(level)
+        template_attribute, template = templates[template_index]
+    except (IndexError, TypeError):
+        raise SessionStateError("malformed question " + repr(encoded))
+    if template_attribute != attribute:
+        raise SessionStateError("template " + repr(template_index) + " of level " + repr(level) +
+                                " is not about " + repr(attribute))
+
+    details = {
+        "QuestionType": question_type,
+        "QuestionAttribute": attribute,
+        "QuestionKey": [level, template_index, part, value]
+    }
+    if question_type == "TrueFalse":
+        full_part, full_value = _deref(parts, encoded[6]), _deref(values, encoded[7])
+        details["Question"] = template.render(part, value)
+        details["PartialAnswer"] = "true" if part in catalog.parts_with_value(attribute, value) \
+            else "false"
+        details["FullAnswer"] = template.render(full_part, full_value)
+        details["QuestionKey"] += [full_part, full_value]
+    elif question_type == "SelectPart":
+        details["Question"] = template.render(value=value)
+        details["Answer"] = _deref(parts, encoded[6])
+        details["Parts"] = list(parts)
+    else:
+        all_values = catalog.all_fact_values()
+        details["Question"] = template.render(part, "blank")
+        details["Choices"] = [_deref(all_values, choice) for choice in encoded[6]]
+        details["Answer"] = encoded[7]
+        details["FullAnswer"] = template.render(part, value)
+    return details
+
+# --------------- Session attributes --------------- #
+
+def encode(attributes, catalog):
+    """ Returns the compact encoding of session attributes. """
+
+    if not attributes:
+        return {}
+
+    state = {VERSION_KEY: SESSION_STATE_VERSION, "c": catalog.fingerprint}
+    others = {}
+    for key, value in attributes.items():
+        if key == "CurrentStage":
+            state["s"] = _ref(STAGES, value)
+        elif key == "HelpStage":
+            state["h"] = _ref(STAGES, value)
+        elif key in QUESTION_FIELDS:
+            continue
+        elif key == "AnsweredQuestion":
+            state["a"] = encode_question(value, catalog)
+        elif key == "QuizRound":
+            state["k"] = [[encode_question(question, catalog) for question in value["Questions"]],
+                          [int(result) for result in value["Results"]]]
+        elif key == "QuizFeedback":
+            state["f"] = [_ref(catalog.attributes(), attribute) for attribute in value
+                          if attribute != "None"]
+        elif key == RECENT_QUESTIONS_KEY:
+            state["r"] = [value["Ids"], value["Next"]]
+        elif key in PLAIN_KEYS:
+            state[PLAIN_KEYS[key]] = value
+        else:
+            others[key] = value
+    if "QuestionAttribute" in attributes:
+        state["q"] = encode_question(attributes, catalog)
+    elif "QuestionType" in attributes:
+        state["y"] = QUESTION_TYPES.index(attributes["QuestionType"])
+    if others:
+        state["o"] = others
+    return state
+
+def _decode_v1(state, catalog):
+    if state.get("c") != catalog.fingerprint:
+        raise SessionStateError("the content changed since the session state was saved")
+
+    attributes = dict(state.get("o", {}))
+    if "s" in state:
+        attributes["CurrentStage"] = _deref(STAGES, state["s"])
+    if "h" in state:
+        attributes["HelpStage"] = _deref(STAGES, state["h"])
+    if "q" in state:
+        attributes.update(decode_question(state["q"], catalog))
+    elif "y" in state:
+        attributes["QuestionType"] = QUESTION_TYPES[state["y"]]
+    if "a" in state:
+        attributes["AnsweredQuestion"] = decode_question(state["a"], catalog)
+    if "k" in state:
+        questions, results = state["k"]
+        attributes["QuizRound"] = {
+            "Questions": [decode_question(question, catalog) for question in questions],
+            "Results": [bool(result) for result in results]
+        }
+    if "f" in state:
+        attributes["QuizFeedback"] = {}
+        for ref in state["f"]:
+            attribute = _deref(catalog.attributes(), ref)
+            attributes["QuizFeedback"][attribute] = catalog.feedback_statement(attribute)
+        if not state["f"]:
+            # The statement kept as quiz feedback when there is nothing to review.
+            attributes["QuizFeedback"]["None"] = get_phrases()['no_mistakes']
+    if "r" in state:
+        attributes[RECENT_QUESTIONS_KEY] = {"Ids": state["r"][0], "Next": state["r"][1]}
+    for key, short_key in PLAIN_KEYS.items():
+        if short_key in state:
+            attributes[key] = state[short_key]
+    return attributes
+
+# Decoder of each encoding version.
+DECODERS = {
+    1: _decode_v1
+}
+
+def decode(state, catalog):
+    """ Returns the session attributes encoded in state. Raises
+    SessionStateError if they cannot be decoded against the catalog. """
+
+    if not state or VERSION_KEY not in state:
+        return dict(state or {})
+    decoder = DECODERS.get(state[VERSION_KEY])
+    if decoder is None:
+        raise SessionStateError("unknown session state version " + repr(state[VERSION_KEY]))
+    return decoder(state, catalog)
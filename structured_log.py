@@ -0,0 +1,160 @@
+"""
+Structured logging for request handling.
+
+Each record is a line of JSON holding its level, an event name, the fields
+passed with it and the context of the request it was made in: the requestId,
+the request type and intent, and a hash of the userId, so requests can be
+followed without logging who made them.
+
+Records made while a request is handled are kept in a buffer and written in
+one go when the request finishes, after its response is ready. Records made
+outside a request are written straight away.
+
+The level is set with the TUTOR_LOG_LEVEL environment variable (debug, info,
+warning or error; info by default). Below the debug level, a fraction of
+requests set by TUTOR_LOG_DEBUG_SAMPLE (0 by default) still get their debug
+records, so debug output can be switched on for a sample of traffic. Records
+of a disabled level return before doing anything, and fields are passed as
+they are, so nothing is formatted unless it is written.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {
+    'debug': DEBUG,
+    'info': INFO,
+    'warning': WARNING,
+    'error': ERROR
+}
+
+LEVEL_NAMES = {number: name for name, number in LEVELS.items()}
+
+_threshold = LEVELS.get(os.environ.get('TUTOR_LOG_LEVEL', 'info').lower(), INFO)
+_debug_sample = float(os.environ.get('TUTOR_LOG_DEBUG_SAMPLE', '0'))
+
+# Sampling draws from its own generator, so logging never changes what the
+# tutor's random choices turn out to be.
+_sampler = random.Random()
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+def configure(level=None, debug_sample=None):
+    """ Changes the level (a name from LEVELS) and the debug sample rate. """
+
+    global _threshold, _debug_sample
+    if level is not None:
+        _threshold = LEVELS[level.lower()]
+    if debug_sample is not None:
+        _debug_sample = debug_sample
+
+def user_hash(user_id):
+    """ Returns a short stable hash of a userId. """
+
+    return hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:16]
+
+class RequestLog(object):
+    """ The context and buffered records of one request. """
+
+    __slots__ = ('fields', 'user_id', 'debug', 'records', '_lock')
+
+    def __init__(self, fields, user_id, debug):
+        self.fields = fields
+        self.user_id = user_id
+        self.debug = debug
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def lines(self):
+        context = dict(self.fields)
+        if self.user_id is not None:
+            context['user'] = user_hash(self.user_id)
+        with self._lock:
+            records, self.records = self.records, []
+        return [_format(record, context) for record in records]
+
+def _format(record, context):
+    timestamp, level, event, fields = record
+    line = {'time': round(timestamp, 3), 'level': LEVEL_NAMES[level], 'event': event}
+    line.update(context)
+    line.update(fields)
+    return json.dumps(line, default=str)
+
+def _write(lines):
+    if not lines:
+        return
+    with _write_lock:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+def current_request():
+    return getattr(_local, 'request', None)
+
+def set_current_request(request_log):
+    """ Makes request_log the current one on this thread, e.g. on a worker
+    running a call for the request. """
+
+    _local.request = request_log
+
+def start_request(request_id, request_type=None, intent=None, user_id=None):
+    """ Starts buffering the records of a request. The userId is only hashed
+    if a record is written. """
+
+    fields = {'requestId': request_id}
+    if request_type is not None:
+        fields['type'] = request_type
+    if intent is not None:
+        fields['intent'] = intent
+    debug = _threshold <= DEBUG or (_debug_sample > 0 and _sampler.random() < _debug_sample)
+    request_log = RequestLog(fields, user_id, debug)
+    _local.request = request_log
+    return request_log
+
+def finish_request(request_log):
+    """ Writes the records buffered for a request. """
+
+    _local.request = None
+    _write(request_log.lines())
+
+def log(level, event, **fields):
+    request_log = getattr(_local, 'request', None)
+    if level < _threshold and not (level == DEBUG and request_log is not None and request_log.debug):
+        return
+    record = (time.time(), level, event, fields)
+    if request_log is None:
+        _write([_format(record, {})])
+    else:
+        request_log.add(record)
+
+def debug(event, **fields):
+    if _threshold > DEBUG:
+        request_log = getattr(_local, 'request', None)
+        if request_log is None or not request_log.debug:
+            return
+    log(DEBUG, event, **fields)
+
+def info(event, **fields):
+    if _threshold <= INFO:
+        log(INFO, event, **fields)
+
+def warning(event, **fields):
+    if _threshold <= WARNING:
+        log(WARNING, event, **fields)
+
+def error(event, **fields):
+    log(ERROR, event, **fields)
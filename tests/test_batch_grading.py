@@ -0,0 +1,105 @@
+import os
+import json
+import random
+import tempfile
+import unittest
+import batch_grading
+from content_catalog import ContentCatalog
+import alexa_plc_counter_instruction_tutor as tutor
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data',
+                             'content_snapshot.json')
+
+USERS = ["amzn1.ask.account.first", "amzn1.ask.account.second", "amzn1.ask.account.third"]
+
+
+def transcript(catalog, answers=120, seed=0):
+    """ Returns answer records for a few users, as the skill would log them,
+    some of them invalid. """
+
+    rng = random.Random(seed)
+    random.seed(seed)
+    records = []
+    for index in range(answers):
+        if rng.random() < 0.5:
+            attribute, text, partial, full, key = tutor.generate_true_false(
+                rng.randint(1, 4), content=catalog)
+            question = {"QuestionType": "TrueFalse", "QuestionAttribute": attribute,
+                        "Question": text, "PartialAnswer": partial, "FullAnswer": full,
+                        "QuestionKey": key}
+            answer = rng.choice(["true", "false", "false", "maybe"])
+        else:
+            attribute, text, correct, parts, key = tutor.generate_select_part(
+                rng.randint(1, 4), content=catalog)
+            question = {"QuestionType": "SelectPart", "QuestionAttribute": attribute,
+                        "Question": text, "Answer": correct, "Parts": parts, "QuestionKey": key}
+            answer = rng.choice(parts + [correct, "nothing"])
+        records.append({"user": rng.choice(USERS), "timestamp": 1700000000 + 7 * index,
+                        "question": question, "answer": answer})
+    return records
+
+
+class BatchGradingTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.records = transcript(ContentCatalog.from_snapshot(SNAPSHOT_PATH))
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # The answers are spread over two files, out of order.
+        shuffled = list(self.records)
+        random.Random(1).shuffle(shuffled)
+        self.paths = []
+        for index in range(2):
+            path = os.path.join(self.directory.name, 'transcript_%d.jsonl' % index)
+            with open(path, 'w') as transcript_file:
+                for record in shuffled[index::2]:
+                    transcript_file.write(json.dumps(record) + "\n")
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def grade(self, **kwargs):
+        output_path = os.path.join(self.directory.name, 'progress.jsonl')
+        users, answers = batch_grading.grade(self.paths, output_path, **kwargs)
+        with open(output_path) as output_file:
+            progress = {item['UserID']: item for item in map(json.loads, output_file)}
+        self.assertEqual(users, len(progress))
+        self.assertEqual(answers, len(self.records))
+        return progress
+
+    def expected(self, user_id):
+        records = [record for record in self.records if record['user'] == user_id]
+        user = batch_grading.replay_user(user_id, records)
+        return json.loads(json.dumps(user, default=batch_grading._json_number))
+
+    def test_grading_matches_replaying_each_user_in_order(self):
+        progress = self.grade(workers=2)
+        self.assertEqual(sorted(progress), sorted(USERS))
+        for user_id in USERS:
+            self.assertEqual(progress[user_id], self.expected(user_id))
+
+    def test_results_do_not_depend_on_workers_or_ranges(self):
+        # Small ranges split the files mid-line, so lines running over a
+        # range boundary are read once.
+        self.assertEqual(self.grade(workers=1), self.grade(workers=3, range_bytes=500))
+
+    def test_invalid_answers_are_counted_but_change_nothing(self):
+        user_id = USERS[0]
+        records = [record for record in self.records if record['user'] == user_id]
+        invalid = [dict(record, answer="NoValue") for record in records]
+        user = batch_grading.replay_user(user_id, invalid)
+        self.assertEqual(user['InvalidAnswers'], len(records))
+        self.assertEqual(sum(user['CounterCorrect'].values()), 0)
+        self.assertEqual(sum(user['CounterIncorrect'].values()), 0)
+
+    def test_timestamps(self):
+        self.assertEqual(batch_grading.parse_timestamp("2023-11-14T22:13:20Z"), 1700000000.0)
+        self.assertEqual(batch_grading.parse_timestamp("2023-11-14T22:13:20"), 1700000000.0)
+        self.assertEqual(batch_grading.parse_timestamp(1700000000), 1700000000.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import deadline
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def tearDown(self):
+        deadline.set_current_deadline(None)
+
+    def test_defer_outside_a_request_runs_now(self):
+        calls = []
+        deadline.defer(calls.append, 1)
+        self.assertEqual(calls, [1])
+
+    def test_deferred_work_runs_in_order_within_the_request(self):
+        calls = []
+        request_deadline = deadline.start_request()
+        deadline.defer(calls.append, 1)
+        deadline.defer(calls.append, 2)
+        self.assertEqual(calls, [])
+        deadline.run_deferred()
+        self.assertEqual(calls, [1, 2])
+        deadline.finish_request(request_deadline)
+        self.assertIsNone(deadline.current_deadline())
+
+    def test_a_failing_write_does_not_stop_the_others(self):
+        calls = []
+
+        def fail():
+            raise RuntimeError("write failed")
+
+        request_deadline = deadline.start_request()
+        deadline.defer(calls.append, 1)
+        deadline.defer(fail)
+        deadline.defer(calls.append, 2)
+        self.assertFalse(deadline.run_deferred())
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(request_deadline.deferred, [])
+        deadline.finish_request(request_deadline)
+
+    def test_work_there_is_no_time_for_is_dropped(self):
+        class Context(object):
+            remaining = 5000
+
+            def get_remaining_time_in_millis(self):
+                return self.remaining
+
+        calls = []
+        context = Context()
+
+        def slow_write(value):
+            calls.append(value)
+            context.remaining = deadline.RESPONSE_RESERVE_MS
+
+        degraded = deadline.stats['degraded_requests']
+        request_deadline = deadline.start_request(context)
+        deadline.defer(slow_write, 1)
+        deadline.defer(calls.append, 2)
+        self.assertTrue(deadline.run_deferred())
+        self.assertEqual(calls, [1])
+        self.assertEqual(request_deadline.deferred, [])
+        self.assertEqual(deadline.stats['degraded_requests'], degraded + 1)
+        deadline.finish_request(request_deadline)
+
+    def test_unrun_work_is_not_carried_into_the_next_request(self):
+        calls = []
+        request_deadline = deadline.start_request()
+        deadline.defer(calls.append, 1)
+        deadline.finish_request(request_deadline)
+
+        next_deadline = deadline.start_request()
+        deadline.run_deferred()
+        deadline.finish_request(next_deadline)
+        self.assertEqual(calls, [])
+
+    def test_remaining_time_follows_the_lambda_context(self):
+        class Context(object):
+            def get_remaining_time_in_millis(self):
+                return 1200
+
+        request_deadline = deadline.RequestDeadline(Context())
+        self.assertLessEqual(request_deadline.remaining_ms(), 1200)
+
+
+if __name__ == '__main__':
+    unittest.main()
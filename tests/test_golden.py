@@ -0,0 +1,33 @@
+import os
+import glob
+import json
+import unittest
+import golden_replay
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIRECTORY = os.path.join(HERE, 'golden')
+SNAPSHOT_PATH = os.path.join(HERE, 'data', 'content_snapshot.json')
+
+
+class GoldenReplayTest(unittest.TestCase):
+    """ Replays the recorded sessions in tests/golden through this tree and
+    diffs everything it produced against golden.json. After a change meant
+    to alter the skill's behavior, record it again with
+
+        python golden_replay.py record tests/golden/*.jsonl --golden tests/golden/golden.json
+            --snapshot tests/data/content_snapshot.json
+    """
+
+    def test_replay_matches_the_golden_snapshot(self):
+        with open(os.path.join(GOLDEN_DIRECTORY, 'golden.json')) as golden_file:
+            golden = json.load(golden_file)
+        sequences = sorted(glob.glob(os.path.join(GOLDEN_DIRECTORY, '*.jsonl')))
+        output = golden_replay.run_implementation(golden_replay.HERE, sequences, golden['seed'],
+                                                  SNAPSHOT_PATH)
+        differences = golden_replay.diff_outputs(golden, output)
+        self.assertEqual(differences[:golden_replay.MAX_LISTED_DIFFERENCES], [],
+                         str(len(differences)) + " differences from the golden snapshot")
+
+
+if __name__ == '__main__':
+    unittest.main()
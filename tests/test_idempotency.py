@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import deadline
+import idempotency
+from idempotency import RequestDeduplicator, SQLiteRequestLog, RequestInProgressError
+
+
+class RequestDeduplicatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.request_log = SQLiteRequestLog(os.path.join(self.directory, 'requests.db'))
+        self.deduplicator = RequestDeduplicator(self.request_log)
+        self.calls = 0
+
+    def tearDown(self):
+        deadline.set_current_deadline(None)
+        shutil.rmtree(self.directory)
+
+    def handler(self):
+        self.calls += 1
+        return {'response': self.calls}
+
+    def other_container(self):
+        # Shares the request log but not the in-memory cache.
+        return RequestDeduplicator(self.request_log)
+
+    def test_a_retry_replays_the_first_response(self):
+        first = self.deduplicator.run_once('request-1', self.handler)
+        self.assertEqual(self.deduplicator.run_once('request-1', self.handler), first)
+        self.assertEqual(self.other_container().run_once('request-1', self.handler), first)
+        self.assertEqual(self.calls, 1)
+
+    def test_different_requests_both_run(self):
+        self.deduplicator.run_once('request-1', self.handler)
+        self.deduplicator.run_once('request-2', self.handler)
+        self.assertEqual(self.calls, 2)
+
+    def test_a_retry_waits_for_an_attempt_still_running(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_handler():
+            started.set()
+            release.wait(5)
+            return self.handler()
+
+        first = threading.Thread(target=self.deduplicator.run_once, args=('request-1', slow_handler))
+        first.start()
+        started.wait(5)
+        threading.Timer(0.3, release.set).start()
+        retried = self.other_container().run_once('request-1', self.handler, lambda: 'busy')
+        first.join()
+        self.assertEqual(retried, {'response': 1})
+        self.assertEqual(self.calls, 1)
+
+    def test_a_retry_that_cannot_wait_is_told_the_request_is_busy(self):
+        self.request_log.claim('request-1')
+        request_deadline = deadline.start_request()
+        request_deadline.expires_at = 0
+        retry = self.other_container()
+        self.assertEqual(retry.run_once('request-1', self.handler, lambda: 'busy'), 'busy')
+        with self.assertRaises(RequestInProgressError):
+            retry.run_once('request-1', self.handler)
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(retry.in_progress, 2)
+
+    def test_a_claim_that_timed_out_is_run_again(self):
+        self.request_log.claim('request-1')
+        timeout = idempotency.CLAIM_TIMEOUT
+        idempotency.CLAIM_TIMEOUT = -1
+        try:
+            self.assertEqual(self.deduplicator.run_once('request-1', self.handler), {'response': 1})
+        finally:
+            idempotency.CLAIM_TIMEOUT = timeout
+        self.assertEqual(self.deduplicator.reexecuted, 1)
+
+    def test_a_failed_attempt_releases_its_claim(self):
+        def failing_handler():
+            raise RuntimeError("handler failed")
+
+        with self.assertRaises(RuntimeError):
+            self.deduplicator.run_once('request-1', failing_handler)
+        self.assertEqual(self.request_log.claim('request-1'), (idempotency.CLAIMED, None))
+
+    def test_the_response_is_stored_after_the_handler_finishes(self):
+        stored = []
+
+        def handler():
+            stored.append(self.request_log.response('request-1'))
+            return self.handler()
+
+        self.deduplicator.run_once('request-1', handler)
+        self.assertEqual(stored, [None])
+        self.assertIsNotNone(self.request_log.response('request-1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import mastery
+from mastery import PRIOR_MASTERY, update_mastery, to_stored, from_stored, get_mastery, \
+    weakest_map, update_weakest, weakest_attributes
+
+
+class UpdateMasteryTest(unittest.TestCase):
+
+    def test_a_correct_answer_follows_bayesian_knowledge_tracing(self):
+        # P(known | correct) = 0.3 * 0.9 / (0.3 * 0.9 + 0.7 * 0.5) = 0.4355
+        # plus learning: 0.4355 + 0.5645 * 0.1 = 0.4919
+        self.assertAlmostEqual(update_mastery(0.3, True, 'TrueFalse'), 0.4919, places=4)
+
+    def test_an_incorrect_answer_follows_bayesian_knowledge_tracing(self):
+        # P(known | incorrect) = 0.3 * 0.1 / (0.3 * 0.1 + 0.7 * 0.5) = 0.0789
+        # plus learning: 0.0789 + 0.9211 * 0.1 = 0.1711
+        self.assertAlmostEqual(update_mastery(0.3, False, 'TrueFalse'), 0.1711, places=4)
+
+    def test_harder_guesses_make_a_correct_answer_count_for_more(self):
+        self.assertGreater(update_mastery(PRIOR_MASTERY, True, 'MultipleChoice'),
+                           update_mastery(PRIOR_MASTERY, True, 'TrueFalse'))
+
+    def test_mastery_stays_a_probability(self):
+        probability = PRIOR_MASTERY
+        for _ in range(50):
+            probability = update_mastery(probability, True)
+        self.assertLessEqual(probability, 1.0)
+        for _ in range(50):
+            probability = update_mastery(probability, False)
+        self.assertGreaterEqual(probability, mastery.LEARN_PROBABILITY)
+
+    def test_stored_values_round_trip(self):
+        self.assertEqual(to_stored(from_stored(4919)), 4919)
+
+    def test_items_without_mastery_are_seeded_from_their_counters(self):
+        item = {'CounterCorrect': {'counts': 2}, 'CounterIncorrect': {'resets': 1}}
+        estimates = get_mastery(item)
+        self.assertGreater(estimates['counts'], PRIOR_MASTERY)
+        self.assertLess(estimates['resets'], PRIOR_MASTERY)
+
+
+class WeakestAttributesTest(unittest.TestCase):
+
+    def test_only_attributes_below_the_prior_are_kept(self):
+        weakest = weakest_map({'a': 0.1, 'b': 0.2, 'c': 0.9, 'd': 0.25, 'e': 0.05}, k=3)
+        self.assertEqual(set(weakest), {'e', 'a', 'b'})
+
+    def test_incremental_updates_match_a_rebuild(self):
+        estimates = {}
+        weakest = {}
+        answers = [('a', False), ('b', False), ('c', False), ('d', False), ('a', True),
+                   ('a', True), ('b', True), ('e', False), ('c', True), ('c', True)]
+        for attribute, correct in answers:
+            estimates[attribute] = update_mastery(estimates.get(attribute, PRIOR_MASTERY), correct)
+            weakest = update_weakest(weakest, estimates, attribute)
+            self.assertEqual(weakest, weakest_map(estimates))
+
+    def test_ties_for_the_lowest_are_all_returned(self):
+        self.assertEqual(sorted(weakest_attributes({'a': 100, 'b': 100, 'c': 200})), ['a', 'b'])
+        self.assertEqual(weakest_attributes({}), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import locales
+import phrases
+from phrases import DEFAULT_PHRASES, load_phrases
+import alexa_plc_counter_instruction_tutor as tutor
+
+
+class PhrasesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'de-DE.json'), 'w', encoding='utf-8') as phrases_file:
+            json.dump({
+                'welcome_new': "Willkommen beim Tutor! Soll ich dich abfragen oder unterrichten?",
+                'card_titles': dict(DEFAULT_PHRASES['card_titles'], welcome="Willkommen"),
+                'true_false_question': "Wahr oder falsch? {question}"
+            }, phrases_file)
+        self.patched = (phrases.PHRASES_DIRECTORY, list(locales.SUPPORTED_LOCALES))
+        phrases.PHRASES_DIRECTORY = self.directory
+        locales.SUPPORTED_LOCALES.append('de-DE')
+        locales._resolved.clear()
+
+    def tearDown(self):
+        phrases.PHRASES_DIRECTORY, locales.SUPPORTED_LOCALES[:] = self.patched
+        locales._resolved.clear()
+        locales.set_current_locale(None)
+        phrases._phrases = locales.LocaleCache(load_phrases)
+        shutil.rmtree(self.directory)
+
+    def test_a_locale_file_replaces_only_its_own_phrases(self):
+        german = load_phrases('de-DE')
+        self.assertEqual(german['card_titles']['welcome'], "Willkommen")
+        self.assertEqual(german['goodbye'], DEFAULT_PHRASES['goodbye'])
+
+    def test_prompts_are_said_in_the_request_locale(self):
+        locales.set_current_locale('de-DE')
+        speech_output, _ = tutor.welcome_prompt(returning=False)
+        self.assertEqual(speech_output, "<speak>Willkommen beim Tutor! Soll ich dich abfragen "
+                                        "oder unterrichten?</speak>")
+        self.assertEqual(tutor.title('welcome'), "Willkommen")
+        self.assertEqual(tutor.question_speech({"QuestionType": "TrueFalse", "Question": "Q."}),
+                         "Wahr oder falsch? Q.")
+
+        locales.set_current_locale('en-US')
+        self.assertEqual(tutor.question_speech({"QuestionType": "TrueFalse", "Question": "Q."}),
+                         "True or False? Q.")
+
+    def test_every_phrase_has_only_known_fields(self):
+        fields = dict(pause='', question='', options='', parts='', shared='', choices='', last='',
+                      letter='', choice='', number='', answer='', explanation='', count='',
+                      right='', attributes='')
+
+        def check(phrase):
+            if isinstance(phrase, str):
+                phrase.format(**fields)
+            elif isinstance(phrase, dict):
+                for value in phrase.values():
+                    check(value)
+            else:
+                for value in phrase:
+                    check(value)
+
+        for phrase in DEFAULT_PHRASES.values():
+            check(phrase)
+
+
+if __name__ == '__main__':
+    unittest.main()
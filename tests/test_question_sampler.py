@@ -0,0 +1,42 @@
+import random
+import unittest
+from question_sampler import RecentQuestions, sample_index, RECENT_QUESTIONS_KEPT
+
+
+class RecentQuestionsTest(unittest.TestCase):
+
+    def test_keeps_the_last_questions(self):
+        recent = RecentQuestions()
+        for question in range(RECENT_QUESTIONS_KEPT + 3):
+            recent.add(question)
+        self.assertNotIn(2, recent)
+        self.assertIn(3, recent)
+        self.assertEqual(recent.asked_ago(RECENT_QUESTIONS_KEPT + 2), 0)
+        self.assertEqual(recent.asked_ago(3), RECENT_QUESTIONS_KEPT - 1)
+
+    def test_round_trips_through_the_session(self):
+        recent = RecentQuestions()
+        for question in range(RECENT_QUESTIONS_KEPT + 3):
+            recent.add(question)
+        restored = RecentQuestions.from_session({'RecentQuestions': recent.to_session()})
+        self.assertEqual(restored.to_session(), recent.to_session())
+        self.assertEqual(restored.asked_ago(5), recent.asked_ago(5))
+
+    def test_recent_questions_are_not_drawn(self):
+        recent = RecentQuestions()
+        for question in (10, 11, 12):
+            recent.add(question)
+        rng = random.Random(0)
+        candidates = [10, 11, 12, 13]
+        for _ in range(20):
+            self.assertEqual(sample_index(candidates, recent, rng), 3)
+
+    def test_the_question_asked_longest_ago_is_repeated_when_all_are_recent(self):
+        recent = RecentQuestions()
+        for question in (10, 11, 12):
+            recent.add(question)
+        self.assertEqual(sample_index([12, 11, 10], recent, random.Random(0)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import sqlite3
+import unittest
+from botocore.exceptions import EndpointConnectionError, NoCredentialsError, \
+    ParamValidationError, ClientError
+from resilience import CircuitBreaker, CircuitOpenError, is_transient
+
+
+def client_error(code, status=400):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}},
+                       'GetItem')
+
+
+class IsTransientTest(unittest.TestCase):
+
+    def test_outages_and_throttles_are_transient(self):
+        self.assertTrue(is_transient(EndpointConnectionError(endpoint_url='http://localhost')))
+        self.assertTrue(is_transient(client_error('ProvisionedThroughputExceededException')))
+        self.assertTrue(is_transient(client_error('SomethingElse', 503)))
+        self.assertTrue(is_transient(sqlite3.OperationalError("database is locked")))
+        self.assertTrue(is_transient(CircuitOpenError("open")))
+
+    def test_errors_that_repeat_are_not_transient(self):
+        self.assertFalse(is_transient(NoCredentialsError()))
+        self.assertFalse(is_transient(ParamValidationError(report="bad")))
+        self.assertFalse(is_transient(client_error('ValidationException')))
+        self.assertFalse(is_transient(ValueError("bug")))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30.0)
+
+    def fail(self):
+        raise sqlite3.OperationalError("down")
+
+    def trip(self):
+        for _ in range(self.breaker.failure_threshold):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.breaker.call(self.fail)
+
+    def test_opens_after_consecutive_transient_failures(self):
+        self.trip()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: 'not called')
+        self.assertEqual(self.breaker.rejected_calls, 1)
+
+    def test_a_success_resets_the_failure_count(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        with self.assertRaises(sqlite3.OperationalError):
+            self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_other_errors_do_not_count(self):
+        for _ in range(5):
+            with self.assertRaises(ValueError):
+                self.breaker.call(int, 'x')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.trip()
+        self.breaker.opened_at -= self.breaker.reset_timeout
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_a_successful_trial_closes(self):
+        self.trip()
+        self.breaker.opened_at -= self.breaker.reset_timeout
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_a_failed_trial_opens_again(self):
+        self.trip()
+        self.breaker.opened_at -= self.breaker.reset_timeout
+        with self.assertRaises(sqlite3.OperationalError):
+            self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.times_opened, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import random
+import unittest
+from scheduler import BOX_INTERVALS, pack, unpack, next_review, postpone, next_attribute
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_entries_round_trip(self):
+        self.assertEqual(unpack(pack(37, 4)), (37, 4))
+
+    def test_correct_answers_move_up_a_box(self):
+        value = next_review(None, True, clock=1)
+        self.assertEqual(unpack(value), (1 + BOX_INTERVALS[1], 1))
+        value = next_review(value, True, clock=3)
+        self.assertEqual(unpack(value), (3 + BOX_INTERVALS[2], 2))
+
+    def test_the_top_box_is_kept(self):
+        value = pack(0, len(BOX_INTERVALS) - 1)
+        self.assertEqual(unpack(next_review(value, True, clock=10))[1], len(BOX_INTERVALS) - 1)
+
+    def test_an_incorrect_answer_goes_back_to_the_first_box(self):
+        value = next_review(pack(50, 4), False, clock=20)
+        self.assertEqual(unpack(value), (20 + BOX_INTERVALS[0], 0))
+
+    def test_postponing_keeps_the_box(self):
+        self.assertEqual(unpack(postpone(pack(5, 3), 12)), (12, 3))
+        self.assertEqual(unpack(postpone(None, 12)), (12, 0))
+
+    def test_the_attribute_due_first_is_asked_next(self):
+        schedule = {'a': pack(9, 2), 'b': pack(4, 1), 'c': pack(6, 0)}
+        self.assertEqual(next_attribute(['a', 'b', 'c'], schedule, {}, random.Random(0)), 'b')
+
+    def test_never_answered_attributes_are_due_straight_away(self):
+        schedule = {'a': pack(3, 1)}
+        self.assertEqual(next_attribute(['a', 'new'], schedule, {}, random.Random(0)), 'new')
+
+    def test_ties_go_to_the_lowest_mastery(self):
+        schedule = {'a': pack(4, 1), 'b': pack(4, 1)}
+        self.assertEqual(next_attribute(['a', 'b'], schedule, {'a': 0.8, 'b': 0.2},
+                                        random.Random(0)), 'b')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import asyncio
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import server
+from content_catalog import ContentCatalog, ResilientContent, set_content
+from user_store import ResilientUserStore, set_user_store
+from test_user_store import FlakyStore
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_PATH = os.path.join(HERE, 'data', 'content_snapshot.json')
+
+
+class RecordingWriter(object):
+    """ Collects what the server writes to a connection. """
+
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class ContentLengthTest(unittest.TestCase):
+
+    def test_only_non_negative_integers_are_lengths(self):
+        self.assertEqual(server.parse_content_length('0'), 0)
+        self.assertEqual(server.parse_content_length(' 42 '), 42)
+        for value in ('', '-1', '+5', 'abc', '1.5', '\xb2'):
+            self.assertIsNone(server.parse_content_length(value), value)
+
+    def send(self, request):
+        async def handle():
+            reader = asyncio.StreamReader()
+            reader.feed_data(request)
+            reader.feed_eof()
+            writer = RecordingWriter()
+            await server.TutorServer(workers=1).handle_connection(reader, writer)
+            return writer
+
+        return asyncio.run(handle())
+
+    def test_a_malformed_content_length_is_a_bad_request(self):
+        for value in (b'abc', b'-10'):
+            writer = self.send(b'POST / HTTP/1.1\r\nContent-Length: ' + value + b'\r\n\r\n{}')
+            self.assertTrue(writer.data.startswith(b'HTTP/1.1 400 '), writer.data)
+            self.assertTrue(writer.closed)
+
+
+class ReadinessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = FlakyStore(os.path.join(self.directory, 'users.db'))
+        set_user_store(ResilientUserStore(self.store))
+        set_content(ResilientContent(ContentCatalog.from_snapshot(SNAPSHOT_PATH)))
+        self.server = server.TutorServer(workers=1)
+        environment = {'TUTOR_USER_STORE': 'sqlite', 'TUTOR_CONTENT_SOURCE': 'snapshot'}
+        patcher = mock.patch.dict(os.environ, environment)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.executor.shutdown()
+        set_user_store(None)
+        set_content(None)
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_not_ready_while_the_user_store_is_down(self):
+        # The resilient store would answer with new user defaults.
+        self.store.down = True
+        self.server.warm_up()
+        self.assertFalse(self.server.readiness()['ready'])
+
+        self.store.down = False
+        self.server.warm_up()
+        self.assertTrue(self.server.readiness()['ready'])
+
+
+if __name__ == '__main__':
+    unittest.main()
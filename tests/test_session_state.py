@@ -0,0 +1,102 @@
+import os
+import json
+import random
+import unittest
+import session_state
+from session_state import SessionStateError
+from content_catalog import ContentCatalog
+import alexa_plc_counter_instruction_tutor as tutor
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data',
+                             'content_snapshot.json')
+
+
+def question(question_type, level, catalog):
+    """ Returns the details of a new question, as the skill keeps them in the
+    session. """
+
+    if question_type == "TrueFalse":
+        attribute, text, partial, full, key = tutor.generate_true_false(level, content=catalog)
+        return {"QuestionType": question_type, "QuestionAttribute": attribute, "Question": text,
+                "PartialAnswer": partial, "FullAnswer": full, "QuestionKey": key}
+    if question_type == "SelectPart":
+        attribute, text, answer, parts, key = tutor.generate_select_part(level, content=catalog)
+        return {"QuestionType": question_type, "QuestionAttribute": attribute, "Question": text,
+                "Answer": answer, "Parts": parts, "QuestionKey": key}
+    attribute, text, choices, answer, full, key = tutor.generate_multiple_choice(level, content=catalog)
+    return {"QuestionType": question_type, "QuestionAttribute": attribute, "Question": text,
+            "Choices": choices, "Answer": answer, "FullAnswer": full, "QuestionKey": key}
+
+
+class SessionStateTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.catalog = ContentCatalog.from_snapshot(SNAPSHOT_PATH)
+
+    def setUp(self):
+        random.seed(0)
+
+    def round_trip(self, attributes, catalog=None):
+        # Alexa hands the attributes back as JSON.
+        encoded = json.loads(json.dumps(session_state.encode(attributes, self.catalog)))
+        return session_state.decode(encoded, catalog or self.catalog)
+
+    def test_questions_round_trip(self):
+        for question_type in session_state.QUESTION_TYPES:
+            for level in (1, 2, 3, 4):
+                details = question(question_type, level, self.catalog)
+                attributes = dict(details, CurrentStage="GenerateQuestion",
+                                  RecentQuestions={"Ids": [1, 2], "Next": 2})
+                self.assertEqual(self.round_trip(attributes), attributes)
+
+    def test_quiz_rounds_round_trip(self):
+        questions = [question(question_type, 2, self.catalog)
+                     for question_type in session_state.QUESTION_TYPES]
+        attributes = {
+            "CurrentStage": "QuizRound",
+            "QuizRound": {"Questions": questions, "Results": [True, False]},
+            "QuizRoundSize": 3,
+            "QuizRoundScore": 1
+        }
+        self.assertEqual(self.round_trip(attributes), attributes)
+
+    def test_quiz_feedback_round_trips(self):
+        attribute = self.catalog.attributes()[0]
+        attributes = {
+            "CurrentStage": "GiveQuizFeedback",
+            "QuizFeedback": {attribute: self.catalog.feedback_statement(attribute)}
+        }
+        self.assertEqual(self.round_trip(attributes), attributes)
+
+    def test_unknown_keys_are_kept(self):
+        attributes = {"CurrentStage": "OptionsMenu", "Extra": {"kept": [1, 2]}}
+        self.assertEqual(self.round_trip(attributes), attributes)
+
+    def test_attributes_saved_before_the_encoding_are_used_as_they_are(self):
+        attributes = {"CurrentStage": "OptionsMenu", "SpeechOutput": "<speak>Hi</speak>"}
+        self.assertEqual(session_state.decode(attributes, self.catalog), attributes)
+
+    def test_changed_content_is_detected(self):
+        with open(SNAPSHOT_PATH) as snapshot_file:
+            tables = json.load(snapshot_file)['tables']
+        tables['FactTable'] = tables['FactTable'][1:]
+        with self.assertRaises(SessionStateError):
+            self.round_trip({"CurrentStage": "OptionsMenu"}, ContentCatalog(tables))
+
+    def test_the_same_content_in_another_order_still_decodes(self):
+        with open(SNAPSHOT_PATH) as snapshot_file:
+            tables = json.load(snapshot_file)['tables']
+        for items in tables.values():
+            items.reverse()
+            for item in items:
+                item['Unused'] = "left out of the snapshot"
+        reordered = ContentCatalog(tables)
+        self.assertEqual(reordered.fingerprint, self.catalog.fingerprint)
+        details = question("TrueFalse", 1, self.catalog)
+        attributes = dict(details, CurrentStage="GenerateQuestion")
+        self.assertEqual(self.round_trip(attributes, reordered), attributes)
+
+
+if __name__ == '__main__':
+    unittest.main()
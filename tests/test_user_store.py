@@ -0,0 +1,194 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+import deadline
+from user_store import SQLiteUserStore, ResilientUserStore
+
+
+class SQLiteUserStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = SQLiteUserStore(os.path.join(self.directory, 'users.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_a_new_user_starts_at_the_first_level(self):
+        self.assertIsNone(self.store.get_user('user-1'))
+        self.store.create_user('user-1')
+        item = self.store.get_user('user-1')
+        self.assertEqual(item['QuestionLevel'], 1)
+        self.assertEqual(item['CounterCorrect'], {})
+        self.assertEqual(item['TutoringStatus'], {'OrderLevel': 1, 'StatementLevel': 1})
+
+    def test_values_and_deltas_are_applied_together(self):
+        self.store.create_user('user-1')
+        self.store.update('user-1', values={('QuestionLevel',): 2, ('Mastery',): {'counts': 400}},
+                          deltas={('CounterCorrect', 'counts'): 1})
+        self.store.increment('user-1', ('CounterCorrect', 'counts'), 2)
+        item = self.store.get_user('user-1')
+        self.assertEqual(item['QuestionLevel'], 2)
+        self.assertEqual(item['Mastery'], {'counts': 400})
+        self.assertEqual(item['CounterCorrect'], {'counts': 3})
+
+    def test_concurrent_increments_are_not_lost(self):
+        self.store.create_user('user-1')
+
+        def answer():
+            for _ in range(25):
+                self.store.increment('user-1', ('CounterIncorrect', 'counts'))
+
+        threads = [threading.Thread(target=answer) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.store.get_user('user-1')['CounterIncorrect'], {'counts': 100})
+
+    def test_iter_users_streams_the_requested_fields(self):
+        for user_id in ('user-2', 'user-1'):
+            self.store.create_user(user_id)
+        self.store.update('user-2', deltas={('CounterCorrect', 'counts'): 1})
+        users = list(self.store.iter_users(fields=['QuestionLevel']))
+        self.assertEqual([item['UserID'] for item in users], ['user-1', 'user-2'])
+        self.assertEqual(users[1]['QuestionLevel'], 1)
+        self.assertNotIn('PreviousTotalCorrect', users[1])
+
+    def test_reset_user_starts_over(self):
+        self.store.create_user('user-1')
+        self.store.update('user-1', values={('QuestionLevel',): 4})
+        self.store.reset_user('user-1')
+        self.assertEqual(self.store.get_user('user-1')['QuestionLevel'], 1)
+
+
+class FlakyStore(SQLiteUserStore):
+    """ A SQLite store that can be taken down, counting the updates applied. """
+
+    def __init__(self, path):
+        SQLiteUserStore.__init__(self, path, group_commit=False)
+        self.down = False
+        self.updates = 0
+        self._updates_lock = threading.Lock()
+
+    def get_user(self, user_id):
+        if self.down:
+            raise sqlite3.OperationalError("down")
+        return SQLiteUserStore.get_user(self, user_id)
+
+    def update(self, user_id, values=None, deltas=None):
+        if self.down:
+            raise sqlite3.OperationalError("down")
+        with self._updates_lock:
+            self.updates += 1
+        return SQLiteUserStore.update(self, user_id, values, deltas)
+
+
+class ResilientUserStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = FlakyStore(os.path.join(self.directory, 'users.db'))
+        self.resilient = ResilientUserStore(self.store)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def recover(self):
+        self.store.down = False
+        self.resilient.breaker.opened_at -= self.resilient.breaker.reset_timeout
+
+    def test_writes_are_queued_during_an_outage_and_replayed_in_order(self):
+        self.resilient.create_user('user-1')
+        self.resilient.get_user('user-1')
+        self.store.down = True
+        self.resilient.update('user-1', values={('QuestionLevel',): 2})
+        self.resilient.update('user-1', deltas={('CounterCorrect', 'counts'): 1})
+        self.resilient.update('user-1', values={('QuestionLevel',): 3})
+        self.assertEqual(len(self.resilient._queued), 3)
+        self.assertEqual(self.resilient.get_user('user-1')['QuestionLevel'], 3)
+
+        self.recover()
+        item = self.resilient.get_user('user-1')
+        self.assertEqual(len(self.resilient._queued), 0)
+        self.assertEqual(item['QuestionLevel'], 3)
+        self.assertEqual(item['CounterCorrect']['counts'], 1)
+
+    def test_a_replay_stops_before_the_request_deadline(self):
+        class Context(object):
+            remaining = 5000
+
+            def get_remaining_time_in_millis(self):
+                return self.remaining
+
+        self.resilient.create_user('user-1')
+        self.resilient.get_user('user-1')
+        self.store.down = True
+        for _ in range(10):
+            self.resilient.update('user-1', deltas={('CounterCorrect', 'counts'): 1})
+        self.recover()
+
+        context = Context()
+        request_deadline = deadline.start_request(context)
+        update = self.store.update
+
+        def slow_update(*args):
+            update(*args)
+            context.remaining -= 1000
+
+        self.store.update = slow_update
+        try:
+            self.resilient.replay_queued_writes()
+        finally:
+            deadline.finish_request(request_deadline)
+            del self.store.update
+        self.assertEqual(len(self.resilient._queued), 6)
+
+        self.resilient.replay_queued_writes()
+        self.assertEqual(self.store.get_user('user-1')['CounterCorrect']['counts'], 10)
+
+    def test_concurrent_replays_apply_each_write_once(self):
+        self.resilient.create_user('user-1')
+        self.resilient.get_user('user-1')
+        self.store.down = True
+        for _ in range(100):
+            self.resilient.update('user-1', deltas={('CounterCorrect', 'counts'): 1})
+        self.recover()
+        updates_before = self.store.updates
+        threads = [threading.Thread(target=self.resilient.replay_queued_writes) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.resilient.replay_queued_writes()
+        self.assertEqual(self.store.updates - updates_before, 100)
+        self.assertEqual(self.store.get_user('user-1')['CounterCorrect']['counts'], 100)
+
+    def test_values_computed_from_defaults_do_not_overwrite_real_progress(self):
+        self.store.create_user('user-1')
+        self.store.update('user-1', values={('QuestionLevel',): 4},
+                          deltas={('CounterCorrect', 'counts'): 5})
+        self.store.down = True
+        # Never read before the outage, so the user gets new user defaults.
+        self.assertEqual(self.resilient.get_user('user-1')['QuestionLevel'], 1)
+        self.resilient.update('user-1', values={('QuestionLevel',): 1},
+                              deltas={('CounterCorrect', 'counts'): 1})
+
+        self.recover()
+        item = self.resilient.get_user('user-1')
+        self.assertEqual(item['QuestionLevel'], 4)
+        self.assertEqual(item['CounterCorrect']['counts'], 6)
+        self.assertEqual(self.resilient.dropped_values, 1)
+
+        # Once read for real, the user's values are written again.
+        self.resilient.update('user-1', values={('QuestionLevel',): 2})
+        self.assertEqual(self.store.get_user('user-1')['QuestionLevel'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,351 @@
+"""
+Bulk administration of the LLPTutor_UserData table.
+
+Operations that would otherwise take one request per user run over the
+whole table (or a cohort of users) at once:
+
+    python user_admin.py reset --users cohort.txt
+    python user_admin.py reset --all
+    python user_admin.py migrate compact-counters
+    python user_admin.py migrate add-mastery
+    python user_admin.py delete-inactive --days 365
+
+The table is read with a parallel scan split into segments, each worked
+through by one of a bounded number of workers. After each page of a segment
+is written, the position of every segment is saved to a checkpoint file, so
+a run that stops part way is resumed with the same command plus --resume.
+
+Users keep studying while a run goes on, so every write is conditional:
+
+  * a reset only overwrites a user that exists, so an id in a cohort file
+    that is not in the table does not become a new user,
+  * a migration only replaces an item that is still exactly as it was read;
+    if an answer changed it meanwhile, the item is read again, migrated
+    again and written again, up to MIGRATION_ATTEMPTS times, and
+  * a deletion only removes a user that is still inactive.
+
+A user counts as inactive by LastActive, the day they last launched the
+skill, answered a question, were tutored or reviewed their quiz feedback.
+"""
+
+import os
+import sys
+import json
+import decimal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+import dynamodb_access
+from mastery import PRIOR_MASTERY, to_stored, get_mastery, weakest_map
+from user_store import USER_TABLE_NAME, COUNTER_FIELDS, new_user_item, activity_day
+
+DEFAULT_WORKERS = 4
+DEFAULT_SEGMENTS = 16
+
+# Users read from a cohort file per checkpoint step.
+USER_LIST_BATCH_SIZE = 25
+
+# Attempts at migrating an item that keeps changing while it is migrated.
+MIGRATION_ATTEMPTS = 5
+
+class MigrationConflictError(Exception):
+    """ Raised when a user's item kept changing while it was migrated. The
+    run can be resumed to try again. """
+
+# --------------- Migrations --------------- #
+
+def compact_counters(item):
+    """ Drops zero counters and mastery entries still at the prior, which
+    items created since counters grow lazily leave out. """
+
+    compacted = dict(item)
+    for field in COUNTER_FIELDS:
+        compacted[field] = {attribute: count for attribute, count in item.get(field, {}).items()
+                            if count}
+    if 'Mastery' in item:
+        prior = to_stored(PRIOR_MASTERY)
+        compacted['Mastery'] = {attribute: value for attribute, value in item['Mastery'].items()
+                                if value != prior}
+    return compacted
+
+def add_mastery(item):
+    """ Adds the mastery, weakest attributes and schedule maps to items
+    written before they were tracked, seeding mastery from the counters. """
+
+    migrated = dict(item)
+    mastery = get_mastery(item)
+    if 'Mastery' not in item:
+        migrated['Mastery'] = {attribute: decimal.Decimal(to_stored(probability))
+                               for attribute, probability in mastery.items()}
+    if 'WeakestAttributes' not in item:
+        migrated['WeakestAttributes'] = {attribute: decimal.Decimal(stored)
+                                         for attribute, stored in weakest_map(mastery).items()}
+    migrated.setdefault('Schedule', {})
+    return migrated
+
+# Migration name -> function returning the migrated copy of a user item.
+MIGRATIONS = {
+    'compact-counters': compact_counters,
+    'add-mastery': add_mastery
+}
+
+# --------------- Checkpoints --------------- #
+
+class Checkpoint(object):
+    """ Progress of a run, saved to a JSON file after every page. For a scan
+    it holds each segment's last evaluated key, or True once the segment is
+    finished; for a list of users, how many of them are done. """
+
+    def __init__(self, path, run, state=None):
+        self.path = path
+        self.run = run
+        self.state = state if state is not None else {'segments': {}, 'users_done': 0}
+        self.processed = self.state.get('processed', 0)
+        self.written = self.state.get('written', 0)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, run, resume):
+        """ Returns the checkpoint of run, continuing a saved one if resume is
+        set. Raises ValueError if the saved one is for a different run. """
+
+        if not resume or not os.path.exists(path):
+            return cls(path, run)
+        with open(path) as checkpoint_file:
+            saved = json.load(checkpoint_file)
+        if saved.get('run') != run:
+            raise ValueError(path + " is the checkpoint of a different run: " + repr(saved.get('run')))
+        return cls(path, run, saved['state'])
+
+    def segment_position(self, segment):
+        return self.state['segments'].get(str(segment))
+
+    def advance(self, segment=None, position=None, users_done=None, processed=0, written=0):
+        with self._lock:
+            if segment is not None:
+                self.state['segments'][str(segment)] = position
+            if users_done is not None:
+                self.state['users_done'] = users_done
+            self.processed += processed
+            self.written += written
+            self.state['processed'] = self.processed
+            self.state['written'] = self.written
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump({'run': self.run, 'state': self.state}, checkpoint_file, default=_json_key)
+        os.replace(temporary_path, self.path)
+
+def _json_key(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value)
+    raise TypeError(repr(value) + " is not JSON serializable")
+
+# --------------- Running over the table --------------- #
+
+def conditional_write(table_name, operation, **kwargs):
+    """ Makes a conditional write. Returns False if its condition failed. """
+
+    try:
+        dynamodb_access.call(table_name, operation, **kwargs)
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+    return True
+
+def scan_segment(table_name, segment, total_segments, checkpoint, handle_items, scan_options):
+    """ Works through one segment of a parallel scan from its checkpointed
+    position, handing each page to handle_items(table_name, items), which
+    writes what it needs to and returns how many items it wrote. """
+
+    position = checkpoint.segment_position(segment)
+    if position is True:
+        return
+    while True:
+        kwargs = dict(scan_options, Segment=segment, TotalSegments=total_segments)
+        if position:
+            kwargs['ExclusiveStartKey'] = position
+        response = dynamodb_access.call(table_name, 'scan', **kwargs)
+        written = handle_items(table_name, response['Items'])
+        position = response.get('LastEvaluatedKey') or True
+        checkpoint.advance(segment, position, processed=len(response['Items']),
+                           written=written)
+        if position is True:
+            return
+
+def run_scan(table_name, checkpoint, handle_items, workers=DEFAULT_WORKERS,
+             total_segments=DEFAULT_SEGMENTS, **scan_options):
+    """ Applies handle_items to the whole table a page at a time with a
+    parallel scan. """
+
+    total_segments = checkpoint.state.setdefault('total_segments', total_segments)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(scan_segment, table_name, segment, total_segments,
+                                   checkpoint, handle_items, scan_options)
+                   for segment in range(total_segments)]
+        for future in futures:
+            future.result()
+
+def run_user_list(table_name, user_ids, checkpoint, handle_user_ids, workers=DEFAULT_WORKERS):
+    """ Applies handle_user_ids(table_name, user_ids), which writes what it
+    needs to and returns how many users it wrote, to user_ids a batch at a
+    time from where the checkpoint left off. Batches are handled by up to
+    workers threads at once, and the checkpoint only moves past batches that
+    are all done. """
+
+    batch_size = USER_LIST_BATCH_SIZE
+    start = checkpoint.state['users_done']
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while start < len(user_ids):
+            chunk_starts = range(start, min(start + workers * batch_size, len(user_ids)), batch_size)
+            futures = [executor.submit(handle_user_ids, table_name,
+                                       user_ids[chunk_start:chunk_start + batch_size])
+                       for chunk_start in chunk_starts]
+            written = sum(future.result() for future in futures)
+            done = min(start + workers * batch_size, len(user_ids))
+            checkpoint.advance(users_done=done, processed=done - start, written=written)
+            start = done
+
+# --------------- Operations --------------- #
+
+def reset_users(table_name, user_ids):
+    """ Resets users to new user state, skipping ids not in the table. """
+
+    written = 0
+    for user_id in user_ids:
+        written += conditional_write(table_name, 'put_item', Item=new_user_item(user_id),
+                                     ConditionExpression=Attr('UserID').exists())
+    return written
+
+def reset_items(table_name, items):
+    return reset_users(table_name, [item['UserID'] for item in items])
+
+def unchanged_condition(item, migrated):
+    """ Returns the condition that an item is still exactly as read: every
+    attribute it had has the same value, and none it lacked and migrated
+    adds has appeared. """
+
+    condition = Attr('UserID').exists()
+    for name, value in item.items():
+        if name != 'UserID':
+            condition = condition & Attr(name).eq(value)
+    for name in migrated:
+        if name not in item:
+            condition = condition & Attr(name).not_exists()
+    return condition
+
+def migrate_item(table_name, migration, item):
+    """ Writes the migrated copy of an item if it differs, as long as the
+    item did not change since it was read. On a conflict the item is read
+    and migrated again. Returns True if it was written. """
+
+    for _ in range(MIGRATION_ATTEMPTS):
+        migrated = migration(item)
+        if migrated == item:
+            return False
+        if conditional_write(table_name, 'put_item', Item=migrated,
+                             ConditionExpression=unchanged_condition(item, migrated)):
+            return True
+        item = dynamodb_access.call(table_name, 'get_item', Key={'UserID': item['UserID']},
+                                    ConsistentRead=True).get('Item')
+        if item is None:
+            return False
+    raise MigrationConflictError("user " + repr(item['UserID']) + " kept changing while migrated")
+
+def migrate_items(migration):
+    def handle_items(table_name, items):
+        return sum(migrate_item(table_name, migration, item) for item in items)
+    return handle_items
+
+def delete_items(condition):
+    """ Returns a handler deleting the users of a page that still meet
+    condition when they are deleted. """
+
+    def handle_items(table_name, items):
+        written = 0
+        for item in items:
+            written += conditional_write(table_name, 'delete_item', Key={'UserID': item['UserID']},
+                                         ConditionExpression=condition)
+        return written
+    return handle_items
+
+def inactive_filter(days, include_unknown=False, today=None):
+    """ Returns the scan filter for users last active more than days ago. """
+
+    cutoff = (activity_day() if today is None else today) - days
+    condition = Attr('LastActive').lt(cutoff)
+    if include_unknown:
+        condition = condition | Attr('LastActive').not_exists()
+    return condition
+
+def read_user_ids(path):
+    with open(path) as user_file:
+        return [line.strip() for line in user_file if line.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk administration of user data.")
+    parser.add_argument('--table', default=USER_TABLE_NAME)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS,
+                        help="Segments of the parallel scan")
+    parser.add_argument('--checkpoint', help="Checkpoint file; defaults to one named after the run")
+    parser.add_argument('--resume', action='store_true', help="Continue from the checkpoint")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reset_parser = subparsers.add_parser('reset', help="Reset users to new user state.")
+    cohort = reset_parser.add_mutually_exclusive_group(required=True)
+    cohort.add_argument('--users', help="File with one user id per line")
+    cohort.add_argument('--all', action='store_true', help="Every user in the table")
+
+    migrate_parser = subparsers.add_parser('migrate', help="Migrate user items.")
+    migrate_parser.add_argument('migration', choices=sorted(MIGRATIONS))
+
+    delete_parser = subparsers.add_parser('delete-inactive', help="Delete inactive users.")
+    delete_parser.add_argument('--days', type=int, required=True,
+                               help="Delete users not active for this many days")
+    delete_parser.add_argument('--include-unknown', action='store_true',
+                               help="Also delete users with no recorded activity")
+    args = parser.parse_args(argv)
+
+    if args.command == 'reset':
+        run = ['reset', args.users or 'all']
+    elif args.command == 'migrate':
+        run = ['migrate', args.migration]
+    else:
+        run = ['delete-inactive', args.days, args.include_unknown]
+    checkpoint_path = args.checkpoint or 'user_admin_' + '_'.join(
+        os.path.basename(str(part)) for part in run) + '.checkpoint.json'
+    if os.path.exists(checkpoint_path) and not args.resume:
+        print(checkpoint_path + " exists; pass --resume to continue that run, or delete it")
+        return 1
+    checkpoint = Checkpoint.load(checkpoint_path, run, args.resume)
+
+    if args.command == 'reset' and args.users:
+        run_user_list(args.table, read_user_ids(args.users), checkpoint, reset_users, args.workers)
+    elif args.command == 'reset':
+        run_scan(args.table, checkpoint, reset_items, args.workers, args.segments,
+                 ProjectionExpression='UserID')
+    elif args.command == 'migrate':
+        run_scan(args.table, checkpoint, migrate_items(MIGRATIONS[args.migration]),
+                 args.workers, args.segments)
+    else:
+        # The cutoff is fixed when the run starts, so a resumed run deletes
+        # the same users.
+        today = checkpoint.state.setdefault('today', activity_day())
+        condition = inactive_filter(args.days, args.include_unknown, today)
+        run_scan(args.table, checkpoint, delete_items(condition), args.workers, args.segments,
+                 ProjectionExpression='UserID', FilterExpression=condition)
+
+    print(str(checkpoint.processed) + " users processed, " + str(checkpoint.written) + " written")
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,703 @@
+"""
+Storage backends for user progress (attribute counters, question level and
+tutoring status). The skill reads and writes user data through a UserStore so
+the same handlers can run against DynamoDB in Lambda, or against a local SQLite
+file for self-hosted runs and load tests.
+
+Running this file directly measures the throughput of a backend, e.g.
+
+    python user_store.py --backend sqlite --path /tmp/users.db --threads 32
+"""
+
+import os
+import sys
+import time
+import queue
+import random
+import decimal
+import sqlite3
+import argparse
+import copy
+import threading
+import collections
+import deadline
+import dynamodb_access
+import structured_log
+from resilience import CircuitBreaker, STORAGE_ERRORS, is_transient
+
+USER_TABLE_NAME = 'LLPTutor_UserData'
+DEFAULT_SQLITE_PATH = 'llptutor_userdata.db'
+
+# Segments of the parallel scan that iter_users() runs on DynamoDB.
+DEFAULT_SCAN_SEGMENTS = 8
+
+# Maps every user item has, even before they hold anything. Their entries are
+# added as the user answers questions about each attribute.
+COUNTER_FIELDS = ['CounterCorrect', 'CounterIncorrect']
+
+# Attribute names used by the throughput measurement.
+BENCHMARK_ATTRIBUTES = ['attribute ' + str(index) for index in range(18)]
+
+def activity_day(now=None):
+    """ Returns the day number, counted from the Unix epoch, stored as a
+    user's LastActive. """
+
+    return int((time.time() if now is None else now) // 86400)
+
+def new_user_item(user_id):
+    """ Returns the item a brand new user starts out with. Counters, mastery
+    and schedule entries are added per attribute as the user answers, so the
+    item does not depend on which attributes the content teaches. """
+
+    return {
+        'UserID': user_id,
+        'CounterCorrect': {},
+        'CounterIncorrect': {},
+        'PreviousTotalCorrect': decimal.Decimal(0),
+        'PreviousTotalIncorrect': decimal.Decimal(0),
+        'QuestionLevel': decimal.Decimal(1),
+        'LastActive': decimal.Decimal(activity_day()),
+        'Mastery': {},
+        'WeakestAttributes': {},
+        'Schedule': {},
+        'TutoringStatus': {
+            'OrderLevel': decimal.Decimal(1),
+            'StatementLevel': decimal.Decimal(1)
+        }
+    }
+
+# --------------- Store interface --------------- #
+
+class UserStore(object):
+    """ Interface implemented by every user data backend.
+
+    Fields are addressed by paths, which are tuples such as ('QuestionLevel',)
+    or ('CounterCorrect', attribute). Each call to update() is applied as a
+    single atomic transaction, so a counter increment and the fields that
+    depend on it never end up half written. """
+
+    name = 'abstract'
+
+    def create_user(self, user_id):
+        """ Writes a new user item, replacing any existing one. """
+        raise NotImplementedError
+
+    def get_user(self, user_id):
+        """ Returns the user item as a nested dict, or None if there is no
+        such user. Numbers are returned as decimal.Decimal, like DynamoDB. """
+        raise NotImplementedError
+
+    def update(self, user_id, values=None, deltas=None):
+        """ Sets every path in values and atomically adds every delta in
+        deltas, all in one transaction. A value may also be a whole map of
+        numbers, set at a single element path such as ('Mastery',). """
+        raise NotImplementedError
+
+    def iter_users(self, fields=None):
+        """ Yields every user item, with only the given top level fields (and
+        UserID) if fields is set. Items are streamed, not loaded all at once. """
+        raise NotImplementedError
+
+    def user_exists(self, user_id):
+        return self.get_user(user_id) is not None
+
+    def increment(self, user_id, path, amount=1):
+        """ Atomically adds amount to the number stored at path. """
+        self.update(user_id, deltas={path: amount})
+
+    def reset_user(self, user_id):
+        """ Resets a user to new user state. """
+        self.create_user(user_id)
+
+    def close(self):
+        pass
+
+# --------------- DynamoDB backend --------------- #
+
+class DynamoDBUserStore(UserStore):
+    """ Stores users in the LLPTutor_UserData DynamoDB table. """
+
+    name = 'dynamodb'
+
+    def __init__(self, table_name=USER_TABLE_NAME, scan_segments=DEFAULT_SCAN_SEGMENTS):
+        self.table_name = table_name
+        self.scan_segments = scan_segments
+
+    def create_user(self, user_id):
+        dynamodb_access.call(self.table_name, 'put_item', Item=new_user_item(user_id))
+
+    def get_user(self, user_id):
+        response = dynamodb_access.call(self.table_name, 'get_item', Key={'UserID': user_id})
+        return response.get('Item')
+
+    def iter_users(self, fields=None):
+        # Each segment of a parallel scan is read by its own thread. Pages are
+        # handed over through a bounded queue, so a slow consumer holds back
+        # the scan instead of letting pages pile up in memory.
+        segments = self.scan_segments
+        pages = queue.Queue(maxsize=2 * segments)
+        scan_options = {'TotalSegments': segments}
+        if fields:
+            names = {'#f' + str(index): field
+                     for index, field in enumerate(['UserID'] + list(fields))}
+            scan_options['ProjectionExpression'] = ', '.join(names)
+            scan_options['ExpressionAttributeNames'] = names
+
+        def scan_segment(segment):
+            try:
+                kwargs = dict(scan_options, Segment=segment)
+                while True:
+                    response = dynamodb_access.call(self.table_name, 'scan', **kwargs)
+                    pages.put(response['Items'])
+                    if 'LastEvaluatedKey' not in response:
+                        break
+                    kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            except Exception as error:
+                pages.put(error)
+                return
+            pages.put(None)
+
+        for segment in range(segments):
+            threading.Thread(target=scan_segment, args=(segment,),
+                             name='user-scan-' + str(segment), daemon=True).start()
+        finished = 0
+        while finished < segments:
+            page = pages.get()
+            if page is None:
+                finished += 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                for item in page:
+                    yield item
+
+    def update(self, user_id, values=None, deltas=None):
+        names = {}
+        expression_values = {}
+        clauses = []
+
+        def name_path(path):
+            placeholders = []
+            for part in path:
+                placeholder = '#n' + str(len(names))
+                names[placeholder] = part
+                placeholders.append(placeholder)
+            return '.'.join(placeholders)
+
+        for path, value in (values or {}).items():
+            placeholder = ':v' + str(len(expression_values))
+            expression_values[placeholder] = _to_number(value)
+            clauses.append(name_path(path) + ' = ' + placeholder)
+        for path, delta in (deltas or {}).items():
+            placeholder = ':v' + str(len(expression_values))
+            expression_values[placeholder] = decimal.Decimal(delta)
+            expression_values[':zero'] = decimal.Decimal(0)
+            target = name_path(path)
+            clauses.append(target + ' = if_not_exists(' + target + ', :zero) + ' + placeholder)
+        if not clauses:
+            return
+
+        dynamodb_access.call(
+            self.table_name,
+            'update_item',
+            Key={
+                'UserID': user_id,
+            },
+            UpdateExpression='set ' + ', '.join(clauses),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=expression_values,
+            ReturnValues="NONE"
+        )
+
+# --------------- SQLite backend --------------- #
+
+class SQLiteUserStore(UserStore):
+    """ Stores users in a local SQLite database running in WAL mode.
+
+    Every number lives in its own row keyed by (user_id, section, field), so
+    increments are single atomic upserts. With group_commit enabled, writes
+    from concurrent threads are queued and a single writer thread commits them
+    together, which turns many small fsyncs into one per batch. """
+
+    name = 'sqlite'
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS user_data ("
+        " user_id TEXT NOT NULL,"
+        " section TEXT NOT NULL,"
+        " field TEXT NOT NULL,"
+        " value INTEGER NOT NULL,"
+        " PRIMARY KEY (user_id, section, field)"
+        ") WITHOUT ROWID"
+    )
+    _SET = (
+        "INSERT INTO user_data (user_id, section, field, value) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id, section, field) DO UPDATE SET value = excluded.value"
+    )
+    _ADD = (
+        "INSERT INTO user_data (user_id, section, field, value) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id, section, field) DO UPDATE SET value = value + excluded.value"
+    )
+
+    def __init__(self, path, group_commit=True, max_batch=256, max_wait=0.0):
+        self.path = path
+        self.group_commit = group_commit
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.batches_committed = 0
+        self.writes_committed = 0
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(self._SCHEMA)
+
+        self._pending = queue.Queue()
+        self._writer = None
+        if group_commit:
+            self._writer = threading.Thread(target=self._write_loop,
+                                            name='user-store-writer', daemon=True)
+            self._writer.start()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit mode, transactions are started explicitly below.
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _split(path):
+        if len(path) == 1:
+            return '', path[0]
+        return path[0], path[1]
+
+    def create_user(self, user_id):
+        item = new_user_item(user_id)
+        statements = [("DELETE FROM user_data WHERE user_id = ?", (user_id,))]
+        for key, value in item.items():
+            if key == 'UserID':
+                continue
+            if isinstance(value, dict):
+                for field, number in value.items():
+                    statements.append((self._SET, (user_id, key, field, int(number))))
+            else:
+                statements.append((self._SET, (user_id, '', key, int(value))))
+        self._write(statements)
+
+    @staticmethod
+    def _item(user_id, rows):
+        item = {'UserID': user_id}
+        for section, field, value in rows:
+            if section:
+                item.setdefault(section, {})[field] = decimal.Decimal(value)
+            else:
+                item[field] = decimal.Decimal(value)
+        # Empty maps have no rows.
+        for field in COUNTER_FIELDS:
+            item.setdefault(field, {})
+        return item
+
+    def get_user(self, user_id):
+        rows = self._connection().execute(
+            "SELECT section, field, value FROM user_data WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        return self._item(user_id, rows)
+
+    def iter_users(self, fields=None):
+        # Rows come out in primary key order, so each user's rows are
+        # together and one user is held in memory at a time.
+        cursor = self._connection().execute(
+            "SELECT user_id, section, field, value FROM user_data ORDER BY user_id, section, field")
+        user_id = None
+        rows = []
+        for row_user_id, section, field, value in cursor:
+            if row_user_id != user_id:
+                if rows:
+                    yield self._item(user_id, rows)
+                user_id = row_user_id
+                rows = []
+            if fields is None or (section or field) in fields:
+                rows.append((section, field, value))
+        if user_id is not None:
+            yield self._item(user_id, rows)
+
+    def update(self, user_id, values=None, deltas=None):
+        statements = []
+        for path, value in (values or {}).items():
+            if isinstance(value, dict):
+                statements.append(("DELETE FROM user_data WHERE user_id = ? AND section = ?",
+                                   (user_id, path[0])))
+                for field, number in value.items():
+                    statements.append((self._SET, (user_id, path[0], field, int(number))))
+                continue
+            section, field = self._split(path)
+            statements.append((self._SET, (user_id, section, field, int(value))))
+        for path, delta in (deltas or {}).items():
+            section, field = self._split(path)
+            statements.append((self._ADD, (user_id, section, field, int(delta))))
+        if statements:
+            self._write(statements)
+
+    def _write(self, statements):
+        if not self.group_commit:
+            with self._write_lock:
+                self._commit([statements])
+            return
+        done = threading.Event()
+        request = [statements, done, None]
+        self._pending.put(request)
+        done.wait()
+        if request[2] is not None:
+            raise request[2]
+
+    def _commit(self, batch):
+        """ Applies a batch of writes in one transaction. Each write gets its
+        own savepoint so a failing write does not take the others with it.
+        Returns the exception raised by each write, or None. """
+
+        connection = self._connection()
+        errors = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for statements in batch:
+                connection.execute("SAVEPOINT write")
+                try:
+                    for sql, params in statements:
+                        connection.execute(sql, params)
+                    connection.execute("RELEASE write")
+                    errors.append(None)
+                except sqlite3.Error as error:
+                    connection.execute("ROLLBACK TO write")
+                    connection.execute("RELEASE write")
+                    errors.append(error)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self.batches_committed += 1
+        self.writes_committed += len(batch)
+        return errors
+
+    def _write_loop(self):
+        while True:
+            request = self._pending.get()
+            if request is None:
+                return
+            # Whatever queued up while the previous batch was committing goes
+            # into this one. max_wait optionally lingers for stragglers.
+            batch = [request]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._pending.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        request = self._pending.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if request is None:
+                    self._pending.put(None)
+                    break
+                batch.append(request)
+            try:
+                errors = self._commit([request[0] for request in batch])
+            except Exception as error:
+                errors = [error] * len(batch)
+            for request, error in zip(batch, errors):
+                request[2] = error
+                request[1].set()
+
+    def close(self):
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join()
+            self._writer = None
+
+# --------------- Degraded mode --------------- #
+
+class ResilientUserStore(UserStore):
+    """ Wraps a store with a circuit breaker and a read-only fallback.
+
+    Users read recently are remembered in a bounded in-container cache. While
+    the wrapped store is failing, reads are answered from that cache (or with
+    new user defaults for users not seen yet), and writes are applied to the
+    cached copy and queued. Queued writes are replayed in order once the store
+    responds again, by one thread at a time. A request replays only while it
+    has time to spare before its deadline, so a long backlog is worked off a
+    slice at a time by the requests that follow the outage.
+
+    Values computed from the defaults of a user who was never read would
+    overwrite the user's real progress, so until such a user is read again
+    only the counter deltas of their updates are written. """
+
+    def __init__(self, store, breaker=None, cache_size=1024, max_queued_writes=10000):
+        self.store = store
+        self.name = store.name
+        self.breaker = breaker or CircuitBreaker('user_store')
+        self.cache_size = cache_size
+        self.max_queued_writes = max_queued_writes
+        self.fallback_reads = 0
+        self.dropped_writes = 0
+        self.dropped_values = 0
+        self._recent = collections.OrderedDict()
+        self._unread = set()
+        self._queued = collections.deque()
+        self._lock = threading.RLock()
+        self._replay_lock = threading.Lock()
+
+    def _remember(self, user_id, item):
+        item = copy.deepcopy(item)
+        with self._lock:
+            self._recent[user_id] = item
+            self._recent.move_to_end(user_id)
+            while len(self._recent) > self.cache_size:
+                self._recent.popitem(last=False)
+
+    def _queue(self, method_name, args):
+        with self._lock:
+            if len(self._queued) >= self.max_queued_writes:
+                self._queued.popleft()
+                self.dropped_writes += 1
+            self._queued.append((method_name, args))
+
+    def replay_queued_writes(self):
+        """ Applies queued writes in order until the store fails again, or the
+        current request has no more than deadline.RESPONSE_RESERVE_MS left.
+        Writes the store rejects outright are dropped rather than retried
+        forever. If another thread is already replaying, returns straight
+        away and leaves the queue to it. """
+
+        if not self._replay_lock.acquire(blocking=False):
+            return
+        request_deadline = deadline.current_deadline()
+        try:
+            while True:
+                if request_deadline is not None and \
+                        request_deadline.remaining_ms() <= deadline.RESPONSE_RESERVE_MS:
+                    return
+                with self._lock:
+                    if not self._queued:
+                        return
+                    write = self._queued[0]
+                method_name, args = write
+                try:
+                    self.breaker.call(getattr(self.store, method_name), *args)
+                except STORAGE_ERRORS as error:
+                    if is_transient(error):
+                        return
+                    structured_log.error("queued_write_dropped", method=method_name, error=str(error))
+                    with self._lock:
+                        self.dropped_writes += 1
+                # The write may have been dropped from a full queue meanwhile.
+                with self._lock:
+                    if self._queued and self._queued[0] is write:
+                        self._queued.popleft()
+        finally:
+            self._replay_lock.release()
+
+    def _write(self, method_name, *args):
+        if self._queued:
+            self.replay_queued_writes()
+        if not self._queued:
+            try:
+                return self.breaker.call(getattr(self.store, method_name), *args)
+            except STORAGE_ERRORS as error:
+                if not is_transient(error):
+                    raise
+        self._queue(method_name, args)
+
+    def create_user(self, user_id):
+        self._remember(user_id, new_user_item(user_id))
+        self._write('create_user', user_id)
+
+    def get_user(self, user_id):
+        if self._queued:
+            self.replay_queued_writes()
+        if not self._queued:
+            try:
+                item = self.breaker.call(self.store.get_user, user_id)
+            except STORAGE_ERRORS as error:
+                if not is_transient(error):
+                    raise
+            else:
+                with self._lock:
+                    self._unread.discard(user_id)
+                if item is not None:
+                    self._remember(user_id, item)
+                return item
+
+        self.fallback_reads += 1
+        with self._lock:
+            item = self._recent.get(user_id)
+            if item is not None:
+                return copy.deepcopy(item)
+            self._unread.add(user_id)
+        item = new_user_item(user_id)
+        self._remember(user_id, item)
+        return item
+
+    def update(self, user_id, values=None, deltas=None):
+        cached_values = values
+        with self._lock:
+            if values and user_id in self._unread:
+                self.dropped_values += 1
+                structured_log.warning("unread_user_values_dropped", fields=len(values))
+                values = None
+            # The cached copy takes every change, so the rest of the session
+            # stays consistent.
+            item = self._recent.get(user_id)
+            if item is not None:
+                for path, value in (cached_values or {}).items():
+                    _item_parent(item, path)[path[-1]] = _to_number(value)
+                for path, delta in (deltas or {}).items():
+                    parent = _item_parent(item, path)
+                    parent[path[-1]] = parent.get(path[-1], decimal.Decimal(0)) + delta
+        if values or deltas:
+            self._write('update', user_id, values, deltas)
+
+    def iter_users(self, fields=None):
+        return self.store.iter_users(fields)
+
+    def close(self):
+        self.store.close()
+
+def _to_number(value):
+    if isinstance(value, dict):
+        return {key: decimal.Decimal(number) for key, number in value.items()}
+    return decimal.Decimal(value)
+
+def _item_parent(item, path):
+    parent = item
+    for part in path[:-1]:
+        parent = parent.setdefault(part, {})
+    return parent
+
+# --------------- Store selection --------------- #
+
+_user_store = None
+_user_store_lock = threading.Lock()
+
+def create_user_store(backend=None, path=None):
+    """ Creates a store for the given backend name. Defaults come from the
+    TUTOR_USER_STORE and TUTOR_SQLITE_PATH environment variables. """
+
+    backend = backend or os.environ.get('TUTOR_USER_STORE', 'dynamodb')
+    if backend == 'dynamodb':
+        return DynamoDBUserStore()
+    elif backend == 'sqlite':
+        return SQLiteUserStore(path or os.environ.get('TUTOR_SQLITE_PATH', DEFAULT_SQLITE_PATH))
+    else:
+        raise ValueError("Unknown user store backend: " + backend)
+
+def get_user_store():
+    """ Returns the store shared by every request in this process. """
+
+    global _user_store
+    if _user_store is None:
+        with _user_store_lock:
+            if _user_store is None:
+                _user_store = ResilientUserStore(create_user_store())
+    return _user_store
+
+def set_user_store(store):
+    """ Replaces the shared store, e.g. with a local one for load tests. """
+
+    global _user_store
+    with _user_store_lock:
+        _user_store = store
+
+# --------------- Throughput measurement --------------- #
+
+def measure_throughput(store, threads=16, operations=200, users=100, seed=0):
+    """ Runs a quiz-like mix of reads, counter increments and multi-field
+    updates from several threads and returns operations per second along with
+    latency percentiles in milliseconds. """
+
+    user_ids = ['bench-user-' + str(index) for index in range(users)]
+    for user_id in user_ids:
+        store.create_user(user_id)
+
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def worker(worker_num):
+        rng = random.Random(seed + worker_num)
+        own_latencies = []
+        for _ in range(operations):
+            user_id = rng.choice(user_ids)
+            attribute = rng.choice(BENCHMARK_ATTRIBUTES)
+            kind = rng.random()
+            start = time.perf_counter()
+            if kind < 0.5:
+                store.get_user(user_id)
+            elif kind < 0.9:
+                counter = 'CounterCorrect' if rng.random() < 0.6 else 'CounterIncorrect'
+                store.increment(user_id, (counter, attribute))
+            else:
+                store.update(user_id, values={
+                    ('PreviousTotalCorrect',): rng.randint(0, 50),
+                    ('PreviousTotalIncorrect',): rng.randint(0, 50),
+                    ('QuestionLevel',): rng.randint(1, 4)
+                })
+            own_latencies.append(time.perf_counter() - start)
+        with latencies_lock:
+            latencies.extend(own_latencies)
+
+    workers = [threading.Thread(target=worker, args=(num,)) for num in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] * 1000
+
+    return {
+        'backend': store.name,
+        'operations': len(latencies),
+        'seconds': elapsed,
+        'ops_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure user store throughput.")
+    parser.add_argument('--backend', choices=['sqlite', 'dynamodb'], default='sqlite')
+    parser.add_argument('--path', default='llptutor_bench.db', help="SQLite database file")
+    parser.add_argument('--table', default=USER_TABLE_NAME, help="DynamoDB table name")
+    parser.add_argument('--no-group-commit', action='store_true')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=200, help="Operations per thread")
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.backend == 'sqlite':
+        store = SQLiteUserStore(args.path, group_commit=not args.no_group_commit)
+    else:
+        store = DynamoDBUserStore(args.table)
+    try:
+        result = measure_throughput(store, args.threads, args.operations, args.users)
+    finally:
+        store.close()
+    for key, value in result.items():
+        print(key + ": " + (("%.2f" % value) if isinstance(value, float) else str(value)))
+    if isinstance(store, SQLiteUserStore):
+        print("batches_committed: " + str(store.batches_committed))
+
+if __name__ == '__main__':
+    sys.exit(main())